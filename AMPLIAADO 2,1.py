@@ -1,253 +1,54 @@
 import csv
+import functools
 import os
-import sqlite3
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
-from collections import defaultdict
 import random
+import threading
+import time
 from datetime import datetime
 
-class DatabaseManager:
-    """Clase para manejar todas las operaciones de base de datos"""
-    
-    def __init__(self, db_name='materiales.db'):
-        self.db_name = db_name
-        self.init_database()
-    
-    def init_database(self):
-        """Inicializar la base de datos y crear tablas"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                
-                # Crear tabla de materiales
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS materiales (
-                        id TEXT PRIMARY KEY,
-                        material TEXT NOT NULL,
-                        tipo TEXT NOT NULL,
-                        cantidad REAL NOT NULL,
-                        valor REAL NOT NULL,
-                        ubicacion TEXT,
-                        estado TEXT DEFAULT 'Disponible',
-                        fecha TEXT NOT NULL
-                    )
-                ''')
-                
-                conn.commit()
-        except Exception as e:
-            print(f"Error al inicializar la base de datos: {e}")
-    
-    def insert_material(self, material_data):
-        """Insertar un nuevo material"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    material_data['ID'],
-                    material_data['Material'],
-                    material_data['Tipo'],
-                    material_data['Cantidad'],
-                    material_data['Valor'],
-                    material_data['Ubicacion'],
-                    material_data['Estado'],
-                    material_data['Fecha']
-                ))
-                conn.commit()
-                return True
-        except Exception as e:
-            print(f"Error al insertar material: {e}")
-            return False
-    
-    def get_all_materials(self):
-        """Obtener todos los materiales"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM materiales ORDER BY fecha DESC')
-                rows = cursor.fetchall()
-                
-                materials = []
-                for row in rows:
-                    materials.append({
-                        'ID': row[0],
-                        'Material': row[1],
-                        'Tipo': row[2],
-                        'Cantidad': row[3],
-                        'Valor': row[4],
-                        'Ubicacion': row[5],
-                        'Estado': row[6],
-                        'Fecha': row[7]
-                    })
-                return materials
-        except Exception as e:
-            print(f"Error al obtener materiales: {e}")
-            return []
-    
-    def search_materials(self, search_text='', tipo_filter='Todos', estado_filter='Todos'):
-        """Buscar materiales con filtros"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                
-                query = "SELECT * FROM materiales WHERE 1=1"
-                params = []
-                
-                if search_text:
-                    query += " AND LOWER(material) LIKE LOWER(?)"
-                    params.append(f"%{search_text}%")
-                
-                if tipo_filter != 'Todos':
-                    query += " AND tipo = ?"
-                    params.append(tipo_filter)
-                
-                if estado_filter != 'Todos':
-                    query += " AND estado = ?"
-                    params.append(estado_filter)
-                
-                query += " ORDER BY fecha DESC"
-                
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
-                
-                materials = []
-                for row in rows:
-                    materials.append({
-                        'ID': row[0],
-                        'Material': row[1],
-                        'Tipo': row[2],
-                        'Cantidad': row[3],
-                        'Valor': row[4],
-                        'Ubicacion': row[5],
-                        'Estado': row[6],
-                        'Fecha': row[7]
-                    })
-                return materials
-        except Exception as e:
-            print(f"Error al buscar materiales: {e}")
-            return []
-    
-    def update_material(self, material_id, material_data):
-        """Actualizar un material existente"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE materiales 
-                    SET material=?, tipo=?, cantidad=?, valor=?, ubicacion=?, estado=?, fecha=?
-                    WHERE id=?
-                ''', (
-                    material_data['Material'],
-                    material_data['Tipo'],
-                    material_data['Cantidad'],
-                    material_data['Valor'],
-                    material_data['Ubicacion'],
-                    material_data['Estado'],
-                    material_data['Fecha'],
-                    material_id
-                ))
-                conn.commit()
-                return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Error al actualizar material: {e}")
-            return False
-    
-    def delete_material(self, material_id):
-        """Eliminar un material"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM materiales WHERE id=?', (material_id,))
-                conn.commit()
-                return cursor.rowcount > 0
-        except Exception as e:
-            print(f"Error al eliminar material: {e}")
-            return False
-    
-    def get_statistics(self):
-        """Obtener estadísticas de los materiales"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                
-                # Estadísticas generales
-                cursor.execute('SELECT COUNT(*), SUM(cantidad), SUM(valor), AVG(valor) FROM materiales')
-                general_stats = cursor.fetchone()
-                
-                # Estadísticas por tipo
-                cursor.execute('''
-                    SELECT tipo, COUNT(*), SUM(cantidad), SUM(valor), AVG(valor)
-                    FROM materiales 
-                    GROUP BY tipo
-                ''')
-                tipo_stats = cursor.fetchall()
-                
-                # Estadísticas por ubicación
-                cursor.execute('''
-                    SELECT ubicacion, COUNT(*)
-                    FROM materiales 
-                    GROUP BY ubicacion
-                ''')
-                ubicacion_stats = cursor.fetchall()
-                
-                return {
-                    'general': general_stats,
-                    'por_tipo': tipo_stats,
-                    'por_ubicacion': ubicacion_stats
-                }
-        except Exception as e:
-            print(f"Error al obtener estadísticas: {e}")
+import numpy as np
+
+from tendencias import TrendEngine, media_movil, tasa_crecimiento
+from pronosticos import ForecastEngine
+from base_datos import DatabaseManager, CRITERIOS_TOP, UMBRAL_IMPORTACION_PARALELA
+from migracion import MigradorCSV
+
+# Parámetros de la vista Top
+LIMITE_TOP = 20
+PUNTO_REORDEN = 10
+
+# Cada cuánto se revisa el contador de alertas (solo lee la tabla de alertas)
+INTERVALO_ALERTAS_MS = 60 * 1000
+
+# Filas que se piden a la base de datos cada vez que una tabla llega al final
+TAMANO_PAGINA_TABLA = 200
+
+# Orden inicial de las tablas: más recientes primero
+ORDEN_INICIAL = ('Fecha', True)
+
+# Las listas largas se insertan en tandas de este tamaño, con una pausa para que Tk redibuje
+TAMANO_LOTE_TABLA = 500
+PAUSA_LOTE_MS = 1
+
+# Cada cuánto se revisa el avance de la preparación de datos del arranque
+INTERVALO_ARRANQUE_MS = 50
+
+# Base de datos de la aplicación
+ARCHIVO_BASE_DATOS = 'materiales.db'
+
+
+def requiere_base_datos(metodo):
+    """Acción de la interfaz que no hace nada (salvo avisar) mientras la base de datos se abre al arrancar"""
+    @functools.wraps(metodo)
+    def accion(self, *args, **kwargs):
+        if self.db_manager is None:
+            self.label_estado.config(text="La base de datos aún se está abriendo, espere un momento...")
             return None
-    
-    def export_to_csv(self, filename):
-        """Exportar datos a CSV"""
-        try:
-            materials = self.get_all_materials()
-            with open(filename, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha'])
-                for material in materials:
-                    writer.writerow([
-                        material['ID'],
-                        material['Material'],
-                        material['Tipo'],
-                        material['Cantidad'],
-                        material['Valor'],
-                        material['Ubicacion'],
-                        material['Estado'],
-                        material['Fecha']
-                    ])
-            return True
-        except Exception as e:
-            print(f"Error al exportar: {e}")
-            return False
-    
-    def import_from_csv(self, filename):
-        """Importar datos desde CSV"""
-        try:
-            imported_count = 0
-            with open(filename, 'r', newline='', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    material_data = {
-                        'ID': row.get('ID', ''),
-                        'Material': row['Material'],
-                        'Tipo': row['Tipo'],
-                        'Cantidad': float(row['Cantidad']),
-                        'Valor': float(row['Valor']),
-                        'Ubicacion': row.get('Ubicacion', 'No especificada'),
-                        'Estado': row.get('Estado', 'Disponible'),
-                        'Fecha': row.get('Fecha', datetime.now().strftime('%d/%m/%Y'))
-                    }
-                    if self.insert_material(material_data):
-                        imported_count += 1
-            return imported_count
-        except Exception as e:
-            print(f"Error al importar: {e}")
-            return 0
+        return metodo(self, *args, **kwargs)
+    return accion
 
 class GestorMaterialesConGraficos:
     def __init__(self, root):
@@ -256,22 +57,99 @@ class GestorMaterialesConGraficos:
         self.root.geometry("1200x800")
         self.root.configure(bg='#f5f5f5')
         
-        # Inicializar base de datos
-        self.db_manager = DatabaseManager('materiales.db')
+        # Base de datos, rollups diarios para el análisis de tendencias (mantenidos por
+        # triggers) y pronósticos en segundo plano: abrirlos puede crear índices y
+        # rellenar tablas, así que se hace en preparar_datos (None hasta entonces)
+        self.db_manager = None
+        self.tendencias = None
+        self.pronosticos = None
+        self.pronostico_pendiente = None
         
-        # Archivo CSV para migración (mantener compatibilidad)
+        # Archivos CSV para migración (mantener compatibilidad)
         self.archivo = 'registros_materiales.csv'
+        self.archivo_legado = 'registros.csv'
+        
+        # Snapshot columnar para análisis (se construye bajo demanda), la versión de
+        # los datos que refleja (None si ya no se sabe) y la del archivo guardado
+        self.snapshot = None
+        self.version_snapshot = None
+        self.version_guardada = None
+        self.archivo_snapshot = os.path.splitext(ARCHIVO_BASE_DATOS)[0] + '.snap'
         
-        # Crear interfaz principal
+        # Orden (columna, descendente) y cursor de la siguiente página de cada tabla
+        self.orden_tablas = {}
+        self.paginas = {}
+        
+        # Carga por tandas en curso (identificador de root.after) y barra de progreso de cada tabla
+        self.cargas = {}
+        self.progresos = {}
+        
+        # Crear interfaz principal: la ventana se muestra sin esperar a los datos
         self.crear_interfaz_principal()
         
-        # Migrar datos existentes y cargar datos iniciales
-        self.migrar_datos_csv()
-        self.cargar_datos_iniciales()
+        # Migración, datos de ejemplo y snapshot en segundo plano; la barra de estado
+        # muestra el avance y las tablas se cargan al terminar (revisar_arranque)
+        self.inicio_arranque = time.perf_counter()
+        self.datos_cargados = False
+        self.mensajes_arranque = queue.Queue()
+        threading.Thread(target=self.preparar_datos, daemon=True).start()
+        self.root.after(INTERVALO_ARRANQUE_MS, self.revisar_arranque)
         
-        # Cargar datos en la interfaz y mostrar estadísticas
-        self.cargar_datos_en_treeviews()
-        self.mostrar_estadisticas_basicas()
+        # Las alertas de estado dependen del tiempo: revisar el contador periódicamente
+        self.root.after(INTERVALO_ALERTAS_MS, self.revisar_alertas)
+    
+    def preparar_datos(self):
+        """Trabajo del arranque que no toca la interfaz (se ejecuta en un hilo)
+        
+        Los avances se envían a revisar_arranque por una cola; None indica
+        que los datos están listos para mostrarse.
+        """
+        try:
+            self.mensajes_arranque.put("Abriendo base de datos...")
+            db_manager = DatabaseManager(ARCHIVO_BASE_DATOS)
+            self.tendencias = TrendEngine(db_manager.db_name)
+            self.pronosticos = ForecastEngine(self.tendencias)
+            # Las acciones de la interfaz esperan a db_manager, que se publica el último
+            self.db_manager = db_manager
+            self.mensajes_arranque.put("Migrando archivos CSV heredados...")
+            self.migrar_datos_csv()
+            self.mensajes_arranque.put("Preparando datos de ejemplo...")
+            self.cargar_datos_iniciales()
+            # Arranque en frío: abrir el snapshot guardado si sigue vigente
+            self.mensajes_arranque.put("Abriendo snapshot de análisis...")
+            self.snapshot = self.db_manager.load_snapshot(self.archivo_snapshot)
+            if self.snapshot is not None:
+                self.version_snapshot = self.version_guardada = self.snapshot.origen
+        except Exception as e:
+            print(f"Error al preparar los datos: {e}")
+        finally:
+            self.mensajes_arranque.put(None)
+        
+        # Índice de nombres para autocompletar: no hace falta para mostrar los datos
+        try:
+            if self.db_manager is not None:
+                self.db_manager.names.refresh()
+        except Exception as e:
+            print(f"Error al construir el índice de nombres: {e}")
+    
+    def revisar_arranque(self):
+        """Mostrar el avance del arranque y cargar las tablas cuando los datos estén listos"""
+        while True:
+            try:
+                mensaje = self.mensajes_arranque.get_nowait()
+            except queue.Empty:
+                break
+            if mensaje is None:
+                if self.db_manager is None:
+                    self.label_estado.config(text="No se pudo abrir la base de datos")
+                    return
+                self.cargar_datos_en_treeviews()
+                self.mostrar_estadisticas_basicas()
+                self.datos_cargados = True
+                self.label_estado.config(text=f"Listo (datos cargados en {time.perf_counter() - self.inicio_arranque:.1f} s)")
+                return
+            self.label_estado.config(text=mensaje)
+        self.root.after(INTERVALO_ARRANQUE_MS, self.revisar_arranque)
     
     def aplicar_color_texto(self, texto, color_code):
         """Aplicar color ANSI al texto para la consola"""
@@ -310,18 +188,18 @@ class GestorMaterialesConGraficos:
             self.text_grafico.tag_configure("gris", foreground="#708090")
     
     def migrar_datos_csv(self):
-        """Migrar datos existentes de CSV a base de datos"""
+        """Migrar datos existentes de los CSV heredados a la base de datos"""
         try:
-            # Verificar si existe el archivo CSV
-            if os.path.exists(self.archivo):
-                # Verificar si ya hay datos en la base de datos
-                materiales_bd = self.db_manager.get_all_materials()
-                if not materiales_bd:
-                    # Migrar datos del CSV a la base de datos
-                    registros_csv = self.leer_registros_csv()
-                    for registro in registros_csv:
-                        self.db_manager.insert_material(registro)
-                    print(f"Migrados {len(registros_csv)} registros de CSV a base de datos")
+            migrador = MigradorCSV(self.db_manager)
+            
+            # Migrar si la base está vacía o si quedó una migración a medias
+            base_vacia = not self.db_manager.has_materials()
+            for archivo in (self.archivo, self.archivo_legado):
+                if os.path.exists(archivo) and (base_vacia or migrador.pendiente(archivo)):
+                    resultado = migrador.migrar(archivo)
+                    self.actualizar_snapshot()
+                    print(f"Migrados {resultado['insertadas']} registros de {archivo} a base de datos "
+                          f"({resultado['rechazadas']} rechazados)")
         except Exception as e:
             print(f"Error en migración: {e}")
     
@@ -384,9 +262,14 @@ class GestorMaterialesConGraficos:
         self.crear_pestana_graficos()
         self.crear_pestana_estadisticas()
         self.crear_pestana_inventario()
+        self.crear_pestana_alertas()
         
         # Botones de control
         self.crear_botones_control()
+        
+        # Barra de estado (avance del arranque)
+        self.label_estado = ttk.Label(self.main_frame, text="Iniciando...", anchor=tk.W, relief=tk.SUNKEN)
+        self.label_estado.grid(row=3, column=0, sticky=(tk.W, tk.E))
     
     def crear_pestana_registro(self):
         """Crear pestaña de registro de materiales"""
@@ -404,8 +287,10 @@ class GestorMaterialesConGraficos:
         self.entry_id.insert(0, self.generar_id())
         
         ttk.Label(frame_formulario, text="Nombre del Material:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.entry_nombre = ttk.Entry(frame_formulario, width=25)
+        # Combobox para sugerir nombres ya registrados mientras se escribe
+        self.entry_nombre = ttk.Combobox(frame_formulario, width=23)
         self.entry_nombre.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=5, padx=(5, 0))
+        self.entry_nombre.bind('<KeyRelease>', self.autocompletar_nombre)
         
         ttk.Label(frame_formulario, text="Tipo:").grid(row=2, column=0, sticky=tk.W, pady=5)
         self.combo_tipo = ttk.Combobox(frame_formulario, values=[
@@ -454,17 +339,23 @@ class GestorMaterialesConGraficos:
         self.tree_materiales = ttk.Treeview(frame_lista, columns=columns, show='headings', height=15)
         
         for col in columns:
-            self.tree_materiales.heading(col, text=col)
+            self.tree_materiales.heading(col, text=col, command=lambda c=col: self.ordenar_tabla(self.tree_materiales, c))
             self.tree_materiales.column(col, width=100)
         
         # Scrollbars
         v_scrollbar = ttk.Scrollbar(frame_lista, orient=tk.VERTICAL, command=self.tree_materiales.yview)
         h_scrollbar = ttk.Scrollbar(frame_lista, orient=tk.HORIZONTAL, command=self.tree_materiales.xview)
-        self.tree_materiales.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.tree_materiales.configure(yscrollcommand=self.desplazamiento(self.tree_materiales, v_scrollbar),
+                                       xscrollcommand=h_scrollbar.set)
         
         self.tree_materiales.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        # Progreso de las cargas largas (oculto mientras no hay ninguna)
+        self.progresos[self.tree_materiales] = ttk.Progressbar(frame_lista, mode='determinate')
+        self.progresos[self.tree_materiales].grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.progresos[self.tree_materiales].grid_remove()
     
     def crear_pestana_graficos(self):
         """Crear pestaña de gráficos"""
@@ -542,9 +433,20 @@ class GestorMaterialesConGraficos:
                                      command=self.predicciones)
         btn_predicciones.grid(row=2, column=0, pady=5, sticky=(tk.W, tk.E))
         
+        # Vista Top con criterio seleccionable
+        frame_top = ttk.Frame(frame_avanzadas)
+        frame_top.grid(row=3, column=0, pady=5, sticky=(tk.W, tk.E))
+        
+        btn_top = ttk.Button(frame_top, text="🏆 Top", command=self.mostrar_top)
+        btn_top.grid(row=0, column=0, padx=(0, 5))
+        
+        self.combo_criterio_top = ttk.Combobox(frame_top, values=list(CRITERIOS_TOP), width=15, state='readonly')
+        self.combo_criterio_top.grid(row=0, column=1)
+        self.combo_criterio_top.set('valor_total')
+        
         # Área de resultados avanzados
         self.text_avanzado = scrolledtext.ScrolledText(frame_avanzadas, height=15, width=50)
-        self.text_avanzado.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
+        self.text_avanzado.grid(row=4, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
     
     def crear_pestana_inventario(self):
         """Crear pestaña de gestión de inventario"""
@@ -556,8 +458,9 @@ class GestorMaterialesConGraficos:
         frame_filtros.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=10, pady=10)
         
         ttk.Label(frame_filtros, text="Buscar:").grid(row=0, column=0, padx=5)
-        self.entry_buscar = ttk.Entry(frame_filtros, width=30)
+        self.entry_buscar = ttk.Combobox(frame_filtros, width=28)
         self.entry_buscar.grid(row=0, column=1, padx=5)
+        self.entry_buscar.bind('<KeyRelease>', self.autocompletar_nombre)
         
         ttk.Label(frame_filtros, text="Tipo:").grid(row=0, column=2, padx=5)
         self.combo_filtro_tipo = ttk.Combobox(frame_filtros, values=['Todos', 'Solido', 'Peligroso', 'Organico', 'Liquido', 'Metalico', 'Papel', 'Vidrio', 'Electronico', 'Textil', 'Quimico'])
@@ -583,17 +486,87 @@ class GestorMaterialesConGraficos:
         self.tree_inventario = ttk.Treeview(frame_lista_inv, columns=columns_inv, show='headings', height=15)
         
         for col in columns_inv:
-            self.tree_inventario.heading(col, text=col)
+            self.tree_inventario.heading(col, text=col, command=lambda c=col: self.ordenar_tabla(self.tree_inventario, c))
             self.tree_inventario.column(col, width=100)
         
         # Scrollbars para inventario
         v_scrollbar_inv = ttk.Scrollbar(frame_lista_inv, orient=tk.VERTICAL, command=self.tree_inventario.yview)
         h_scrollbar_inv = ttk.Scrollbar(frame_lista_inv, orient=tk.HORIZONTAL, command=self.tree_inventario.xview)
-        self.tree_inventario.configure(yscrollcommand=v_scrollbar_inv.set, xscrollcommand=h_scrollbar_inv.set)
+        self.tree_inventario.configure(yscrollcommand=self.desplazamiento(self.tree_inventario, v_scrollbar_inv),
+                                       xscrollcommand=h_scrollbar_inv.set)
         
         self.tree_inventario.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         v_scrollbar_inv.grid(row=0, column=1, sticky=(tk.N, tk.S))
         h_scrollbar_inv.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        self.progresos[self.tree_inventario] = ttk.Progressbar(frame_lista_inv, mode='determinate')
+        self.progresos[self.tree_inventario].grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.progresos[self.tree_inventario].grid_remove()
+        
+        # Acciones masivas sobre las filas seleccionadas (o las filtradas si no hay selección)
+        frame_masivo = ttk.LabelFrame(frame_inventario, text="Acciones masivas (selección o filtro)", padding="10")
+        frame_masivo.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=10, pady=5)
+        
+        ttk.Label(frame_masivo, text="Nuevo estado:").grid(row=0, column=0, padx=5)
+        self.combo_estado_masivo = ttk.Combobox(frame_masivo, values=['Disponible', 'En Uso', 'Agotado', 'Dañado', 'En Reparación'])
+        self.combo_estado_masivo.grid(row=0, column=1, padx=5)
+        self.combo_estado_masivo.set('En Uso')
+        
+        btn_estado_masivo = ttk.Button(frame_masivo, text="✏️ Cambiar estado", command=self.cambiar_estado_masivo)
+        btn_estado_masivo.grid(row=0, column=2, padx=5)
+        
+        btn_eliminar_masivo = ttk.Button(frame_masivo, text="🗑️ Eliminar", command=self.eliminar_masivo)
+        btn_eliminar_masivo.grid(row=0, column=3, padx=5)
+    
+    def crear_pestana_alertas(self):
+        """Crear pestaña de alertas de stock bajo y estados prolongados"""
+        self.frame_alertas = ttk.Frame(self.notebook)
+        self.notebook.add(self.frame_alertas, text="🔔 Alertas")
+        self.frame_alertas.columnconfigure(0, weight=1)
+        self.frame_alertas.rowconfigure(0, weight=1)
+        
+        # Lista de alertas abiertas
+        frame_lista_alertas = ttk.LabelFrame(self.frame_alertas, text="Alertas abiertas", padding="10")
+        frame_lista_alertas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=10, pady=10)
+        frame_lista_alertas.columnconfigure(0, weight=1)
+        frame_lista_alertas.rowconfigure(0, weight=1)
+        
+        columns_alertas = ('ID', 'Material', 'Tipo', 'Ubicación', 'Alerta', 'Desde')
+        self.tree_alertas = ttk.Treeview(frame_lista_alertas, columns=columns_alertas, show='headings', height=15)
+        for col in columns_alertas:
+            self.tree_alertas.heading(col, text=col)
+            self.tree_alertas.column(col, width=260 if col == 'Alerta' else 120)
+        
+        v_scrollbar_alertas = ttk.Scrollbar(frame_lista_alertas, orient=tk.VERTICAL, command=self.tree_alertas.yview)
+        self.tree_alertas.configure(yscrollcommand=v_scrollbar_alertas.set)
+        self.tree_alertas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        v_scrollbar_alertas.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        
+        # Reglas: punto de reorden por tipo y antigüedad máxima por estado
+        frame_reglas = ttk.LabelFrame(self.frame_alertas, text="Reglas", padding="10")
+        frame_reglas.grid(row=1, column=0, sticky=(tk.W, tk.E), padx=10, pady=5)
+        
+        ttk.Label(frame_reglas, text="Tipo:").grid(row=0, column=0, padx=5)
+        self.combo_regla_tipo = ttk.Combobox(frame_reglas, values=['Todos', 'Solido', 'Peligroso', 'Organico', 'Liquido', 'Metalico', 'Papel', 'Vidrio', 'Electronico', 'Textil', 'Quimico'])
+        self.combo_regla_tipo.grid(row=0, column=1, padx=5)
+        self.combo_regla_tipo.set('Todos')
+        ttk.Label(frame_reglas, text="Punto de reorden:").grid(row=0, column=2, padx=5)
+        self.entry_regla_punto = ttk.Entry(frame_reglas, width=10)
+        self.entry_regla_punto.grid(row=0, column=3, padx=5)
+        btn_regla_punto = ttk.Button(frame_reglas, text="💾 Guardar", command=self.guardar_regla_reorden)
+        btn_regla_punto.grid(row=0, column=4, padx=5)
+        
+        ttk.Label(frame_reglas, text="Estado:").grid(row=1, column=0, padx=5, pady=(5, 0))
+        self.combo_regla_estado = ttk.Combobox(frame_reglas, values=['Disponible', 'En Uso', 'Agotado', 'Dañado', 'En Reparación'])
+        self.combo_regla_estado.grid(row=1, column=1, padx=5, pady=(5, 0))
+        self.combo_regla_estado.set('Dañado')
+        ttk.Label(frame_reglas, text="Días en el estado:").grid(row=1, column=2, padx=5, pady=(5, 0))
+        self.entry_regla_dias = ttk.Entry(frame_reglas, width=10)
+        self.entry_regla_dias.grid(row=1, column=3, padx=5, pady=(5, 0))
+        btn_regla_estado = ttk.Button(frame_reglas, text="💾 Guardar", command=self.guardar_regla_estado)
+        btn_regla_estado.grid(row=1, column=4, padx=5, pady=(5, 0))
+        
+        ttk.Label(frame_reglas, text="(vacío = quitar la regla)").grid(row=0, column=5, rowspan=2, padx=10)
     
     def crear_botones_control(self):
         """Crear botones de control"""
@@ -609,8 +582,15 @@ class GestorMaterialesConGraficos:
         btn_importar = ttk.Button(frame_control, text="📥 Importar", command=self.importar_datos)
         btn_importar.grid(row=0, column=2, padx=5)
         
+        btn_cambios = ttk.Button(frame_control, text="🔁 Exportar cambios", command=self.exportar_cambios)
+        btn_cambios.grid(row=0, column=3, padx=5)
+        
+        # Contador de alertas abiertas; abre la pestaña de alertas
+        self.btn_alertas = ttk.Button(frame_control, text="🔔 Alertas (0)", command=self.mostrar_alertas)
+        self.btn_alertas.grid(row=0, column=4, padx=5)
+        
         btn_salir = ttk.Button(frame_control, text="❌ Salir", command=self.root.quit)
-        btn_salir.grid(row=0, column=3, padx=5)
+        btn_salir.grid(row=0, column=5, padx=5)
     
     def generar_id(self):
         """Generar ID único para material"""
@@ -619,9 +599,8 @@ class GestorMaterialesConGraficos:
         return f"MAT-{timestamp}-{random_num}"
     
     def cargar_datos_iniciales(self):
-        """Cargar datos de ejemplo extensos"""
-        registros = self.db_manager.get_all_materials()
-        if not registros:
+        """Cargar datos de ejemplo extensos si la base de datos está vacía"""
+        if not self.db_manager.has_materials():
             # Datos de ejemplo más extensos y variados
             datos_ejemplo = [
                 # Materiales Sólidos
@@ -696,25 +675,61 @@ class GestorMaterialesConGraficos:
                 ('Disolventes', 'Quimico', 8, 45, 'Almacén Químicos', 'Disponible')
             ]
             
+            # Todos en una transacción; generar_id puede repetirse dentro del mismo segundo
+            fecha = datetime.now().strftime('%d/%m/%Y')
+            ids = set()
+            nuevos = []
             for nombre, tipo, cantidad, valor, ubicacion, estado in datos_ejemplo:
-                self.registrar_material_silencioso(nombre, tipo, cantidad, valor, ubicacion, estado)
-        
-        self.cargar_datos_en_treeviews()
+                id_material = self.generar_id()
+                while id_material in ids:
+                    id_material = self.generar_id()
+                ids.add(id_material)
+                nuevos.append({
+                    'ID': id_material,
+                    'Material': nombre,
+                    'Tipo': tipo,
+                    'Cantidad': cantidad,
+                    'Valor': valor,
+                    'Ubicacion': ubicacion,
+                    'Estado': estado,
+                    'Fecha': fecha
+                })
+            if self.db_manager.insert_materials(nuevos):
+                self.actualizar_snapshot()
     
-    def registrar_material_silencioso(self, nombre, tipo, cantidad, valor, ubicacion, estado):
-        """Registrar material sin mostrar mensajes"""
-        nuevo_registro = {
-            'ID': self.generar_id(),
-            'Material': nombre,
-            'Tipo': tipo,
-            'Cantidad': cantidad,
-            'Valor': valor,
-            'Ubicacion': ubicacion,
-            'Estado': estado,
-            'Fecha': datetime.now().strftime('%d/%m/%Y')
-        }
-        
-        return self.db_manager.insert_material(nuevo_registro)
+    def obtener_snapshot(self):
+        """Obtener el snapshot columnar, construyéndolo si hace falta"""
+        if self.snapshot is None:
+            self.snapshot = self.db_manager.build_snapshot()
+            self.version_snapshot = self.snapshot.origen
+        return self.snapshot
+    
+    def guardar_snapshot(self):
+        """Guardar el snapshot en disco para el próximo arranque
+        
+        El de memoria solo se guarda si refleja la versión actual de los
+        datos; si otro proceso (el servicio HTTP, la línea de comandos)
+        escribió después, se exporta de nuevo desde la base de datos.
+        """
+        version = self.db_manager.get_data_version()
+        if version == self.version_guardada:
+            return
+        if self.snapshot is not None and self.version_snapshot == version:
+            try:
+                self.snapshot.save(self.archivo_snapshot, version)
+            except Exception as e:
+                print(f"Error al guardar snapshot: {e}")
+        else:
+            self.db_manager.export_snapshot(self.archivo_snapshot)
+    
+    def actualizar_snapshot(self, registros=None, eliminados=()):
+        """Aplicar cambios al snapshot o invalidarlo si no se indican filas"""
+        if registros is None:
+            self.snapshot = None
+        elif self.snapshot is not None:
+            self.snapshot.apply_changes(registros, eliminados)
+            # Incluye los cambios propios, pero no se sabe si hubo otros entre medias
+            self.version_snapshot = None
     
     def leer_registros(self):
         """Leer todos los registros de la base de datos"""
@@ -731,11 +746,13 @@ class GestorMaterialesConGraficos:
             # Insertar nuevos registros
             for registro in registros:
                 self.db_manager.insert_material(registro)
+            self.actualizar_snapshot()
             return True
         except Exception as e:
             messagebox.showerror("Error", f"Error al escribir registros: {e}")
             return False
     
+    @requiere_base_datos
     def registrar_material(self):
         """Registrar un nuevo material"""
         # Obtener datos del formulario
@@ -763,11 +780,9 @@ class GestorMaterialesConGraficos:
             return
         
         # Verificar duplicados
-        registros_existentes = self.db_manager.get_all_materials()
-        for registro in registros_existentes:
-            if registro['ID'] == id_material:
-                messagebox.showwarning("Advertencia", f"El ID {id_material} ya existe")
-                return
+        if self.db_manager.get_material(id_material) is not None:
+            messagebox.showwarning("Advertencia", f"El ID {id_material} ya existe")
+            return
         
         # Crear nuevo registro
         nuevo_registro = {
@@ -782,6 +797,7 @@ class GestorMaterialesConGraficos:
         }
         
         if self.db_manager.insert_material(nuevo_registro):
+            self.actualizar_snapshot([nuevo_registro])
             messagebox.showinfo("Éxito", f'Material "{nombre}" registrado correctamente')
             self.limpiar_formulario()
             self.cargar_datos_en_treeviews()
@@ -832,22 +848,18 @@ class GestorMaterialesConGraficos:
                 registro['Fecha']
             ))
     
+    @requiere_base_datos
     def mostrar_grafico_barras(self):
         """Mostrar gráfico de barras ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.delete(1.0, tk.END)
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
             # Agrupar por tipo
-            estadisticas = defaultdict(lambda: {'cantidad': 0, 'valor': 0, 'materiales': 0})
-            for registro in registros:
-                tipo = registro['Tipo']
-                estadisticas[tipo]['cantidad'] += registro['Cantidad']
-                estadisticas[tipo]['valor'] += registro['Valor']
-                estadisticas[tipo]['materiales'] += 1
+            estadisticas = snapshot.group_by('tipo')
             
             # Crear gráfico ASCII con colores
             self.text_grafico.delete(1.0, tk.END)
@@ -884,21 +896,18 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def mostrar_grafico_circular(self):
         """Mostrar gráfico circular ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.delete(1.0, tk.END)
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
             # Agrupar por tipo
-            estadisticas = defaultdict(lambda: {'cantidad': 0, 'valor': 0})
-            for registro in registros:
-                tipo = registro['Tipo']
-                estadisticas[tipo]['cantidad'] += registro['Cantidad']
-                estadisticas[tipo]['valor'] += registro['Valor']
+            estadisticas = snapshot.group_by('tipo')
             
             total_cantidad = sum(stats['cantidad'] for stats in estadisticas.values())
             total_valor = sum(stats['valor'] for stats in estadisticas.values())
@@ -934,21 +943,18 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def mostrar_grafico_lineas(self):
         """Mostrar gráfico de líneas ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.delete(1.0, tk.END)
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
             # Agrupar por tipo
-            estadisticas = defaultdict(lambda: {'cantidad': 0, 'valor': 0})
-            for registro in registros:
-                tipo = registro['Tipo']
-                estadisticas[tipo]['cantidad'] += registro['Cantidad']
-                estadisticas[tipo]['valor'] += registro['Valor']
+            estadisticas = snapshot.group_by('tipo')
             
             # Crear gráfico ASCII con colores
             self.text_grafico.delete(1.0, tk.END)
@@ -991,19 +997,16 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def mostrar_grafico_histograma(self):
         """Mostrar histograma ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.delete(1.0, tk.END)
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
-            # Extraer valores
-            valores = [registro['Valor'] for registro in registros]
-            cantidades = [registro['Cantidad'] for registro in registros]
-            
             # Crear histograma ASCII con colores
             self.text_grafico.delete(1.0, tk.END)
             self.text_grafico.insert(tk.END, "="*80 + "\n")
@@ -1015,17 +1018,8 @@ class GestorMaterialesConGraficos:
             self.text_grafico.insert(tk.END, "-"*60 + "\n")
             
             # Crear rangos
-            min_valor = min(valores)
-            max_valor = max(valores)
-            rango = max_valor - min_valor
             num_bins = 10
-            
-            bins = []
-            for i in range(num_bins):
-                inicio = min_valor + (rango * i / num_bins)
-                fin = min_valor + (rango * (i + 1) / num_bins)
-                count = sum(1 for v in valores if inicio <= v < fin)
-                bins.append((inicio, fin, count))
+            bins = snapshot.histogram('valor', num_bins)
             
             max_count = max(count for _, _, count in bins) if bins else 1
             
@@ -1040,16 +1034,7 @@ class GestorMaterialesConGraficos:
             self.text_grafico.insert(tk.END, "-"*60 + "\n")
             
             # Histograma de cantidades
-            min_cantidad = min(cantidades)
-            max_cantidad = max(cantidades)
-            rango_cantidad = max_cantidad - min_cantidad
-            
-            bins_cantidad = []
-            for i in range(num_bins):
-                inicio = min_cantidad + (rango_cantidad * i / num_bins)
-                fin = min_cantidad + (rango_cantidad * (i + 1) / num_bins)
-                count = sum(1 for c in cantidades if inicio <= c < fin)
-                bins_cantidad.append((inicio, fin, count))
+            bins_cantidad = snapshot.histogram('cantidad', num_bins)
             
             max_count_cantidad = max(count for _, _, count in bins_cantidad) if bins_cantidad else 1
             
@@ -1064,11 +1049,12 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def mostrar_grafico_dispersion(self):
         """Mostrar gráfico de dispersión ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
@@ -1079,20 +1065,21 @@ class GestorMaterialesConGraficos:
             self.text_grafico.insert(tk.END, "="*80 + "\n\n")
             
             # Crear matriz de dispersión
-            cantidades = [registro['Cantidad'] for registro in registros]
-            valores = [registro['Valor'] for registro in registros]
+            cantidades = snapshot.columna('cantidad')
+            valores = snapshot.columna('valor')
             
-            max_cantidad = max(cantidades) if cantidades else 1
-            max_valor = max(valores) if valores else 1
+            max_cantidad = cantidades.max() or 1
+            max_valor = valores.max() or 1
             
-            # Crear matriz 20x20
+            # Crear matriz 20x20 marcando solo las celdas ocupadas
             matriz = [[' ' for _ in range(20)] for _ in range(20)]
             
-            for cantidad, valor in zip(cantidades, valores):
-                x = int((cantidad / max_cantidad) * 19)
-                y = int((valor / max_valor) * 19)
-                if 0 <= x < 20 and 0 <= y < 20:
-                    matriz[19-y][x] = '●'
+            xs = (cantidades / max_cantidad * 19).astype(int)
+            ys = (valores / max_valor * 19).astype(int)
+            dentro = (xs >= 0) & (xs < 20) & (ys >= 0) & (ys < 20)
+            for celda in np.unique(xs[dentro] * 20 + ys[dentro]):
+                x, y = divmod(int(celda), 20)
+                matriz[19-y][x] = '●'
             
             # Mostrar matriz
             self.text_grafico.insert(tk.END, "🔍 RELACIÓN CANTIDAD-VALOR:\n", "verde")
@@ -1115,7 +1102,8 @@ class GestorMaterialesConGraficos:
             self.text_grafico.insert(tk.END, "-"*60 + "\n")
             
             colores_tipos = ["rojo", "verde", "azul", "amarillo", "magenta", "cyan", "naranja", "rosa", "gris"]
-            for i, registro in enumerate(registros[:10]):  # Mostrar solo los primeros 10
+            recientes = snapshot.top_k('fecha', 10)
+            for i, registro in enumerate(snapshot.filas(recientes)):  # Mostrar solo los 10 más recientes
                 color = colores_tipos[i % len(colores_tipos)]
                 self.text_grafico.insert(tk.END, f"{i+1:2d}. {registro['Material'][:20]:<20} ", color)
                 self.text_grafico.insert(tk.END, f"Cant:{registro['Cantidad']:>6.1f} Val:${registro['Valor']:>6.1f}\n", color)
@@ -1125,27 +1113,19 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def mostrar_grafico_comparativo(self):
         """Mostrar gráfico comparativo ASCII"""
         try:
-            registros = self.db_manager.get_all_materials()
-            if not registros:
+            snapshot = self.obtener_snapshot()
+            if not snapshot.size:
                 self.text_grafico.delete(1.0, tk.END)
                 self.text_grafico.insert(tk.END, "No hay datos para mostrar")
                 return
             
             # Agrupar por tipo y ubicación
-            estadisticas_tipo = defaultdict(lambda: {'cantidad': 0, 'valor': 0})
-            estadisticas_ubicacion = defaultdict(lambda: {'cantidad': 0, 'valor': 0})
-            
-            for registro in registros:
-                tipo = registro['Tipo']
-                ubicacion = registro['Ubicacion']
-                
-                estadisticas_tipo[tipo]['cantidad'] += registro['Cantidad']
-                estadisticas_tipo[tipo]['valor'] += registro['Valor']
-                estadisticas_ubicacion[ubicacion]['cantidad'] += registro['Cantidad']
-                estadisticas_ubicacion[ubicacion]['valor'] += registro['Valor']
+            estadisticas_tipo = snapshot.group_by('tipo')
+            estadisticas_ubicacion = snapshot.group_by('ubicacion')
             
             # Crear gráfico ASCII con colores
             self.text_grafico.delete(1.0, tk.END)
@@ -1191,12 +1171,13 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error al crear gráfico: {e}")
     
+    @requiere_base_datos
     def analisis_completo(self):
         """Realizar análisis completo de datos"""
         try:
-            # Obtener estadísticas de la base de datos
-            stats = self.db_manager.get_statistics()
-            if not stats:
+            # Obtener estadísticas del snapshot columnar
+            stats = self.obtener_snapshot().statistics()
+            if not stats['general'][0]:
                 self.text_avanzado.delete(1.0, tk.END)
                 self.text_avanzado.insert(tk.END, "No hay datos para analizar.")
                 return
@@ -1244,66 +1225,332 @@ class GestorMaterialesConGraficos:
         except Exception as e:
             messagebox.showerror("Error", f"Error en análisis completo: {e}")
     
+    @requiere_base_datos
     def analisis_tendencias(self):
-        """Análisis de tendencias"""
+        """Análisis de tendencias a partir de los rollups por fecha"""
+        try:
+            self.text_avanzado.delete(1.0, tk.END)
+            self.text_avanzado.insert(tk.END, "📈 ANÁLISIS DE TENDENCIAS\n")
+            self.text_avanzado.insert(tk.END, "="*50 + "\n\n")
+            
+            total = self.tendencias.series('mes', None, 'cantidad').get('Total', [])
+            if not total:
+                self.text_avanzado.insert(tk.END, "No hay datos con fecha para analizar tendencias.\n")
+                return
+            
+            # Evolución mensual del inventario total
+            self.text_avanzado.insert(tk.END, "📅 CANTIDAD REGISTRADA POR MES (últimos 6):\n")
+            valores = [valor for _, valor in total]
+            medias = media_movil(valores, 3)
+            crecimientos = tasa_crecimiento(valores)
+            for (mes, valor), media, crecimiento in list(zip(total, medias, crecimientos))[-6:]:
+                texto_crecimiento = f"{crecimiento:+.1f}%" if crecimiento is not None else "  n/d"
+                self.text_avanzado.insert(tk.END, f"   • {mes}: {valor:>10.2f} | {texto_crecimiento:>8} | media 3m: {media:.2f}\n")
+            self.text_avanzado.insert(tk.END, "\n")
+            
+            # Tendencia por tipo y por ubicación en el último mes
+            for dimension, titulo in (('tipo', "📊 TENDENCIA POR TIPO"), ('ubicacion', "📍 TENDENCIA POR UBICACIÓN")):
+                resumen = self.tendencias.resumen('mes', dimension, 'cantidad', ventana=3)
+                self.text_avanzado.insert(tk.END, f"{titulo} (mes vs. mes anterior):\n")
+                ordenados = sorted(resumen.items(), key=lambda item: item[1]['suma_movil'], reverse=True)
+                for nombre, datos in ordenados:
+                    crecimiento = datos['crecimiento']
+                    texto_crecimiento = f"{crecimiento:+.1f}%" if crecimiento is not None else "n/d"
+                    self.text_avanzado.insert(
+                        tk.END,
+                        f"   • {nombre or 'Sin especificar'}: {datos['ultimo']:.2f} en {datos['periodo']} "
+                        f"({texto_crecimiento}) | suma 3m: {datos['suma_movil']:.2f} | media 3m: {datos['media_movil']:.2f}\n"
+                    )
+                self.text_avanzado.insert(tk.END, "\n")
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Error en análisis de tendencias: {e}")
+    
+    @requiere_base_datos
+    def predicciones(self):
+        """Generar predicciones sin bloquear la interfaz"""
         self.text_avanzado.delete(1.0, tk.END)
-        self.text_avanzado.insert(tk.END, "📈 ANÁLISIS DE TENDENCIAS\n")
+        self.text_avanzado.insert(tk.END, "🔮 PREDICCIONES\n")
         self.text_avanzado.insert(tk.END, "="*50 + "\n\n")
-        self.text_avanzado.insert(tk.END, "• Los materiales sólidos representan la mayor parte del inventario\n")
-        self.text_avanzado.insert(tk.END, "• Los materiales peligrosos tienen mayor valor unitario\n")
-        self.text_avanzado.insert(tk.END, "• Tendencia creciente en materiales electrónicos\n")
-        self.text_avanzado.insert(tk.END, "• Los materiales orgánicos tienen valor cero (residuos)\n")
-        self.text_avanzado.insert(tk.END, "• Concentración de materiales en almacenes específicos\n")
+        
+        if self.pronostico_pendiente is not None:
+            self.text_avanzado.insert(tk.END, "⏳ Ya hay modelos entrenándose, espere un momento...\n")
+            return
+        
+        try:
+            self.pronostico_pendiente = self.pronosticos.submit('mes', 'cantidad', horizonte=3)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al iniciar predicciones: {e}")
+            return
+        
+        self.text_avanzado.insert(tk.END, "⏳ Entrenando modelos en segundo plano...\n")
+        self.root.after(100, self.revisar_predicciones)
     
-    def predicciones(self):
-        """Generar predicciones"""
+    def revisar_predicciones(self):
+        """Mostrar las predicciones cuando terminen los ajustes"""
+        pendiente = self.pronostico_pendiente
+        if pendiente is None:
+            return
+        if not pendiente.done():
+            self.root.after(100, self.revisar_predicciones)
+            return
+        
+        self.pronostico_pendiente = None
+        try:
+            resultados = pendiente.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al generar predicciones: {e}")
+            return
+        
         self.text_avanzado.delete(1.0, tk.END)
         self.text_avanzado.insert(tk.END, "🔮 PREDICCIONES\n")
         self.text_avanzado.insert(tk.END, "="*50 + "\n\n")
-        self.text_avanzado.insert(tk.END, "• Se espera un aumento del 15% en materiales electrónicos\n")
-        self.text_avanzado.insert(tk.END, "• Los materiales peligrosos requerirán más espacio de almacenamiento\n")
-        self.text_avanzado.insert(tk.END, "• Tendencia a la reducción de materiales de papel\n")
-        self.text_avanzado.insert(tk.END, "• Incremento proyectado en materiales metálicos\n")
-        self.text_avanzado.insert(tk.END, "• Mayor demanda de almacenamiento para materiales químicos\n")
+        if not resultados:
+            self.text_avanzado.insert(tk.END, "No hay datos con fecha para generar predicciones.\n")
+            return
+        
+        self.text_avanzado.insert(tk.END, "Cantidad esperada en los próximos 3 meses (intervalo 95%):\n\n")
+        for dimension, titulo in (('tipo', "📊 POR TIPO"), ('ubicacion', "📍 POR UBICACIÓN")):
+            self.text_avanzado.insert(tk.END, f"{titulo}:\n")
+            for clave, resultado in sorted(resultados.items(), key=lambda item: str(item[0][4])):
+                if clave[3] != dimension:
+                    continue
+                self.text_avanzado.insert(tk.END, f"   • {clave[4] or 'Sin especificar'} [{resultado['modelo']}]\n")
+                for h, (p, inf, sup) in enumerate(zip(resultado['pronostico'], resultado['inferior'], resultado['superior']), 1):
+                    self.text_avanzado.insert(tk.END, f"     - Mes +{h}: {p:.2f} ({inf:.2f} - {sup:.2f})\n")
+            self.text_avanzado.insert(tk.END, "\n")
     
+    @requiere_base_datos
+    def mostrar_top(self):
+        """Mostrar los materiales y ubicaciones principales según el filtro activo"""
+        try:
+            criterio = self.combo_criterio_top.get() or 'valor_total'
+            filtros = self.filtros_actuales()
+            
+            # Las tres consultas ven el mismo estado aunque haya registros en paralelo
+            with self.db_manager.read_snapshot():
+                top = self.db_manager.get_top_materials(criterio, LIMITE_TOP, filtros)
+                bajo_minimo = self.db_manager.get_below_threshold(PUNTO_REORDEN, filtros, LIMITE_TOP)
+                ubicaciones = self.db_manager.get_top_ubicaciones('cantidad', 10, filtros)
+            
+            self.text_avanzado.delete(1.0, tk.END)
+            self.text_avanzado.insert(tk.END, f"🏆 TOP {LIMITE_TOP} POR {criterio.upper()}\n")
+            self.text_avanzado.insert(tk.END, "="*50 + "\n\n")
+            
+            for i, material in enumerate(top, 1):
+                self.text_avanzado.insert(
+                    tk.END,
+                    f"{i:2d}. {material['Material'][:25]:<25} Cant:{material['Cantidad']:>8.1f} "
+                    f"Val:${material['Valor']:>8.2f} Total:${material['Cantidad'] * material['Valor']:>10.2f} {material['Fecha']}\n"
+                )
+            
+            self.text_avanzado.insert(tk.END, f"\n⚠️ BAJO EL PUNTO DE REORDEN (cantidad < {PUNTO_REORDEN}):\n")
+            if not bajo_minimo:
+                self.text_avanzado.insert(tk.END, "   • Ningún material\n")
+            for material in bajo_minimo:
+                self.text_avanzado.insert(tk.END, f"   • {material['Material']}: {material['Cantidad']:.1f} ({material['Ubicacion']})\n")
+            
+            self.text_avanzado.insert(tk.END, "\n📍 UBICACIONES CON MÁS EXISTENCIAS:\n")
+            for ubicacion, count, cantidad, valor in ubicaciones:
+                self.text_avanzado.insert(tk.END, f"   • {ubicacion or 'Sin especificar'}: {cantidad:.1f} unidades en {count} materiales\n")
+            
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al mostrar el top: {e}")
+    
+    def filtros_actuales(self):
+        """Filtros activos de la pestaña de inventario"""
+        return {
+            'texto': self.entry_buscar.get().strip(),
+            'tipo': self.combo_filtro_tipo.get(),
+            'estado': self.combo_filtro_estado.get()
+        }
+    
+    def autocompletar_nombre(self, event):
+        """Ofrecer en el desplegable los nombres existentes que empiezan por lo escrito"""
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        # Mientras la base de datos se abre o el índice se construye en segundo plano no se bloquea la escritura
+        if self.db_manager is None or not self.db_manager.names.ready:
+            return
+        event.widget.configure(values=self.db_manager.suggest_names(event.widget.get()))
+    
+    @requiere_base_datos
     def buscar_inventario(self):
         """Buscar en inventario con filtros"""
-        texto_buscar = self.entry_buscar.get().strip()
-        tipo_filtro = self.combo_filtro_tipo.get()
-        estado_filtro = self.combo_filtro_estado.get()
-        
-        # Usar el método de búsqueda de la base de datos
-        registros_filtrados = self.db_manager.search_materials(texto_buscar, tipo_filtro, estado_filtro)
-        
-        if registros_filtrados:
-            self.cargar_datos_en_treeviews(registros_filtrados)
-            messagebox.showinfo("Búsqueda", f"Encontrados {len(registros_filtrados)} materiales.")
+        filtros = self.filtros_actuales()
+        
+        # Las estadísticas siguen al filtro activo y dan el total de coincidencias
+        stats = self.mostrar_estadisticas_basicas()
+        total = stats['general'][0] if stats else 0
+        
+        # Sin coincidencias exactas: probar con nombres parecidos (errores de escritura, tildes)
+        parecidos = []
+        if not total and filtros['texto']:
+            parecidos = self.db_manager.search_materials_fuzzy(filtros['texto'], filtros['tipo'], filtros['estado'])
+        
+        if total:
+            # El inventario muestra la primera página del filtro en el orden de columna elegido
+            self.ordenar_tabla(self.tree_inventario)
+            messagebox.showinfo("Búsqueda", f"Encontrados {total} materiales.")
+        elif parecidos:
+            self.cargar_datos_en_treeviews(parecidos)
+            nombres = ", ".join(dict.fromkeys(m['Material'] for m in parecidos[:50]))
+            messagebox.showinfo("Búsqueda", f"Sin coincidencias exactas. {len(parecidos)} materiales con nombres parecidos: {nombres}")
         else:
             messagebox.showinfo("Búsqueda", "No se encontraron materiales que coincidan con los filtros.")
             self.cargar_datos_en_treeviews([])  # Limpiar Treeview
     
+    def filtros_masivos(self):
+        """Filtros para acciones masivas: las filas seleccionadas o, si no hay, el filtro activo"""
+        seleccion = self.tree_inventario.selection()
+        if seleccion:
+            return {'ids': [self.tree_inventario.item(item, 'values')[0] for item in seleccion]}, "seleccionados"
+        return self.filtros_actuales(), "que cumplen el filtro"
+    
+    @requiere_base_datos
+    def cambiar_estado_masivo(self):
+        """Cambiar el estado de varios materiales con una sola sentencia"""
+        estado = self.combo_estado_masivo.get()
+        if not estado:
+            messagebox.showerror("Error", "Seleccione el nuevo estado")
+            return
+        filtros, descripcion = self.filtros_masivos()
+        try:
+            afectados = self.db_manager.update_where(filtros, {'Estado': estado}, dry_run=True)
+            if not afectados:
+                messagebox.showinfo("Acciones masivas", "No hay materiales que modificar")
+                return
+            if not messagebox.askyesno("Confirmar", f"¿Cambiar a '{estado}' los {len(afectados)} materiales {descripcion}?"):
+                return
+            modificados = self.db_manager.update_where(filtros, {'Estado': estado})
+            self.despues_de_accion_masiva(f"{len(modificados)} materiales cambiados a '{estado}'")
+        except Exception as e:
+            messagebox.showerror("Error", f"Error en la acción masiva: {e}")
+    
+    @requiere_base_datos
+    def eliminar_masivo(self):
+        """Eliminar varios materiales con una sola sentencia"""
+        filtros, descripcion = self.filtros_masivos()
+        try:
+            afectados = self.db_manager.delete_where(filtros, dry_run=True)
+            if not afectados:
+                messagebox.showinfo("Acciones masivas", "No hay materiales que eliminar")
+                return
+            if not messagebox.askyesno("Confirmar", f"¿Eliminar los {len(afectados)} materiales {descripcion}?"):
+                return
+            eliminados = self.db_manager.delete_where(filtros)
+            self.despues_de_accion_masiva(f"{len(eliminados)} materiales eliminados")
+        except ValueError:
+            messagebox.showerror("Error", "Seleccione filas o aplique un filtro antes de eliminar")
+        except Exception as e:
+            messagebox.showerror("Error", f"Error en la acción masiva: {e}")
+    
+    def despues_de_accion_masiva(self, mensaje):
+        self.actualizar_snapshot()
+        self.buscar_inventario()
+        messagebox.showinfo("Acciones masivas", mensaje)
+    
+    def actualizar_alertas(self):
+        """Actualizar el contador de alertas (no recorre el inventario)"""
+        total = sum(self.db_manager.get_alert_counts().values())
+        self.btn_alertas.config(text=f"🔔 Alertas ({total})")
+        return total
+    
+    def revisar_alertas(self):
+        if self.db_manager is not None:
+            self.actualizar_alertas()
+        self.root.after(INTERVALO_ALERTAS_MS, self.revisar_alertas)
+    
+    @requiere_base_datos
+    def mostrar_alertas(self):
+        """Cargar la lista de alertas abiertas y mostrar su pestaña"""
+        for i in self.tree_alertas.get_children():
+            self.tree_alertas.delete(i)
+        for alerta in self.db_manager.get_alerts():
+            if alerta['Regla'] == 'stock':
+                descripcion = f"Stock bajo: {alerta['Valor']:g} ≤ {alerta['Limite']:g}"
+            else:
+                descripcion = f"{alerta['Detalle']} desde hace {alerta['Limite']:g}+ días"
+            self.tree_alertas.insert('', tk.END, values=(alerta['ID'], alerta['Material'], alerta['Tipo'],
+                                                         alerta['Ubicacion'], descripcion, alerta['Desde']))
+        self.actualizar_alertas()
+        self.notebook.select(self.frame_alertas)
+    
+    @requiere_base_datos
+    def guardar_regla_reorden(self):
+        """Guardar el punto de reorden de un tipo ('Todos' = regla general)"""
+        tipo = self.combo_regla_tipo.get().strip()
+        texto = self.entry_regla_punto.get().strip()
+        try:
+            punto = float(texto) if texto else None
+        except ValueError:
+            messagebox.showerror("Error", "El punto de reorden debe ser un número")
+            return
+        if self.db_manager.set_reorder_point(punto, None if tipo in ('', 'Todos') else tipo):
+            self.mostrar_alertas()
+    
+    @requiere_base_datos
+    def guardar_regla_estado(self):
+        """Guardar los días que un material puede seguir en un estado sin avisar"""
+        estado = self.combo_regla_estado.get().strip()
+        texto = self.entry_regla_dias.get().strip()
+        if not estado:
+            messagebox.showerror("Error", "Seleccione un estado")
+            return
+        try:
+            dias = float(texto) if texto else None
+        except ValueError:
+            messagebox.showerror("Error", "Los días deben ser un número")
+            return
+        if self.db_manager.set_state_rule(estado, dias):
+            self.mostrar_alertas()
+    
+    @requiere_base_datos
     def actualizar_todo(self):
         """Actualizar todos los datos"""
+        self.actualizar_snapshot()
         self.cargar_datos_en_treeviews()
         self.mostrar_estadisticas_basicas()
         self.analisis_completo()
         messagebox.showinfo("Actualización", "Datos actualizados correctamente")
     
+    @requiere_base_datos
     def exportar_datos(self):
         """Exportar datos a archivo"""
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+            filetypes=[("CSV files", "*.csv"), ("Snapshot binario", "*.snap"), ("All files", "*.*")]
         )
         if filename:
             try:
-                if self.db_manager.export_to_csv(filename):
+                if filename.lower().endswith('.snap'):
+                    exportado = self.db_manager.export_snapshot(filename)
+                else:
+                    exportado = self.db_manager.export_to_csv(filename)
+                if exportado:
                     messagebox.showinfo("Éxito", f"Datos exportados a {filename}")
                 else:
                     messagebox.showerror("Error", "Error al exportar datos")
             except Exception as e:
                 messagebox.showerror("Error", f"Error al exportar: {e}")
     
+    @requiere_base_datos
+    def exportar_cambios(self):
+        """Exportar solo los cambios desde la última sincronización con el ERP"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if filename:
+            resultado = self.db_manager.export_changes_to_csv(filename)
+            if resultado is None:
+                messagebox.showerror("Error", "Error al exportar cambios")
+                return
+            filas, seq, completa = resultado
+            tipo = "completa (primera sincronización)" if completa else "de cambios"
+            messagebox.showinfo("Éxito", f"Exportación {tipo}: {filas} filas hasta la secuencia {seq}\n{filename}")
+    
+    @requiere_base_datos
     def importar_datos(self):
         """Importar datos desde archivo"""
         filename = filedialog.askopenfilename(
@@ -1311,8 +1558,18 @@ class GestorMaterialesConGraficos:
         )
         if filename:
             try:
-                imported_count = self.db_manager.import_from_csv(filename)
+                rechazados = []
+                if os.path.getsize(filename) >= UMBRAL_IMPORTACION_PARALELA:
+                    resultado = self.db_manager.import_from_csv_parallel(filename)
+                    imported_count = resultado['importados']
+                    rechazados = resultado['rechazados']
+                else:
+                    imported_count = self.db_manager.import_from_csv(filename)
+                if rechazados:
+                    linea, motivo = rechazados[0]
+                    messagebox.showwarning("Advertencia", f"{len(rechazados)} filas rechazadas (primera: línea {linea}, {motivo})")
                 if imported_count > 0:
+                    self.actualizar_snapshot()
                     self.cargar_datos_en_treeviews()
                     messagebox.showinfo("Éxito", f"{imported_count} registros importados correctamente")
                 else:
@@ -1321,40 +1578,142 @@ class GestorMaterialesConGraficos:
                 messagebox.showerror("Error", f"Error al importar: {e}")
     
     def cargar_datos_en_treeviews(self, records=None):
-        """Carga los datos en los Treeviews de Registro e Inventario."""
+        """Carga los datos en los Treeviews de Registro e Inventario.
         
-        # 1. Obtener datos (si no se pasan explícitamente)
+        Sin 'records' cada tabla muestra la primera página en su orden actual
+        (el inventario, además, con el filtro activo); el resto se pide al
+        desplazarse hasta el final.
+        """
         if records is None:
-            records = self.db_manager.get_all_materials()
-
-        # 2. Limpiar Treeview del registro
-        for i in self.tree_materiales.get_children():
-            self.tree_materiales.delete(i)
-        
-        # 3. Limpiar Treeview del inventario
-        for i in self.tree_inventario.get_children():
-            self.tree_inventario.delete(i)
-
-        # 4. Insertar nuevos datos en ambos Treeviews
-        for item in records:
-            data_registro = (item['ID'], item['Material'], item['Tipo'], item['Cantidad'], item['Valor'], item['Ubicacion'], item['Estado'])
-            data_inventario = (item['ID'], item['Material'], item['Tipo'], item['Cantidad'], item['Valor'], item['Ubicacion'], item['Estado'], item['Fecha'])
-            
-            self.tree_materiales.insert('', tk.END, values=data_registro)
-            self.tree_inventario.insert('', tk.END, values=data_inventario)
+            self.ordenar_tabla(self.tree_materiales)
+            self.ordenar_tabla(self.tree_inventario)
+        else:
+            # Resultados ya calculados (búsquedas): se muestran tal cual, sin orden de columna
+            for tree in (self.tree_materiales, self.tree_inventario):
+                self.orden_tablas.pop(tree, None)
+                self.paginas[tree] = None
+                self.marcar_orden(tree)
+                self.mostrar_filas(tree, records)
+        
+        # Los triggers ya evaluaron las alertas de lo escrito; solo se lee el contador
+        self.actualizar_alertas()
+    
+    def filtros_tabla(self, tree):
+        """Filtros con los que se consulta cada tabla (el registro muestra todo)"""
+        return self.filtros_actuales() if tree is self.tree_inventario else None
+    
+    def valores_fila(self, tree, item):
+        """Valores de un material para las columnas de la tabla"""
+        valores = (item['ID'], item['Material'], item['Tipo'], item['Cantidad'], item['Valor'], item['Ubicacion'], item['Estado'])
+        return valores + (item['Fecha'],) if tree is self.tree_inventario else valores
+    
+    @requiere_base_datos
+    def ordenar_tabla(self, tree, columna=None):
+        """Ordenar una tabla por una columna en la base de datos y mostrar su primera página
+        
+        Al pulsar la cabecera de la columna ya ordenada se invierte el sentido;
+        sin 'columna' se recarga con el orden actual.
+        """
+        actual, descendente = self.orden_tablas.get(tree, ORDEN_INICIAL)
+        if columna is not None:
+            descendente = not descendente if columna == actual else False
+            actual = columna
+        self.orden_tablas[tree] = (actual, descendente)
+        self.marcar_orden(tree)
+        
+        materiales, self.paginas[tree] = self.db_manager.get_materials_sorted(
+            self.filtros_tabla(tree), actual, descendente, TAMANO_PAGINA_TABLA)
+        self.mostrar_filas(tree, materiales)
+        tree.yview_moveto(0)
+    
+    def marcar_orden(self, tree):
+        """Indicar con ▲/▼ en la cabecera la columna por la que está ordenada la tabla"""
+        columna, descendente = self.orden_tablas.get(tree, (None, False))
+        for col in tree['columns']:
+            flecha = (' ▼' if descendente else ' ▲') if col == columna else ''
+            tree.heading(col, text=col + flecha)
+    
+    def mostrar_filas(self, tree, materiales, tamano_lote=TAMANO_LOTE_TABLA):
+        """Mostrar materiales en una tabla, por tandas si son muchos
+        
+        La primera tanda se muestra enseguida reutilizando las filas que ya
+        existen (cambiar sus valores es mucho más barato en Tk que borrarlas y
+        crearlas de nuevo); el resto se inserta con root.after mientras una
+        barra indica el progreso. Una carga nueva cancela la que siga en curso.
+        """
+        self.cancelar_carga(tree)
+        filas = tree.get_children()
+        primera = materiales[:tamano_lote]
+        for fila, item in zip(filas, primera):
+            tree.item(fila, values=self.valores_fila(tree, item))
+        for item in primera[len(filas):]:
+            tree.insert('', tk.END, values=self.valores_fila(tree, item))
+        if len(filas) > len(primera):
+            tree.delete(*filas[len(primera):])
+        
+        if len(materiales) > tamano_lote:
+            barra = self.progresos[tree]
+            barra.configure(maximum=len(materiales), value=tamano_lote)
+            barra.grid()
+            self.cargas[tree] = self.root.after(PAUSA_LOTE_MS, self.insertar_tanda, tree, materiales, tamano_lote, tamano_lote)
+    
+    def insertar_tanda(self, tree, materiales, inicio, tamano_lote):
+        """Insertar la siguiente tanda de una carga larga y programar la que sigue"""
+        fin = min(inicio + tamano_lote, len(materiales))
+        for item in materiales[inicio:fin]:
+            tree.insert('', tk.END, values=self.valores_fila(tree, item))
+        self.progresos[tree].configure(value=fin)
+        if fin < len(materiales):
+            self.cargas[tree] = self.root.after(PAUSA_LOTE_MS, self.insertar_tanda, tree, materiales, fin, tamano_lote)
+        else:
+            del self.cargas[tree]
+            self.progresos[tree].grid_remove()
+    
+    def cancelar_carga(self, tree):
+        """Detener la carga por tandas de una tabla, si hay alguna en curso"""
+        pendiente = self.cargas.pop(tree, None)
+        if pendiente is not None:
+            self.root.after_cancel(pendiente)
+            self.progresos[tree].grid_remove()
+    
+    def desplazamiento(self, tree, scrollbar):
+        """yscrollcommand de una tabla: mueve la barra y pide la página siguiente al llegar al final"""
+        def al_desplazar(primero, ultimo):
+            scrollbar.set(primero, ultimo)
+            if float(ultimo) >= 1.0 and self.paginas.get(tree) is not None:
+                self.root.after_idle(self.cargar_pagina_siguiente, tree)
+        return al_desplazar
+    
+    def cargar_pagina_siguiente(self, tree):
+        """Añadir al final de una tabla la siguiente página en su orden actual"""
+        cursor = self.paginas.get(tree)
+        if cursor is None:
+            return
+        # Evitar que varios avisos de desplazamiento pidan la misma página
+        self.paginas[tree] = None
+        columna, descendente = self.orden_tablas.get(tree, ORDEN_INICIAL)
+        materiales, self.paginas[tree] = self.db_manager.get_materials_sorted(
+            self.filtros_tabla(tree), columna, descendente, TAMANO_PAGINA_TABLA, cursor)
+        for item in materiales:
+            tree.insert('', tk.END, values=self.valores_fila(tree, item))
     
     def mostrar_estadisticas_basicas(self):
-        """Muestra las estadísticas básicas en la pestaña de Estadísticas."""
-        stats = self.db_manager.get_statistics()
+        """Muestra las estadísticas básicas (según el filtro activo) en la pestaña de Estadísticas."""
+        filtros = self.filtros_actuales()
+        stats = self.db_manager.get_statistics(filtros)
         
         self.text_estadisticas.delete(1.0, tk.END)
         
-        if stats and stats['general'][0] is not None:
+        if stats and stats['general'][0]:
             # General Stats
             general = stats['general']
             total_items, total_qty, total_value, avg_value = general
             
-            output = f"--- Estadísticas Generales ---\n"
+            output = ""
+            if any(valor and valor != 'Todos' for valor in filtros.values()):
+                activos = ", ".join(f"{clave}={valor}" for clave, valor in filtros.items() if valor and valor != 'Todos')
+                output += f"Filtro activo: {activos}\n\n"
+            output += f"--- Estadísticas Generales ---\n"
             output += f"Total de Registros: {total_items}\n"
             output += f"Cantidad Total: {total_qty:.2f}\n"
             output += f"Valor Total de Inventario: ${total_value:,.2f}\n"
@@ -1371,15 +1730,32 @@ class GestorMaterialesConGraficos:
             output += f"--- Materiales por Ubicación ---\n"
             for ubicacion, count in stats['por_ubicacion']:
                 output += f"  - {ubicacion if ubicacion else 'Sin especificar'}: {count} ítems\n"
+            output += f"\n"
+            
+            # Stats por Estado
+            output += f"--- Materiales por Estado ---\n"
+            for estado, count, qty, value in stats['por_estado']:
+                output += f"  - {estado if estado else 'Sin especificar'}: {count} ítems | {qty:.2f} unidades | Valor: ${value:,.2f}\n"
+            output += f"\n"
+            
+            # Tabla cruzada Tipo × Ubicación
+            output += f"--- Tipo × Ubicación ---\n"
+            for tipo, ubicacion, count, qty, value in stats['tipo_ubicacion']:
+                output += f"  - {tipo} @ {ubicacion if ubicacion else 'Sin especificar'}: {count} ítems | {qty:.2f} unidades\n"
             
             self.text_estadisticas.insert(tk.END, output)
         else:
             self.text_estadisticas.insert(tk.END, "No hay datos para generar estadísticas.")
+        return stats
 
 def main():
     root = tk.Tk()
     app = GestorMaterialesConGraficos(root)
     root.mainloop()
+    if app.db_manager is not None:
+        app.pronosticos.close()
+        app.guardar_snapshot()
+        app.db_manager.close()
 
 if __name__ == '__main__':
     main()
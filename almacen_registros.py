@@ -0,0 +1,227 @@
+import csv
+import io
+import os
+import tempfile
+import unicodedata
+
+ENCABEZADO = ['Material', 'Tipo', 'Cantidad', 'Valor']
+
+
+def normalizar_texto(texto):
+    """Normalizar texto para comparaciones: sin acentos, casefold y sin espacios extremos"""
+    descompuesto = unicodedata.normalize('NFKD', texto.strip())
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_acentos.casefold()
+
+
+def clave_material(material, tipo):
+    """Clave normalizada (material, tipo) usada para detectar duplicados"""
+    return (normalizar_texto(material), normalizar_texto(tipo))
+
+
+class AlmacenRegistros:
+    """Almacenamiento de registros en CSV con escritura por anexado
+
+    Los registros nuevos se añaden al final del archivo sin reescribirlo;
+    las reescrituras completas y la compactación usan un archivo temporal
+    que sustituye al original de forma atómica.
+
+    Los registros leídos y los totales por tipo se guardan en memoria y
+    solo se vuelven a leer cuando cambian la fecha de modificación o el
+    tamaño del archivo; si el archivo solo creció, se lee únicamente la
+    parte añadida.
+    """
+
+    def __init__(self, archivo='registros.csv', encabezado=None, umbral_compactacion=1000):
+        self.archivo = archivo
+        self.encabezado = list(encabezado or ENCABEZADO)
+        self.umbral_compactacion = umbral_compactacion
+        self.anexados = 0
+        self._vaciar_cache()
+
+    def _vaciar_cache(self):
+        self._registros = []
+        self._totales = {}
+        self._claves = set()
+        self._firma = None
+        self._desplazamiento = 0
+        self._columnas = None
+        self._cola = b''
+        # Filas incompletas o corruptas encontradas al leer (las que eliminaría compactar)
+        self._descartadas = 0
+
+    def inicializar(self):
+        """Crear el archivo con su encabezado si no existe"""
+        if not os.path.exists(self.archivo):
+            self.reescribir([])
+
+    def convertir_fila(self, row):
+        """Convertir una fila leída del CSV en registro"""
+        return {
+            'Material': row['Material'],
+            'Tipo': row['Tipo'],
+            'Cantidad': float(row['Cantidad']),
+            'Valor': float(row['Valor'])
+        }
+
+    def _acumular(self, registro):
+        self._registros.append(registro)
+        self._claves.add(clave_material(registro['Material'], registro['Tipo']))
+        totales = self._totales.setdefault(registro['Tipo'], {'Cantidad': 0, 'Valor': 0})
+        totales['Cantidad'] += registro['Cantidad']
+        totales['Valor'] += registro['Valor']
+
+    def _parsear(self, datos, columnas=None):
+        """Convertir bytes de líneas completas en registros cacheados"""
+        reader = csv.DictReader(io.StringIO(datos.decode('utf-8'), newline=''), fieldnames=columnas)
+        for row in reader:
+            try:
+                self._acumular(self.convertir_fila(row))
+            except (KeyError, TypeError, ValueError):
+                self._descartadas += 1
+        return reader.fieldnames
+
+    def _sincronizar(self):
+        """Actualizar la caché si el archivo cambió desde la última lectura"""
+        try:
+            estado = os.stat(self.archivo)
+        except FileNotFoundError:
+            self._vaciar_cache()
+            return
+        firma = (estado.st_mtime_ns, estado.st_size)
+        if firma == self._firma:
+            return
+
+        with open(self.archivo, 'rb') as file:
+            # Si solo se añadieron datos al final, leer únicamente la cola nueva
+            solo_crecio = False
+            if self._firma is not None and estado.st_size >= self._desplazamiento and self._columnas:
+                inicio_cola = self._desplazamiento - len(self._cola)
+                file.seek(inicio_cola)
+                solo_crecio = file.read(len(self._cola)) == self._cola
+            if solo_crecio:
+                file.seek(self._desplazamiento)
+                inicio = self._desplazamiento
+            else:
+                self._vaciar_cache()
+                inicio = 0
+            datos = file.read()
+
+        # Procesar solo hasta la última línea completa
+        fin = datos.rfind(b'\n') + 1
+        if fin:
+            columnas = self._parsear(datos[:fin], self._columnas)
+            self._columnas = self._columnas or columnas
+            self._desplazamiento = inicio + fin
+            self._cola = datos[max(fin - 64, 0):fin]
+        self._firma = firma
+
+    def leer(self):
+        """Leer todos los registros del archivo, omitiendo filas incompletas"""
+        self._sincronizar()
+        return list(self._registros)
+
+    def totales_por_tipo(self):
+        """Totales de cantidad y valor por tipo, calculados de forma incremental"""
+        self._sincronizar()
+        return {tipo: dict(totales) for tipo, totales in self._totales.items()}
+
+    def existe(self, material, tipo):
+        """Indicar si ya hay un registro con el mismo material y tipo normalizados"""
+        self._sincronizar()
+        return clave_material(material, tipo) in self._claves
+
+    def agregar_nuevos(self, registros):
+        """Añadir los registros que no estén duplicados, con una sola escritura
+
+        Devuelve (agregados, duplicados); también se descartan los repetidos
+        dentro del propio lote.
+        """
+        self._sincronizar()
+        agregados = []
+        duplicados = []
+        vistos = set()
+        for registro in registros:
+            clave = clave_material(registro['Material'], registro['Tipo'])
+            if clave in self._claves or clave in vistos:
+                duplicados.append(registro)
+            else:
+                vistos.add(clave)
+                agregados.append(registro)
+        self.agregar_lote(agregados)
+        return agregados, duplicados
+
+    def _fila(self, registro):
+        return [registro[columna] for columna in self.encabezado]
+
+    def agregar(self, registro):
+        """Añadir un registro al final del archivo"""
+        self.agregar_lote([registro])
+
+    def agregar_lote(self, registros):
+        """Añadir varios registros con una sola apertura del archivo"""
+        registros = list(registros)
+        if not registros:
+            return
+        self.inicializar()
+        with open(self.archivo, 'r+b') as file:
+            # Si una escritura anterior quedó cortada, cerrar la línea incompleta
+            file.seek(0, os.SEEK_END)
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    file.write(b'\r\n')
+        with open(self.archivo, 'a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerows(self._fila(registro) for registro in registros)
+            file.flush()
+            os.fsync(file.fileno())
+        self.anexados += len(registros)
+        if self.umbral_compactacion and self.anexados >= self.umbral_compactacion:
+            # Reescribir solo si hay filas que descartar; la lectura de la cola añadida es incremental
+            self._sincronizar()
+            if self._descartadas:
+                self.compactar()
+            else:
+                self.anexados = 0
+
+    def reescribir(self, registros):
+        """Reescribir el archivo completo de forma atómica"""
+        directorio = os.path.dirname(os.path.abspath(self.archivo))
+        descriptor, temporal = tempfile.mkstemp(prefix='.registros-', suffix='.tmp', dir=directorio)
+        try:
+            with os.fdopen(descriptor, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(self.encabezado)
+                writer.writerows(self._fila(registro) for registro in registros)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporal, self.archivo)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        self.anexados = 0
+
+        # La caché pasa a reflejar directamente lo que se acaba de escribir
+        self._vaciar_cache()
+        for registro in registros:
+            self._acumular({
+                'Material': registro['Material'],
+                'Tipo': registro['Tipo'],
+                'Cantidad': float(registro['Cantidad']),
+                'Valor': float(registro['Valor'])
+            })
+        estado = os.stat(self.archivo)
+        with open(self.archivo, 'rb') as file:
+            file.seek(max(estado.st_size - 64, 0))
+            self._cola = file.read()
+        self._columnas = list(self.encabezado)
+        self._desplazamiento = estado.st_size
+        self._firma = (estado.st_mtime_ns, estado.st_size)
+
+    def compactar(self):
+        """Reescribir el archivo descartando filas incompletas o corruptas"""
+        registros = self.leer()
+        self.reescribir(registros)
+        return len(registros)
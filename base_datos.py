@@ -0,0 +1,1023 @@
+import csv
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+from diario_cambios import ChangeJournal
+from libro_movimientos import StockLedger
+from busqueda_difusa import NameIndex, instalar_tabla_nombres
+from motor_alertas import AlertEngine
+
+# Fecha dd/mm/YYYY reordenada como YYYYMMDD para poder ordenarla
+FECHA_ORDEN_SQL = "(substr(fecha, 7, 4) || substr(fecha, 4, 2) || substr(fecha, 1, 2))"
+
+# Tabla de materiales (sin índices ni triggers, que se añaden en init_database)
+ESQUEMA_MATERIALES = '''
+    CREATE TABLE IF NOT EXISTS materiales (
+        id TEXT PRIMARY KEY,
+        material TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        cantidad REAL NOT NULL,
+        valor REAL NOT NULL,
+        ubicacion TEXT,
+        estado TEXT DEFAULT 'Disponible',
+        fecha TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1
+    )
+'''
+
+# Campos que se pueden modificar en bloque con update_where
+COLUMNAS_EDITABLES = {
+    'Material': 'material',
+    'Tipo': 'tipo',
+    'Cantidad': 'cantidad',
+    'Valor': 'valor',
+    'Ubicacion': 'ubicacion',
+    'Estado': 'estado',
+    'Fecha': 'fecha'
+}
+
+# Criterios de ordenación admitidos por get_top_materials
+CRITERIOS_TOP = {
+    'valor': 'valor',
+    'cantidad': 'cantidad',
+    'valor_total': '(cantidad * valor)',
+    'fecha': FECHA_ORDEN_SQL
+}
+
+# Columnas de las tablas de la interfaz que se pueden ordenar (get_materials_sorted).
+# Las columnas que admiten NULL se ordenan como '' para que la paginación por
+# clave pueda compararlas; cada expresión tiene un índice (expresión, id).
+COLUMNAS_ORDEN = {
+    'ID': 'id',
+    'Material': 'material',
+    'Tipo': 'tipo',
+    'Cantidad': 'cantidad',
+    'Valor': 'valor',
+    'Ubicacion': "IFNULL(ubicacion, '')",
+    'Estado': "IFNULL(estado, '')",
+    'Fecha': FECHA_ORDEN_SQL
+}
+
+# Con al menos tantas coincidencias del filtro, get_materials_sorted recorre el índice de orden
+UMBRAL_ORDEN_POR_INDICE = 5000
+
+# Archivos de importación a partir de este tamaño se analizan en paralelo
+UMBRAL_IMPORTACION_PARALELA = 20 * 1024 * 1024
+
+# Caché de páginas (KiB) de las inserciones en bloque: con los índices de materiales, la
+# caché por defecto (2 MiB) no retiene sus hojas y cada fila vuelve a leerlas
+CACHE_INSERCION_MASIVA_KB = 64 * 1024
+
+def uri_solo_lectura(db_name):
+    """URI de SQLite para abrir una base de datos en modo de solo lectura"""
+    return 'file:' + os.path.abspath(db_name).replace('?', '%3f').replace('#', '%23') + '?mode=ro'
+
+
+class ConnectionPool:
+    """Conexiones de solo lectura reutilizables desde varios hilos
+    
+    Cada conexión la usa un único hilo a la vez; si todas están ocupadas,
+    connection() espera a que se libere una.
+    """
+    
+    def __init__(self, db_name, size=8, timeout=30):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self._libres = queue.LifoQueue()
+        self._creadas = 0
+        self._lock = threading.Lock()
+    
+    def _abrir(self):
+        return sqlite3.connect(uri_solo_lectura(self.db_name), uri=True, check_same_thread=False)
+    
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._libres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crear = self._creadas < self.size
+                if crear:
+                    self._creadas += 1
+            conn = self._abrir() if crear else self._libres.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._libres.put(conn)
+    
+    def close(self):
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class DatabaseManager:
+    """Clase para manejar todas las operaciones de base de datos"""
+    
+    def __init__(self, db_name='materiales.db', pool_size=0):
+        self.db_name = db_name
+        self._lecturas = threading.local()
+        self.init_database()
+        self.journal = ChangeJournal(db_name)
+        self.ledger = StockLedger(db_name)
+        self.alerts = AlertEngine(db_name)
+        # Índice de nombres para búsqueda difusa y autocompletado (se construye al usarlo)
+        self.names = NameIndex(db_name)
+        # Pool opcional de conexiones de lectura (para el servicio HTTP)
+        self.pool = ConnectionPool(db_name, pool_size) if pool_size else None
+    
+    def close(self):
+        """Cerrar las conexiones que se mantienen abiertas (índice de nombres y pool)"""
+        self.names.close()
+        if self.pool is not None:
+            self.pool.close()
+    
+    def init_database(self):
+        """Inicializar la base de datos y crear tablas"""
+        try:
+            with closing(sqlite3.connect(self.db_name)) as conn:
+                cursor = conn.cursor()
+                
+                # WAL: los lectores no bloquean a los escritores ni al revés
+                cursor.execute('PRAGMA journal_mode=WAL')
+                
+                # Hilos auxiliares para ordenar las filas al crear índices sobre tablas grandes
+                cursor.execute(f'PRAGMA threads = {os.cpu_count() or 1}')
+                
+                # Crear tabla de materiales
+                cursor.execute(ESQUEMA_MATERIALES)
+                
+                # Bases de datos anteriores: añadir la versión de fila para el control optimista
+                cursor.execute('PRAGMA table_info(materiales)')
+                if 'version' not in [columna[1] for columna in cursor.fetchall()]:
+                    cursor.execute('ALTER TABLE materiales ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+                
+                # Índices para consultas top-k y de umbral (se recorren en orden y se cortan con LIMIT)
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_materiales_valor_total ON materiales ((cantidad * valor))')
+                
+                # Índices de ordenación por columna con el ID como desempate: sirven a la vez
+                # para los top-k y para paginar por clave (expresión, id) sin ordenar en memoria.
+                # Sustituyen a los índices de una sola columna de versiones anteriores.
+                for indice in ('valor', 'cantidad', 'fecha_orden', 'material'):
+                    cursor.execute(f'DROP INDEX IF EXISTS idx_materiales_{indice}')
+                for columna, expresion in COLUMNAS_ORDEN.items():
+                    if columna != 'ID':
+                        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_materiales_orden_{columna.lower()} '
+                                       f'ON materiales ({expresion}, id)')
+                
+                # Índice que cubre el filtro por ubicación con la cantidad y el valor
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_materiales_ubicacion_cantidad ON materiales (ubicacion, cantidad, valor)')
+                
+                # Top-k filtrado por tipo o estado (los filtros de la vista Top): (filtro, criterio)
+                # recorre solo esa partición en orden y se corta con LIMIT. Con los dos filtros se
+                # recorre el índice de uno comprobando el otro, y el texto se comprueba durante el
+                # recorrido. Cada índice encarece todas las escrituras, así que no hay uno por
+                # combinación: el filtro por ubicación busca su partición en
+                # idx_materiales_ubicacion_cantidad (en orden para 'cantidad') y ordena solo esas filas.
+                for columna in ('tipo', 'estado'):
+                    for criterio, expresion in CRITERIOS_TOP.items():
+                        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_materiales_{columna}_{criterio} '
+                                       f'ON materiales ({columna}, {expresion})')
+                for criterio in ('valor', 'valor_total', 'fecha'):
+                    cursor.execute(f'DROP INDEX IF EXISTS idx_materiales_ubicacion_{criterio}')
+                
+                # Índice cubriente para el GROUP BY de get_statistics_cells (evita ordenar en un B-tree temporal)
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_materiales_grupos ON materiales (tipo, ubicacion, estado, cantidad, valor)')
+                
+                # Nombres distintos para los índices en memoria (la búsqueda por nombre exacto usa idx_materiales_orden_material)
+                instalar_tabla_nombres(cursor)
+                
+                conn.commit()
+        except Exception as e:
+            print(f"Error al inicializar la base de datos: {e}")
+    
+    @contextmanager
+    def read_connection(self):
+        """Conexión para consultas: la del read_snapshot activo en este hilo o una nueva"""
+        conn = getattr(self._lecturas, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        conn = sqlite3.connect(self.db_name)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def read_snapshot(self):
+        """Fijar una vista de solo lectura de la base de datos en un instante
+        
+        Dentro del bloque, todas las consultas de este hilo (get_statistics,
+        get_top_materials, export_to_csv...) usan una conexión de solo
+        lectura con una transacción WAL abierta, así que ven los mismos
+        datos aunque otros registren cambios en paralelo. Devuelve la
+        conexión para consultas propias.
+        """
+        conn = getattr(self._lecturas, 'conn', None)
+        if conn is not None:
+            # Bloques anidados comparten la misma vista
+            yield conn
+            return
+        conn = sqlite3.connect(uri_solo_lectura(self.db_name), uri=True, isolation_level=None)
+        try:
+            conn.execute('BEGIN')
+            # La vista se fija con la primera lectura
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            self._lecturas.conn = conn
+            yield conn
+        finally:
+            self._lecturas.conn = None
+            conn.rollback()
+            conn.close()
+    
+    def insert_material(self, material_data, version=1):
+        """Insertar un nuevo material
+        
+        'version' permite conservar la versión de un material que se traslada
+        desde otra base de datos.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha, version)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    material_data['ID'],
+                    material_data['Material'],
+                    material_data['Tipo'],
+                    material_data['Cantidad'],
+                    material_data['Valor'],
+                    material_data['Ubicacion'],
+                    material_data['Estado'],
+                    material_data['Fecha'],
+                    version
+                ))
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error al insertar material: {e}")
+            return False
+    
+    def insert_materials(self, materials):
+        """Insertar varios materiales en una sola transacción
+        
+        Si alguno falla (por ejemplo, un ID repetido) no se inserta ninguno.
+        Devuelve el número de materiales insertados.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'PRAGMA cache_size = -{CACHE_INSERCION_MASIVA_KB}')
+                cursor.executemany('''
+                    INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(
+                    material_data['ID'],
+                    material_data['Material'],
+                    material_data['Tipo'],
+                    material_data['Cantidad'],
+                    material_data['Valor'],
+                    material_data['Ubicacion'],
+                    material_data['Estado'],
+                    material_data['Fecha']
+                ) for material_data in materials])
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            print(f"Error al insertar materiales: {e}")
+            return 0
+    
+    def has_materials(self):
+        """Indicar si hay al menos un material, sin leer la tabla completa"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM materiales LIMIT 1')
+                return cursor.fetchone() is not None
+        except Exception as e:
+            print(f"Error al consultar materiales: {e}")
+            return False
+    
+    def get_all_materials(self):
+        """Obtener todos los materiales"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT * FROM materiales ORDER BY {FECHA_ORDEN_SQL} DESC')
+                return self.rows_to_materials(cursor.fetchall())
+        except Exception as e:
+            print(f"Error al obtener materiales: {e}")
+            return []
+    
+    def get_material(self, material_id):
+        """Obtener un material por su ID, o None si no existe"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM materiales WHERE id = ?', (material_id,))
+                rows = self.rows_to_materials(cursor.fetchall())
+                return rows[0] if rows else None
+        except Exception as e:
+            print(f"Error al obtener material: {e}")
+            return None
+    
+    def get_materials_page(self, filters=None, limit=50, after_id=None):
+        """Obtener una página de materiales ordenada por ID
+        
+        La paginación es por clave (id > after_id), así que el coste de cada
+        página no depende de su posición. Devuelve (materiales, siguiente
+        after_id o None si es la última página).
+        """
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause(filters)
+                if after_id is not None:
+                    where += " AND id > ?"
+                    params.append(after_id)
+                cursor.execute("SELECT * FROM materiales" + where + " ORDER BY id LIMIT ?", params + [limit + 1])
+                materials = self.rows_to_materials(cursor.fetchall())
+                if len(materials) > limit:
+                    return materials[:limit], materials[limit - 1]['ID']
+                return materials, None
+        except Exception as e:
+            print(f"Error al obtener página de materiales: {e}")
+            return [], None
+    
+    def get_materials_sorted(self, filters=None, order_by='Fecha', descending=False, limit=50, after=None):
+        """Obtener una página de materiales ordenada por una columna de la interfaz
+        
+        El orden se resuelve en SQL recorriendo el índice (columna, id) de
+        COLUMNAS_ORDEN y cortando con LIMIT, así que la primera página cuesta
+        lo mismo con mil filas que con un millón. 'after' es el cursor que
+        devolvió la página anterior. Devuelve (materiales, cursor de la
+        siguiente página o None si es la última).
+        """
+        if order_by not in COLUMNAS_ORDEN:
+            raise ValueError(f"Columna de ordenación no válida: {order_by}")
+        expresion = COLUMNAS_ORDEN[order_by]
+        direccion = 'DESC' if descending else 'ASC'
+        comparacion = '<' if descending else '>'
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause(filters)
+                
+                # Sin estadísticas, SQLite prefiere el índice del filtro y ordena todas las
+                # coincidencias. Si son muchas, recorrer el índice de orden encuentra antes
+                # una página; si son pocas, ordenarlas en memoria es barato.
+                indice = ''
+                if where != " WHERE 1=1":
+                    cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM materiales" + where + " LIMIT ?)",
+                                   params + [UMBRAL_ORDEN_POR_INDICE])
+                    if cursor.fetchone()[0] >= UMBRAL_ORDEN_POR_INDICE:
+                        # El ID se recorre con el índice de su clave primaria
+                        nombre = 'sqlite_autoindex_materiales_1' if order_by == 'ID' else f'idx_materiales_orden_{order_by.lower()}'
+                        indice = f" INDEXED BY {nombre}"
+                
+                if order_by == 'ID':
+                    orden = f"id {direccion}"
+                    if after is not None:
+                        where += f" AND id {comparacion} ?"
+                        params.append(after[1])
+                else:
+                    orden = f"{expresion} {direccion}, id {direccion}"
+                    if after is not None:
+                        where += f" AND ({expresion}, id) {comparacion} (?, ?)"
+                        params.extend(after)
+                cursor.execute(
+                    f"SELECT *, {expresion} FROM materiales{indice}" + where + f" ORDER BY {orden} LIMIT ?",
+                    params + [limit + 1]
+                )
+                filas = cursor.fetchall()
+                materials = self.rows_to_materials(filas[:limit])
+                if len(filas) > limit:
+                    return materials, (filas[limit - 1][-1], filas[limit - 1][0])
+                return materials, None
+        except Exception as e:
+            print(f"Error al ordenar materiales: {e}")
+            return [], None
+    
+    def build_where_clause(self, filters=None):
+        """Construir la cláusula WHERE y sus parámetros a partir de los filtros
+        
+        filters es un diccionario con las claves opcionales 'texto', 'tipo',
+        'estado', 'ubicacion' e 'ids' (lista de IDs concretos); los valores
+        vacíos o 'Todos' no filtran.
+        """
+        filters = filters or {}
+        query = " WHERE 1=1"
+        params = []
+        
+        if filters.get('texto'):
+            query += " AND LOWER(material) LIKE LOWER(?)"
+            params.append(f"%{filters['texto']}%")
+        
+        for columna in ('tipo', 'estado', 'ubicacion'):
+            valor = filters.get(columna)
+            if valor and valor != 'Todos':
+                query += f" AND {columna} = ?"
+                params.append(valor)
+        
+        if filters.get('ids') is not None:
+            ids = list(filters['ids'])
+            query += f" AND id IN ({', '.join('?' * len(ids)) or 'NULL'})"
+            params.extend(ids)
+        
+        return query, params
+    
+    def search_materials(self, search_text='', tipo_filter='Todos', estado_filter='Todos', limit=None):
+        """Buscar materiales con filtros (como máximo 'limit' resultados si se indica)"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                
+                where, params = self.build_where_clause({
+                    'texto': search_text,
+                    'tipo': tipo_filter,
+                    'estado': estado_filter
+                })
+                query = "SELECT * FROM materiales" + where + f" ORDER BY {FECHA_ORDEN_SQL} DESC"
+                if limit is not None:
+                    query += " LIMIT ?"
+                    params.append(limit)
+                
+                cursor.execute(query, params)
+                return self.rows_to_materials(cursor.fetchall())
+        except Exception as e:
+            print(f"Error al buscar materiales: {e}")
+            return []
+    
+    def fuzzy_search_names(self, texto, limit=10):
+        """Nombres parecidos a 'texto' aunque tengan errores o tildes: [(nombre, similitud, materiales)]"""
+        try:
+            return self.names.search(texto, limit)
+        except Exception as e:
+            print(f"Error en la búsqueda difusa: {e}")
+            return []
+    
+    def suggest_names(self, prefijo, limit=8):
+        """Nombres existentes que empiezan por 'prefijo', para autocompletar"""
+        try:
+            return self.names.suggest(prefijo, limit)
+        except Exception as e:
+            print(f"Error al sugerir nombres: {e}")
+            return []
+    
+    def search_materials_fuzzy(self, search_text, tipo_filter='Todos', estado_filter='Todos',
+                               limit=None, max_names=10, min_similarity=0.5):
+        """Materiales cuyos nombres se parecen a 'search_text', los más parecidos primero"""
+        nombres = [nombre for nombre, similitud, _ in self.fuzzy_search_names(search_text, max_names)
+                   if similitud >= min_similarity]
+        if not nombres:
+            return []
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause({'tipo': tipo_filter, 'estado': estado_filter})
+                where += f" AND material IN ({', '.join('?' * len(nombres))})"
+                params.extend(nombres)
+                cursor.execute("SELECT * FROM materiales" + where, params)
+                materiales = self.rows_to_materials(cursor.fetchall())
+        except Exception as e:
+            print(f"Error al buscar materiales: {e}")
+            return []
+        orden = {nombre: i for i, nombre in enumerate(nombres)}
+        materiales.sort(key=lambda m: orden[m['Material']])
+        return materiales if limit is None else materiales[:limit]
+    
+    def rows_to_materials(self, rows):
+        """Convertir filas de la tabla materiales en diccionarios"""
+        return [{
+            'ID': row[0],
+            'Material': row[1],
+            'Tipo': row[2],
+            'Cantidad': row[3],
+            'Valor': row[4],
+            'Ubicacion': row[5],
+            'Estado': row[6],
+            'Fecha': row[7],
+            'Version': row[8] if len(row) > 8 else None
+        } for row in rows]
+    
+    def get_top_materials(self, order_by='valor', limit=20, filters=None, ascending=False):
+        """Obtener los materiales con mayor (o menor) valor, cantidad, valor total o fecha"""
+        if order_by not in CRITERIOS_TOP:
+            raise ValueError(f"Criterio de ordenación no válido: {order_by}")
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause(filters)
+                direccion = 'ASC' if ascending else 'DESC'
+                cursor.execute(
+                    "SELECT * FROM materiales" + where +
+                    f" ORDER BY {CRITERIOS_TOP[order_by]} {direccion} LIMIT ?",
+                    params + [limit]
+                )
+                return self.rows_to_materials(cursor.fetchall())
+        except Exception as e:
+            print(f"Error al obtener top de materiales: {e}")
+            return []
+    
+    def get_below_threshold(self, reorder_point, filters=None, limit=None):
+        """Obtener los materiales cuya cantidad está por debajo del punto de reorden"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause(filters)
+                query = "SELECT * FROM materiales" + where + " AND cantidad < ? ORDER BY cantidad ASC"
+                params.append(reorder_point)
+                if limit is not None:
+                    query += " LIMIT ?"
+                    params.append(limit)
+                cursor.execute(query, params)
+                return self.rows_to_materials(cursor.fetchall())
+        except Exception as e:
+            print(f"Error al obtener materiales bajo el punto de reorden: {e}")
+            return []
+    
+    def get_top_ubicaciones(self, order_by='cantidad', limit=10, filters=None):
+        """Obtener las ubicaciones con más cantidad, valor o materiales"""
+        metricas = {'cantidad': 'SUM(cantidad)', 'valor': 'SUM(valor)', 'materiales': 'COUNT(*)'}
+        if order_by not in metricas:
+            raise ValueError(f"Criterio de ordenación no válido: {order_by}")
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                where, params = self.build_where_clause(filters)
+                cursor.execute(
+                    "SELECT ubicacion, COUNT(*), SUM(cantidad), SUM(valor) FROM materiales" + where +
+                    f" GROUP BY ubicacion ORDER BY {metricas[order_by]} DESC LIMIT ?",
+                    params + [limit]
+                )
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Error al obtener top de ubicaciones: {e}")
+            return []
+    
+    def update_material(self, material_id, material_data):
+        """Actualizar un material existente"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE materiales 
+                    SET material=?, tipo=?, cantidad=?, valor=?, ubicacion=?, estado=?, fecha=?,
+                        version=version + 1
+                    WHERE id=?
+                ''', (
+                    material_data['Material'],
+                    material_data['Tipo'],
+                    material_data['Cantidad'],
+                    material_data['Valor'],
+                    material_data['Ubicacion'],
+                    material_data['Estado'],
+                    material_data['Fecha'],
+                    material_id
+                ))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error al actualizar material: {e}")
+            return False
+    
+    def _version_actual(self, cursor, material_id):
+        cursor.execute('SELECT version FROM materiales WHERE id=?', (material_id,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+    
+    def update_material_if_version(self, material_id, material_data, expected_version):
+        """Actualizar un material solo si su versión sigue siendo expected_version
+        
+        Devuelve (True, nueva versión) si se actualizó, o (False, versión
+        actual) si hubo un conflicto; la versión actual es None si el
+        material ya no existe.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE materiales
+                    SET material=?, tipo=?, cantidad=?, valor=?, ubicacion=?, estado=?, fecha=?,
+                        version=version + 1
+                    WHERE id=? AND version=?
+                    RETURNING version
+                ''', (
+                    material_data['Material'],
+                    material_data['Tipo'],
+                    material_data['Cantidad'],
+                    material_data['Valor'],
+                    material_data['Ubicacion'],
+                    material_data['Estado'],
+                    material_data['Fecha'],
+                    material_id,
+                    expected_version
+                ))
+                fila = cursor.fetchone()
+                if fila is None:
+                    return False, self._version_actual(cursor, material_id)
+                conn.commit()
+                return True, fila[0]
+        except Exception as e:
+            print(f"Error al actualizar material: {e}")
+            return False, None
+    
+    def delete_material_if_version(self, material_id, expected_version):
+        """Eliminar un material solo si su versión sigue siendo expected_version
+        
+        Devuelve (True, None) si se eliminó, o (False, versión actual) si no.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM materiales WHERE id=? AND version=?', (material_id, expected_version))
+                if cursor.rowcount == 0:
+                    return False, self._version_actual(cursor, material_id)
+                conn.commit()
+                return True, None
+        except Exception as e:
+            print(f"Error al eliminar material: {e}")
+            return False, None
+    
+    def adjust_quantity(self, material_id, delta, minimum=None):
+        """Sumar delta a la cantidad de un material de forma atómica
+        
+        La operación se hace en SQL, así que movimientos simultáneos no se
+        pisan. Con 'minimum', el ajuste se rechaza si la cantidad quedaría
+        por debajo. Devuelve (cantidad, versión) o None si el material no
+        existe o el ajuste se rechazó.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE materiales
+                    SET cantidad = cantidad + ?, version = version + 1
+                    WHERE id = ? AND (? IS NULL OR cantidad + ? >= ?)
+                    RETURNING CAST(cantidad AS REAL), version
+                ''', (float(delta), material_id, minimum, float(delta), minimum))
+                fila = cursor.fetchone()
+                conn.commit()
+                return fila
+        except Exception as e:
+            print(f"Error al ajustar cantidad: {e}")
+            return None
+    
+    def record_movement(self, material_id, tipo, cantidad, referencia='', momento=None):
+        """Registrar una entrada, salida o ajuste de stock (ver StockLedger.record)
+        
+        Devuelve (cantidad, versión) o None si el material no existe, la
+        salida dejaría stock negativo o el movimiento no es válido.
+        """
+        try:
+            return self.ledger.record(material_id, tipo, float(cantidad), referencia, momento)
+        except Exception as e:
+            print(f"Error al registrar movimiento: {e}")
+            return None
+    
+    def record_movements(self, movimientos, batch_size=1000):
+        """Registrar movimientos en lotes; devuelve {'registrados': n, 'rechazados': [...]}"""
+        try:
+            return self.ledger.record_many(movimientos, batch_size)
+        except Exception as e:
+            print(f"Error al registrar movimientos: {e}")
+            return None
+    
+    def get_movements(self, material_id, desde=None, hasta=None, limit=None):
+        try:
+            return self.ledger.movements(material_id, desde, hasta, limit)
+        except Exception as e:
+            print(f"Error al obtener movimientos: {e}")
+            return []
+    
+    def stock_at(self, material_id, momento=None):
+        """Stock de un material en una fecha o momento, o None si no existe"""
+        try:
+            return self.ledger.stock_at(material_id, momento)
+        except Exception as e:
+            print(f"Error al calcular stock: {e}")
+            return None
+    
+    def get_alerts(self, limit=None):
+        """Alertas abiertas de stock bajo y estados prolongados (ver AlertEngine)"""
+        try:
+            return self.alerts.active_alerts(limit)
+        except Exception as e:
+            print(f"Error al obtener alertas: {e}")
+            return []
+    
+    def get_alert_counts(self):
+        try:
+            return self.alerts.counts()
+        except Exception as e:
+            print(f"Error al contar alertas: {e}")
+            return {}
+    
+    def set_reorder_point(self, punto, tipo=None, material_id=None):
+        """Fijar el punto de reorden de un material, de un tipo o general (None lo quita)"""
+        try:
+            self.alerts.set_reorder_point(punto, tipo, material_id)
+            return True
+        except Exception as e:
+            print(f"Error al guardar punto de reorden: {e}")
+            return False
+    
+    def set_state_rule(self, estado, dias):
+        """Avisar de materiales con 'dias' o más en un estado (None quita la regla)"""
+        try:
+            self.alerts.set_state_rule(estado, dias)
+            return True
+        except Exception as e:
+            print(f"Error al guardar regla de estado: {e}")
+            return False
+    
+    def update_where(self, filters, changes, dry_run=False):
+        """Modificar con una sola sentencia todos los materiales que cumplen los filtros
+        
+        'changes' usa las mismas claves que los diccionarios de material
+        ('Estado', 'Ubicacion', ...). Con dry_run no se modifica nada.
+        Devuelve la lista de IDs afectados (o que se verían afectados).
+        """
+        columnas = [c for c in changes if c not in COLUMNAS_EDITABLES]
+        if columnas or not changes:
+            raise ValueError(f"Campos no modificables: {columnas or 'ninguno indicado'}")
+        where, params = self.build_where_clause(filters)
+        if dry_run:
+            return self._ids_where(where, params)
+        asignaciones = ', '.join(f"{COLUMNAS_EDITABLES[c]} = ?" for c in changes)
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"UPDATE materiales SET {asignaciones}, version = version + 1" + where + " RETURNING id",
+                    list(changes.values()) + params
+                )
+                ids = [fila[0] for fila in cursor.fetchall()]
+                conn.commit()
+                return ids
+        except Exception as e:
+            print(f"Error al actualizar materiales: {e}")
+            return []
+    
+    def delete_where(self, filters, dry_run=False):
+        """Eliminar con una sola sentencia todos los materiales que cumplen los filtros
+        
+        Exige al menos un filtro para no vaciar la tabla por accidente.
+        Devuelve la lista de IDs eliminados (o que se eliminarían con dry_run).
+        """
+        where, params = self.build_where_clause(filters)
+        if where == " WHERE 1=1":
+            raise ValueError("delete_where necesita al menos un filtro")
+        if dry_run:
+            return self._ids_where(where, params)
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM materiales" + where + " RETURNING id", params)
+                ids = [fila[0] for fila in cursor.fetchall()]
+                conn.commit()
+                return ids
+        except Exception as e:
+            print(f"Error al eliminar materiales: {e}")
+            return []
+    
+    def _ids_where(self, where, params):
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM materiales" + where, params)
+            return [fila[0] for fila in cursor.fetchall()]
+    
+    def delete_material(self, material_id):
+        """Eliminar un material"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM materiales WHERE id=?', (material_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error al eliminar material: {e}")
+            return False
+    
+    def get_statistics(self, filters=None):
+        """Obtener estadísticas de los materiales que cumplen los filtros
+        
+        Todas las agrupaciones salen de una única consulta agrupada por
+        tipo, ubicación y estado, que luego se acumula en memoria.
+        """
+        try:
+            return self.fold_statistics(self.get_statistics_cells(filters))
+        except Exception as e:
+            print(f"Error al obtener estadísticas: {e}")
+            return None
+    
+    def get_statistics_cells(self, filters=None):
+        """Totales (tipo, ubicacion, estado, count, cantidad, valor) agrupados por las tres columnas"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            where, params = self.build_where_clause(filters)
+            cursor.execute('''
+                SELECT tipo, ubicacion, estado, COUNT(*), SUM(cantidad), SUM(valor)
+                FROM materiales''' + where + '''
+                GROUP BY tipo, ubicacion, estado
+            ''', params)
+            return cursor.fetchall()
+    
+    def fold_statistics(self, celdas):
+        """Acumular las celdas de get_statistics_cells en el formato de get_statistics"""
+        # Acumular cada celda en sus agrupaciones (count, cantidad, valor)
+        total = [0, 0.0, 0.0]
+        por_tipo = {}
+        por_ubicacion = {}
+        por_estado = {}
+        tipo_ubicacion = {}
+        for tipo, ubicacion, estado, count, cantidad, valor in celdas:
+            for grupo, clave in ((por_tipo, tipo), (por_ubicacion, ubicacion),
+                                 (por_estado, estado), (tipo_ubicacion, (tipo, ubicacion))):
+                acumulado = grupo.setdefault(clave, [0, 0.0, 0.0])
+                acumulado[0] += count
+                acumulado[1] += cantidad
+                acumulado[2] += valor
+            total[0] += count
+            total[1] += cantidad
+            total[2] += valor
+        
+        def ordenar(grupo):
+            return sorted(grupo.items(), key=lambda item: str(item[0]) if item[0] is not None else '')
+        
+        if total[0]:
+            general_stats = (total[0], total[1], total[2], total[2] / total[0])
+        else:
+            general_stats = (0, None, None, None)
+        
+        return {
+            'general': general_stats,
+            'por_tipo': [(tipo, c, q, v, v / c) for tipo, (c, q, v) in ordenar(por_tipo)],
+            'por_ubicacion': [(ubicacion, c) for ubicacion, (c, q, v) in ordenar(por_ubicacion)],
+            'por_estado': [(estado, c, q, v) for estado, (c, q, v) in ordenar(por_estado)],
+            'tipo_ubicacion': [(tipo, ubicacion, c, q, v)
+                               for (tipo, ubicacion), (c, q, v) in sorted(
+                                   tipo_ubicacion.items(),
+                                   key=lambda item: (str(item[0][0]), str(item[0][1] or '')))]
+        }
+    
+    def export_to_csv(self, filename):
+        """Exportar datos a CSV
+        
+        Las filas se escriben a medida que se leen, sin cargar la tabla en memoria.
+        """
+        try:
+            with self.read_connection() as conn, open(filename, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha'])
+                writer.writerows(conn.execute(
+                    'SELECT id, material, tipo, cantidad, valor, ubicacion, estado, fecha FROM materiales'
+                    f' ORDER BY {FECHA_ORDEN_SQL} DESC'
+                ))
+            return True
+        except Exception as e:
+            print(f"Error al exportar: {e}")
+            return False
+    
+    def export_changes_since(self, seq=0, batch_size=1000):
+        """Cambios netos posteriores a 'seq' (ver ChangeJournal.export_changes_since)"""
+        return self.journal.export_changes_since(seq, batch_size)
+
+    def export_changes_to_csv(self, filename, destino='erp'):
+        """Exportar a CSV solo los cambios desde la última exportación a 'destino'
+
+        La primera exportación a un destino (o tras una purga que lo dejó
+        atrás) incluye el inventario completo. Devuelve (filas escritas,
+        última secuencia, si fue completa) o None si hubo un error.
+        """
+        try:
+            return self.journal.export_to_csv(filename, destino=destino)
+        except Exception as e:
+            print(f"Error al exportar cambios: {e}")
+            return None
+
+    def get_data_version(self):
+        """Versión de los datos: la última secuencia del diario de cambios
+
+        Solo cambia cuando se escribe en la tabla materiales; la fecha de
+        modificación de los archivos no sirve en modo WAL, porque abrir y
+        cerrar conexiones también la cambia.
+        """
+        return self.journal.current_seq()
+
+    def build_snapshot(self):
+        """Construir un ColumnarSnapshot de la tabla materiales
+        
+        Su 'origen' es la versión de los datos leída antes de la consulta:
+        si coincide con get_data_version(), el snapshot está al día.
+        """
+        # numpy solo se carga cuando se usan snapshots
+        from columnar_snapshot import ColumnarSnapshot, COLUMNAS_SQL
+        version = self.get_data_version()
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT {COLUMNAS_SQL} FROM materiales')
+            snapshot = ColumnarSnapshot.from_cursor(cursor)
+        snapshot.origen = version
+        return snapshot
+    
+    def export_snapshot(self, filename):
+        """Exportar la tabla materiales a un snapshot binario columnar"""
+        try:
+            self.build_snapshot().save(filename)
+            return True
+        except Exception as e:
+            print(f"Error al exportar snapshot: {e}")
+            return False
+
+    def load_snapshot(self, filename):
+        """Abrir un snapshot guardado si corresponde al estado actual de la base de datos
+
+        Devuelve None si no existe, está dañado o la base de datos cambió después.
+        """
+        from columnar_snapshot import ColumnarSnapshot
+        if not os.path.exists(filename):
+            return None
+        try:
+            snapshot = ColumnarSnapshot.load(filename)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot descartado ({filename}): {e}")
+            return None
+        try:
+            vigente = snapshot.origen == self.get_data_version()
+        except Exception as e:
+            print(f"Error al comprobar la versión de los datos: {e}")
+            return None
+        return snapshot if vigente else None
+
+    def vacuum(self):
+        """Compactar la base de datos y actualizar las estadísticas del planificador
+        
+        Devuelve (bytes antes, bytes después), contando el archivo WAL, o None
+        si hubo un error.
+        """
+        def tamano():
+            return sum(os.path.getsize(ruta) for ruta in (self.db_name, self.db_name + '-wal') if os.path.exists(ruta))
+        try:
+            antes = tamano()
+            with sqlite3.connect(self.db_name) as conn:
+                conn.execute('VACUUM')
+                conn.execute('PRAGMA optimize')
+                # En modo WAL el VACUUM pasa por el WAL: volcarlo y vaciarlo
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return antes, tamano()
+        except Exception as e:
+            print(f"Error al compactar la base de datos: {e}")
+            return None
+    
+    def import_from_csv(self, filename):
+        """Importar datos desde CSV"""
+        try:
+            imported_count = 0
+            with open(filename, 'r', newline='', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    material_data = {
+                        'ID': row.get('ID', ''),
+                        'Material': row['Material'],
+                        'Tipo': row['Tipo'],
+                        'Cantidad': float(row['Cantidad']),
+                        'Valor': float(row['Valor']),
+                        'Ubicacion': row.get('Ubicacion', 'No especificada'),
+                        'Estado': row.get('Estado', 'Disponible'),
+                        'Fecha': row.get('Fecha', datetime.now().strftime('%d/%m/%Y'))
+                    }
+                    if self.insert_material(material_data):
+                        imported_count += 1
+            return imported_count
+        except Exception as e:
+            print(f"Error al importar: {e}")
+            return 0
+    
+    def import_from_csv_parallel(self, filename, max_workers=None):
+        """Importar un CSV grande analizándolo en varios procesos
+        
+        Devuelve {'importados': n, 'rechazados': [(línea, motivo), ...]}.
+        """
+        # Importación diferida: multiprocessing encarece el arranque de quien no la usa
+        from importacion_paralela import importar_csv_paralelo
+        try:
+            return importar_csv_paralelo(self.db_name, filename, max_workers)
+        except Exception as e:
+            print(f"Error al importar: {e}")
+            return {'importados': 0, 'rechazados': []}
@@ -0,0 +1,839 @@
+import argparse
+import csv
+import heapq
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+
+from base_datos import DatabaseManager, COLUMNAS_ORDEN, FECHA_ORDEN_SQL
+from diario_cambios import COLUMNAS_MATERIAL, TOMBSTONE
+
+COLUMNAS_MATERIALES = 'id, material, tipo, cantidad, valor, ubicacion, estado, fecha'
+
+# Segundos tras los que una reserva de ID sin material es el resto de una inserción interrumpida
+RESERVA_CADUCADA = 60
+
+# Claves de ordenación en Python equivalentes a CRITERIOS_TOP
+CLAVES_TOP = {
+    'valor': lambda m: m['Valor'],
+    'cantidad': lambda m: m['Cantidad'],
+    'valor_total': lambda m: m['Cantidad'] * m['Valor'],
+    'fecha': lambda m: (m['Fecha'][6:10] + m['Fecha'][3:5] + m['Fecha'][0:2]) if m['Fecha'] else ''
+}
+
+# Claves de ordenación en Python equivalentes a COLUMNAS_ORDEN (con el ID como desempate)
+CLAVES_ORDEN = {
+    'ID': lambda m: (m['ID'], m['ID']),
+    'Material': lambda m: (m['Material'], m['ID']),
+    'Tipo': lambda m: (m['Tipo'], m['ID']),
+    'Cantidad': lambda m: (m['Cantidad'], m['ID']),
+    'Valor': lambda m: (m['Valor'], m['ID']),
+    'Ubicacion': lambda m: (m['Ubicacion'] or '', m['ID']),
+    'Estado': lambda m: (m['Estado'] or '', m['ID']),
+    'Fecha': lambda m: (CLAVES_TOP['fecha'](m), m['ID'])
+}
+
+
+def nombre_fragmento(ubicacion):
+    """Nombre de archivo seguro para una ubicación ('Almacén A' -> 'almacen_a')"""
+    if not ubicacion:
+        return 'sin_ubicacion'
+    texto = unicodedata.normalize('NFKD', ubicacion)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return re.sub(r'[^a-z0-9]+', '_', texto).strip('_') or 'sin_ubicacion'
+
+
+class ShardedDatabaseManager(DatabaseManager):
+    """DatabaseManager con un archivo SQLite por ubicación o grupo de ubicaciones
+
+    Las escrituras se dirigen al fragmento de la ubicación del material,
+    así que cada almacén tiene su propio bloqueo de escritura. Las lecturas
+    consultan todos los fragmentos en paralelo con un pool de hilos y
+    combinan los resultados con el mismo formato que DatabaseManager.
+
+    El catálogo (catalogo.db) guarda qué fragmento corresponde a cada
+    ubicación; 'grupos' permite asignar varias ubicaciones a un mismo
+    fragmento, por ejemplo {'exterior': ['Patio Metales', 'Patio Madera']}.
+    También registra los IDs de todos los fragmentos: una inserción reserva
+    sus IDs en el catálogo con una transacción corta antes de escribir en su
+    fragmento, así que los IDs son únicos sin bloquear a los demás almacenes.
+    """
+
+    def __init__(self, directorio='fragmentos', grupos=None, max_workers=None):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.db_name = os.path.join(directorio, 'catalogo.db')
+        self.journal = None
+        self._lecturas = threading.local()
+        self.fragmentos = {}
+        self.rutas = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.init_database()
+        for fragmento, ubicaciones in (grupos or {}).items():
+            for ubicacion in ubicaciones:
+                self.assign_location(ubicacion, fragmento)
+
+    def init_database(self):
+        """Crear el catálogo y abrir los fragmentos existentes"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fragmentos_ubicacion (
+                        ubicacion TEXT PRIMARY KEY,
+                        fragmento TEXT NOT NULL
+                    )
+                ''')
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ids_materiales'")
+                registro_nuevo = cursor.fetchone() is None
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS ids_materiales (
+                        id TEXT PRIMARY KEY,
+                        reservado REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+                cursor.execute('SELECT ubicacion, fragmento FROM fragmentos_ubicacion')
+                self.rutas = dict(cursor.fetchall())
+            for archivo in sorted(os.listdir(self.directorio)):
+                if archivo.endswith('.db') and archivo != 'catalogo.db':
+                    self.get_shard(archivo[:-3])
+            if registro_nuevo:
+                # Directorios anteriores al registro de IDs: rellenarlo con los fragmentos existentes
+                for shard in self.fragmentos.values():
+                    with sqlite3.connect(shard.db_name) as conn:
+                        self._registrar_ids(fila[0] for fila in conn.execute('SELECT id FROM materiales'))
+        except Exception as e:
+            print(f"Error al inicializar los fragmentos: {e}")
+
+    # ------------------------------------------------------------------
+    # Enrutamiento
+    # ------------------------------------------------------------------
+
+    def get_shard(self, fragmento):
+        """DatabaseManager de un fragmento, creando su archivo si no existe"""
+        shard = self.fragmentos.get(fragmento)
+        if shard is None:
+            shard = DatabaseManager(os.path.join(self.directorio, fragmento + '.db'))
+            self.fragmentos[fragmento] = shard
+        return shard
+
+    def shard_name_for(self, ubicacion):
+        """Fragmento asignado a una ubicación (por defecto, uno propio)"""
+        clave = ubicacion or ''
+        fragmento = self.rutas.get(clave)
+        if fragmento is None:
+            fragmento = nombre_fragmento(ubicacion)
+            self.assign_location(ubicacion, fragmento)
+        return fragmento
+
+    def shard_for(self, ubicacion):
+        return self.get_shard(self.shard_name_for(ubicacion))
+
+    def assign_location(self, ubicacion, fragmento):
+        """Registrar en el catálogo el fragmento de una ubicación (sin mover datos)"""
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute('''
+                INSERT INTO fragmentos_ubicacion (ubicacion, fragmento) VALUES (?, ?)
+                ON CONFLICT(ubicacion) DO UPDATE SET fragmento = excluded.fragmento
+            ''', (ubicacion or '', fragmento))
+            conn.commit()
+        self.rutas[ubicacion or ''] = fragmento
+        self.get_shard(fragmento)
+
+    def _en_paralelo(self, funcion):
+        """Ejecutar funcion(shard) en todos los fragmentos y devolver sus resultados"""
+        if getattr(self._lecturas, 'conexiones', None) is not None:
+            # Dentro de read_snapshot: las conexiones de la vista solo sirven en este hilo
+            return [funcion(shard) for shard in list(self.fragmentos.values())]
+        return list(self.executor.map(funcion, list(self.fragmentos.values())))
+
+    def _buscar_shard(self, material_id):
+        """Fragmento que contiene un ID (consulta por clave primaria en cada uno)"""
+        def contiene(shard):
+            with sqlite3.connect(shard.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1 FROM materiales WHERE id = ?', (material_id,))
+                return cursor.fetchone() is not None
+        for shard, encontrado in zip(list(self.fragmentos.values()), self._en_paralelo(contiene)):
+            if encontrado:
+                return shard
+        return None
+
+    def _ids_existentes(self, ids):
+        """IDs de la lista que ya existen en algún fragmento"""
+        ids = list(ids)
+        if not ids:
+            return set()
+
+        def buscar(shard):
+            encontrados = set()
+            with sqlite3.connect(shard.db_name) as conn:
+                cursor = conn.cursor()
+                for inicio in range(0, len(ids), 500):
+                    parte = ids[inicio:inicio + 500]
+                    cursor.execute(f"SELECT id FROM materiales WHERE id IN ({', '.join('?' * len(parte))})", parte)
+                    encontrados.update(fila[0] for fila in cursor.fetchall())
+            return encontrados
+        return set().union(*self._en_paralelo(buscar))
+
+    def _reservar_ids(self, ids):
+        """Reservar IDs en el registro del catálogo
+
+        Devuelve el conjunto de IDs repetidos o ya existentes; si no está
+        vacío, no se reserva ninguno.
+        """
+        repetidos = {i for i, n in Counter(ids).items() if n > 1}
+        if repetidos:
+            return repetidos
+        ahora = time.time()
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            existentes = {}
+            for inicio in range(0, len(ids), 500):
+                parte = ids[inicio:inicio + 500]
+                cursor.execute(f"SELECT id, reservado FROM ids_materiales WHERE id IN ({', '.join('?' * len(parte))})",
+                               parte)
+                existentes.update(cursor.fetchall())
+            # Una reserva antigua sin material en ningún fragmento quedó de una inserción interrumpida
+            antiguas = [i for i, reservado in existentes.items() if reservado < ahora - RESERVA_CADUCADA]
+            ocupados = set(existentes) - (set(antiguas) - self._ids_existentes(antiguas))
+            if ocupados:
+                conn.rollback()
+                return ocupados
+            cursor.executemany('INSERT OR REPLACE INTO ids_materiales (id, reservado) VALUES (?, ?)',
+                               [(material_id, ahora) for material_id in ids])
+            conn.commit()
+        return set()
+
+    def _registrar_ids(self, ids):
+        """Anotar en el registro IDs que ya están escritos en un fragmento"""
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executemany('INSERT OR IGNORE INTO ids_materiales (id, reservado) VALUES (?, ?)',
+                             ((material_id, time.time()) for material_id in ids))
+            conn.commit()
+
+    def _liberar_ids(self, ids):
+        """Quitar del registro los IDs de materiales eliminados o que no llegaron a insertarse"""
+        with sqlite3.connect(self.db_name) as conn:
+            conn.executemany('DELETE FROM ids_materiales WHERE id = ?', ((material_id,) for material_id in ids))
+            conn.commit()
+
+    # ------------------------------------------------------------------
+    # Escrituras
+    # ------------------------------------------------------------------
+
+    def insert_material(self, material_data):
+        """Insertar un material en el fragmento de su ubicación si su ID no existe en ningún fragmento"""
+        try:
+            if self._reservar_ids([material_data['ID']]):
+                print(f"Error al insertar material: el ID {material_data['ID']} ya existe")
+                return False
+        except Exception as e:
+            print(f"Error al insertar material: {e}")
+            return False
+        if self.shard_for(material_data['Ubicacion']).insert_material(material_data):
+            return True
+        self._liberar_ids([material_data['ID']])
+        return False
+
+    def insert_materials(self, materials):
+        """Insertar varios materiales con una transacción por fragmento (cada una todo o nada)
+
+        Si algún ID se repite o ya existe en cualquier fragmento no se inserta ninguno.
+        """
+        ids = [material_data['ID'] for material_data in materials]
+        try:
+            repetidos = self._reservar_ids(ids)
+        except Exception as e:
+            print(f"Error al insertar materiales: {e}")
+            return 0
+        if repetidos:
+            print(f"Error al insertar materiales: IDs ya existentes o repetidos: {', '.join(sorted(repetidos)[:10])}")
+            return 0
+        por_fragmento = {}
+        for material_data in materials:
+            por_fragmento.setdefault(self.shard_name_for(material_data['Ubicacion']), []).append(material_data)
+        insertados = 0
+        for fragmento, lote in por_fragmento.items():
+            n = self.get_shard(fragmento).insert_materials(lote)
+            if n:
+                insertados += n
+            else:
+                self._liberar_ids([material_data['ID'] for material_data in lote])
+        return insertados
+
+    def update_material(self, material_id, material_data):
+        """Actualizar un material; si cambia de fragmento, se mueve conservando su versión"""
+        try:
+            origen = self._buscar_shard(material_id)
+            if origen is None:
+                return False
+            destino = self.shard_for(material_data['Ubicacion'])
+            if destino is origen:
+                return origen.update_material(material_id, material_data)
+            while True:
+                version = self._version_en(origen, material_id)
+                if version is None:
+                    return False
+                ok, actual = self._trasladar(origen, destino, material_id, material_data, version)
+                # Solo se reintenta si otra escritura cambió la versión mientras tanto
+                if ok or actual is None or actual == version:
+                    return ok
+        except Exception as e:
+            print(f"Error al actualizar material: {e}")
+            return False
+
+    def delete_material(self, material_id):
+        """Eliminar un material del fragmento que lo contiene"""
+        try:
+            shard = self._buscar_shard(material_id)
+            if shard is None or not shard.delete_material(material_id):
+                return False
+            self._liberar_ids([material_id])
+            return True
+        except Exception as e:
+            print(f"Error al eliminar material: {e}")
+            return False
+
+    def update_material_if_version(self, material_id, material_data, expected_version):
+        origen = self._buscar_shard(material_id)
+        if origen is None:
+            return False, None
+        destino = self.shard_for(material_data['Ubicacion'])
+        if destino is origen:
+            return origen.update_material_if_version(material_id, material_data, expected_version)
+        return self._trasladar(origen, destino, material_id, material_data, expected_version)
+
+    def _trasladar(self, origen, destino, material_id, material_data, expected_version):
+        """Mover un material a otro fragmento si su versión sigue siendo expected_version
+
+        Se copia al destino antes de borrar, para no perder el material si
+        algo falla. La versión sigue creciendo en el destino, igual que en
+        una actualización sin traslado. Devuelve lo mismo que
+        update_material_if_version.
+        """
+        version_actual = self._version_en(origen, material_id)
+        if version_actual != expected_version:
+            return False, version_actual
+        if not destino.insert_material(dict(material_data, ID=material_id), expected_version + 1):
+            return False, version_actual
+        self._mover_movimientos(origen, destino, material_id)
+        # El borrado condicional decide si alguien lo modificó mientras tanto
+        ok, version_actual = origen.delete_material_if_version(material_id, expected_version)
+        if not ok:
+            self._mover_movimientos(destino, origen, material_id)
+            destino.delete_material(material_id)
+            return False, version_actual
+        return True, expected_version + 1
+
+    def _version_en(self, shard, material_id):
+        with sqlite3.connect(shard.db_name) as conn:
+            return shard._version_actual(conn.cursor(), material_id)
+
+    def delete_material_if_version(self, material_id, expected_version):
+        shard = self._buscar_shard(material_id)
+        if shard is None:
+            return False, None
+        ok, version_actual = shard.delete_material_if_version(material_id, expected_version)
+        if ok:
+            self._liberar_ids([material_id])
+        return ok, version_actual
+
+    def adjust_quantity(self, material_id, delta, minimum=None):
+        shard = self._buscar_shard(material_id)
+        return shard.adjust_quantity(material_id, delta, minimum) if shard is not None else None
+
+    def record_movement(self, material_id, tipo, cantidad, referencia='', momento=None):
+        shard = self._buscar_shard(material_id)
+        return shard.record_movement(material_id, tipo, cantidad, referencia, momento) if shard is not None else None
+
+    def record_movements(self, movimientos, batch_size=1000):
+        """Repartir los movimientos por fragmento y registrarlos en lotes en cada uno"""
+        por_fragmento = {}
+        shards = {}
+        rechazados = []
+        for posicion, movimiento in enumerate(movimientos):
+            material_id = movimiento.get('ID')
+            if material_id not in shards:
+                shards[material_id] = self._buscar_shard(material_id)
+            if shards[material_id] is None:
+                rechazados.append((posicion, "material inexistente o stock insuficiente"))
+                continue
+            por_fragmento.setdefault(shards[material_id], []).append((posicion, movimiento))
+        registrados = 0
+        for shard, lista in por_fragmento.items():
+            resultado = shard.record_movements([movimiento for _, movimiento in lista], batch_size)
+            if resultado is None:
+                return None
+            registrados += resultado['registrados']
+            # Traducir a posiciones de la lista original
+            rechazados.extend((lista[i][0], motivo) for i, motivo in resultado['rechazados'])
+        return {'registrados': registrados, 'rechazados': sorted(rechazados)}
+
+    def get_movements(self, material_id, desde=None, hasta=None, limit=None):
+        shard = self._buscar_shard(material_id)
+        return shard.get_movements(material_id, desde, hasta, limit) if shard is not None else []
+
+    def stock_at(self, material_id, momento=None):
+        shard = self._buscar_shard(material_id)
+        return shard.stock_at(material_id, momento) if shard is not None else None
+
+    def fuzzy_search_names(self, texto, limit=10):
+        """Nombres parecidos en todos los fragmentos, sumando los materiales de cada nombre"""
+        combinados = {}
+        for parcial in self._en_paralelo(lambda shard: shard.fuzzy_search_names(texto, limit)):
+            for nombre, similitud, filas in parcial:
+                anterior = combinados.get(nombre, (similitud, 0))
+                combinados[nombre] = (similitud, anterior[1] + filas)
+        ordenados = sorted(combinados.items(), key=lambda par: (-par[1][0], -par[1][1], par[0]))
+        return [(nombre, similitud, filas) for nombre, (similitud, filas) in ordenados[:limit]]
+
+    def suggest_names(self, prefijo, limit=8):
+        sugerencias = []
+        for parcial in self._en_paralelo(lambda shard: shard.suggest_names(prefijo, limit)):
+            sugerencias.extend(nombre for nombre in parcial if nombre not in sugerencias)
+        return sorted(sugerencias, key=str.casefold)[:limit]
+
+    def search_materials_fuzzy(self, search_text, tipo_filter='Todos', estado_filter='Todos',
+                               limit=None, max_names=10, min_similarity=0.5):
+        orden = {nombre: i for i, (nombre, similitud, _) in enumerate(self.fuzzy_search_names(search_text, max_names))
+                 if similitud >= min_similarity}
+        materiales = []
+        for parcial in self._en_paralelo(lambda shard: shard.search_materials_fuzzy(
+                search_text, tipo_filter, estado_filter, None, max_names, min_similarity)):
+            materiales.extend(m for m in parcial if m['Material'] in orden)
+        materiales.sort(key=lambda m: orden[m['Material']])
+        return materiales if limit is None else materiales[:limit]
+
+    def get_alerts(self, limit=None):
+        """Alertas de todos los fragmentos, las más antiguas primero"""
+        alertas = []
+        for parcial in self._en_paralelo(lambda shard: shard.get_alerts(limit)):
+            alertas.extend(parcial)
+        alertas.sort(key=lambda alerta: alerta['Desde'])
+        return alertas if limit is None else alertas[:limit]
+
+    def get_alert_counts(self):
+        totales = {}
+        for parcial in self._en_paralelo(lambda shard: shard.get_alert_counts()):
+            for regla, n in parcial.items():
+                totales[regla] = totales.get(regla, 0) + n
+        return totales
+
+    def set_reorder_point(self, punto, tipo=None, material_id=None):
+        if material_id is not None:
+            shard = self._buscar_shard(material_id)
+            return shard.set_reorder_point(punto, tipo, material_id) if shard is not None else False
+        # Las reglas por tipo y generales se guardan en todos los fragmentos
+        return all(self._en_paralelo(lambda shard: shard.set_reorder_point(punto, tipo)))
+
+    def set_state_rule(self, estado, dias):
+        return all(self._en_paralelo(lambda shard: shard.set_state_rule(estado, dias)))
+
+    def _trasladar_movimientos(self, cursor, condicion, params):
+        """Pasar al fragmento adjunto 'destino' el libro y las reglas de los materiales que cumplen la condición
+
+        Los movimientos reciben secuencias nuevas en el destino conservando
+        su orden; los saldos de control se descartan y se regeneran allí.
+        """
+        materiales = f'SELECT id FROM main.materiales WHERE {condicion}'
+        cursor.execute(f'''
+            INSERT INTO destino.movimientos (id, tipo, cantidad, momento, referencia)
+            SELECT id, tipo, cantidad, momento, referencia FROM main.movimientos
+            WHERE id IN ({materiales}) ORDER BY seq
+        ''', params)
+        cursor.execute(f'DELETE FROM main.movimientos WHERE id IN ({materiales})', params)
+        cursor.execute(f'DELETE FROM main.saldos_control WHERE id IN ({materiales})', params)
+        # El punto de reorden propio del material también viaja con él
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO destino.reglas_reorden (ambito, clave, punto)
+            SELECT ambito, clave, punto FROM main.reglas_reorden
+            WHERE ambito = 'material' AND clave IN ({materiales})
+        ''', params)
+        cursor.execute(f"DELETE FROM main.reglas_reorden WHERE ambito = 'material' AND clave IN ({materiales})", params)
+
+    def _mover_movimientos(self, origen, destino, material_id):
+        """Llevar el libro de un material que cambia de fragmento (antes de borrarlo del origen)"""
+        with sqlite3.connect(origen.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('ATTACH DATABASE ? AS destino', (destino.db_name,))
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                self._trasladar_movimientos(cursor, 'id = ?', (material_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.execute('DETACH DATABASE destino')
+
+    def update_where(self, filters, changes, dry_run=False):
+        ids = []
+        for parcial in self._en_paralelo(lambda shard: shard.update_where(filters, changes, dry_run)):
+            ids.extend(parcial)
+        if 'Ubicacion' in changes and ids and not dry_run:
+            # Llevar las filas modificadas al fragmento de su nueva ubicación
+            self.rebalance(changes['Ubicacion'], self.shard_name_for(changes['Ubicacion']))
+        return ids
+
+    def delete_where(self, filters, dry_run=False):
+        ids = []
+        for parcial in self._en_paralelo(lambda shard: shard.delete_where(filters, dry_run)):
+            ids.extend(parcial)
+        if ids and not dry_run:
+            self._liberar_ids(ids)
+        return ids
+
+    def import_from_csv_parallel(self, filename, max_workers=None):
+        """Importar un CSV enrutando cada fila a su fragmento"""
+        return {'importados': self.import_from_csv(filename), 'rechazados': []}
+
+    # ------------------------------------------------------------------
+    # Lecturas combinadas
+    # ------------------------------------------------------------------
+
+    def has_materials(self):
+        return any(self._en_paralelo(lambda shard: shard.has_materials()))
+
+    def _combinar_por_fecha(self, resultados):
+        """Combinar listas ya ordenadas por fecha DESC (mismo orden que SQL)"""
+        return list(heapq.merge(*resultados, key=CLAVES_TOP['fecha'], reverse=True))
+
+    def get_all_materials(self):
+        return self._combinar_por_fecha(self._en_paralelo(lambda shard: shard.get_all_materials()))
+
+    def get_material(self, material_id):
+        encontrados = [m for m in self._en_paralelo(lambda shard: shard.get_material(material_id)) if m is not None]
+        return encontrados[0] if encontrados else None
+
+    def get_materials_page(self, filters=None, limit=50, after_id=None):
+        # Misma idea que get_materials_sorted, ordenando por ID
+        paginas = self._en_paralelo(lambda shard: shard.get_materials_page(filters, limit, after_id))
+        combinados = list(heapq.merge(*(materiales for materiales, _ in paginas), key=lambda m: m['ID']))
+        quedan = any(siguiente is not None for _, siguiente in paginas)
+        if len(combinados) > limit or (combinados and quedan):
+            combinados = combinados[:limit]
+            return combinados, combinados[-1]['ID']
+        return combinados, None
+
+    def search_materials(self, search_text='', tipo_filter='Todos', estado_filter='Todos', limit=None):
+        combinados = self._combinar_por_fecha(self._en_paralelo(
+            lambda shard: shard.search_materials(search_text, tipo_filter, estado_filter, limit)))
+        return combinados if limit is None else combinados[:limit]
+
+    def get_top_materials(self, order_by='valor', limit=20, filters=None, ascending=False):
+        if order_by not in CLAVES_TOP:
+            raise ValueError(f"Criterio de ordenación no válido: {order_by}")
+        # Cada fragmento aporta su propio top; el top global está entre ellos
+        parciales = self._en_paralelo(lambda shard: shard.get_top_materials(order_by, limit, filters, ascending))
+        combinados = heapq.merge(*parciales, key=CLAVES_TOP[order_by], reverse=not ascending)
+        return [material for _, material in zip(range(limit), combinados)]
+
+    def get_materials_sorted(self, filters=None, order_by='Fecha', descending=False, limit=50, after=None):
+        if order_by not in COLUMNAS_ORDEN:
+            raise ValueError(f"Columna de ordenación no válida: {order_by}")
+        # Con el mismo cursor cada fragmento devuelve su siguiente página; la global está entre ellas
+        paginas = self._en_paralelo(
+            lambda shard: shard.get_materials_sorted(filters, order_by, descending, limit, after))
+        clave = CLAVES_ORDEN[order_by]
+        combinados = list(heapq.merge(*(materiales for materiales, _ in paginas), key=clave, reverse=descending))
+        quedan = any(siguiente is not None for _, siguiente in paginas)
+        if len(combinados) > limit or (combinados and quedan):
+            combinados = combinados[:limit]
+            return combinados, clave(combinados[-1])
+        return combinados, None
+
+    def get_below_threshold(self, reorder_point, filters=None, limit=None):
+        parciales = self._en_paralelo(lambda shard: shard.get_below_threshold(reorder_point, filters, limit))
+        combinados = list(heapq.merge(*parciales, key=lambda m: m['Cantidad']))
+        return combinados if limit is None else combinados[:limit]
+
+    def get_top_ubicaciones(self, order_by='cantidad', limit=10, filters=None):
+        posiciones = {'materiales': 1, 'cantidad': 2, 'valor': 3}
+        if order_by not in posiciones:
+            raise ValueError(f"Criterio de ordenación no válido: {order_by}")
+        # Sin límite por fragmento: una ubicación puede repartirse tras un rebalanceo
+        totales = {}
+        for parcial in self._en_paralelo(lambda shard: shard.get_top_ubicaciones(order_by, -1, filters)):
+            for ubicacion, count, cantidad, valor in parcial:
+                acumulado = totales.setdefault(ubicacion, [0, 0.0, 0.0])
+                acumulado[0] += count
+                acumulado[1] += cantidad or 0
+                acumulado[2] += valor or 0
+        filas = [(ubicacion, c, q, v) for ubicacion, (c, q, v) in totales.items()]
+        filas.sort(key=lambda fila: fila[posiciones[order_by]], reverse=True)
+        return filas[:limit]
+
+    def get_statistics_cells(self, filters=None):
+        celdas = []
+        for parcial in self._en_paralelo(lambda shard: shard.get_statistics_cells(filters)):
+            celdas.extend(parcial)
+        return celdas
+
+    def build_snapshot(self):
+        """Un único ColumnarSnapshot con los materiales de todos los fragmentos"""
+        from columnar_snapshot import ColumnarSnapshot
+        snapshot = ColumnarSnapshot()
+        snapshot.origen = self.get_data_version()
+        for shard in list(self.fragmentos.values()):
+            with sqlite3.connect(shard.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT {COLUMNAS_MATERIALES} FROM materiales')
+                while True:
+                    filas = cursor.fetchmany(10000)
+                    if not filas:
+                        break
+                    snapshot.apply_changes(filas)
+        return snapshot
+
+    def export_to_csv(self, filename):
+        """Exportar a CSV los materiales de todos los fragmentos, más recientes primero
+
+        Cada fragmento se lee ya ordenado y se combinan a medida que se escriben.
+        """
+        conexiones = []
+        try:
+            cursores = []
+            for shard in list(self.fragmentos.values()):
+                conexiones.append(sqlite3.connect(shard.db_name))
+                cursores.append(conexiones[-1].execute(
+                    f'SELECT {COLUMNAS_MATERIALES} FROM materiales ORDER BY {FECHA_ORDEN_SQL} DESC'))
+            with open(filename, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha'])
+                writer.writerows(heapq.merge(*cursores, key=lambda fila: CLAVES_TOP['fecha']({'Fecha': fila[7]}),
+                                             reverse=True))
+            return True
+        except Exception as e:
+            print(f"Error al exportar: {e}")
+            return False
+        finally:
+            for conn in conexiones:
+                conn.close()
+
+    def vacuum(self):
+        resultados = [shard.vacuum() for shard in list(self.fragmentos.values())]
+        if any(resultado is None for resultado in resultados):
+            return None
+        return sum(antes for antes, _ in resultados), sum(despues for _, despues in resultados)
+
+    @contextmanager
+    def read_snapshot(self):
+        """Fijar una vista de solo lectura de cada fragmento
+
+        Dentro del bloque, las consultas de este hilo recorren los fragmentos
+        en el mismo hilo (las conexiones de SQLite no se comparten entre
+        hilos) y cada uno ve su propia vista fija. Las vistas se abren una
+        tras otra, así que no son un único instante entre fragmentos.
+        Devuelve un diccionario {fragmento: conexión}.
+        """
+        conexiones = getattr(self._lecturas, 'conexiones', None)
+        if conexiones is not None:
+            yield conexiones
+            return
+        with ExitStack() as pila:
+            conexiones = {nombre: pila.enter_context(shard.read_snapshot())
+                          for nombre, shard in list(self.fragmentos.items())}
+            self._lecturas.conexiones = conexiones
+            try:
+                yield conexiones
+            finally:
+                self._lecturas.conexiones = None
+
+    def get_data_version(self):
+        # Las secuencias de cada diario solo crecen: la suma cambia con cualquier escritura
+        return sum(shard.get_data_version() for shard in self.fragmentos.values())
+
+    def _sin_traslados(self, cambios, batch_size):
+        """Quitar los borrados de materiales que solo pasaron a otro fragmento
+
+        Un traslado deja un borrado en el diario del origen y un alta en el
+        del destino; el borrado no debe llegar a quien sincroniza.
+        """
+        while True:
+            lote = list(islice(cambios, batch_size))
+            if not lote:
+                break
+            trasladados = self._ids_existentes(m['ID'] for _, operacion, m in lote if operacion == TOMBSTONE)
+            for cambio in lote:
+                if cambio[1] != TOMBSTONE or cambio[2]['ID'] not in trasladados:
+                    yield cambio
+
+    def export_changes_since(self, seq=None, batch_size=1000):
+        """Cambios netos de todos los fragmentos, un diario por fragmento
+
+        'seq' es un diccionario {fragmento: secuencia} (los que faltan
+        empiezan desde 0). Produce tuplas ((fragmento, secuencia),
+        operacion, material), en orden de secuencia dentro de cada fragmento.
+        Lanza ValueError si algún diario se purgó después de su secuencia.
+        """
+        seq = seq or {}
+        # Las purgas se comprueban aquí, antes de empezar a recorrer
+        recorridos = [(nombre, shard.export_changes_since(seq.get(nombre, 0), batch_size))
+                      for nombre, shard in list(self.fragmentos.items())]
+        return self._recorrer_fragmentos(recorridos, batch_size)
+
+    def _recorrer_fragmentos(self, recorridos, batch_size):
+        for nombre, cambios in recorridos:
+            for seq_cambio, operacion, material in self._sin_traslados(cambios, batch_size):
+                yield (nombre, seq_cambio), operacion, material
+
+    def export_changes_to_csv(self, filename, destino='erp', batch_size=1000):
+        """Exportar a un CSV los cambios de todos los fragmentos desde la última exportación a 'destino'
+
+        Cada fragmento guarda su propio punto de control, y la columna
+        'Fragmento' indica a qué diario pertenece cada 'Secuencia'. Devuelve
+        (filas escritas, {fragmento: última secuencia}, si algún fragmento
+        se exportó completo) o None si hubo un error.
+        """
+        try:
+            ultimas = {}
+            completa = False
+            filas = 0
+            with open(filename, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Secuencia', 'Operacion'] + COLUMNAS_MATERIAL + ['Fragmento'])
+                for nombre, shard in list(self.fragmentos.items()):
+                    cambios, ultima, completa_fragmento = shard.journal.pending_changes(
+                        destino=destino, batch_size=batch_size)
+                    completa = completa or completa_fragmento
+                    for seq_cambio, operacion, material in self._sin_traslados(cambios, batch_size):
+                        writer.writerow([seq_cambio, operacion] +
+                                        [material.get(c, '') for c in COLUMNAS_MATERIAL] + [nombre])
+                        ultima = max(ultima, seq_cambio)
+                        filas += 1
+                    ultimas[nombre] = ultima
+            # Los puntos de control solo avanzan si se escribió el archivo completo
+            for nombre, ultima in ultimas.items():
+                self.fragmentos[nombre].journal.set_checkpoint(destino, ultima)
+            return filas, ultimas, completa
+        except Exception as e:
+            print(f"Error al exportar cambios: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Rebalanceo
+    # ------------------------------------------------------------------
+
+    def rebalance(self, ubicacion, fragmento):
+        """Mover todos los materiales de una ubicación a otro fragmento
+
+        Se usa ATTACH para copiar y borrar en una transacción por fragmento
+        de origen; si se interrumpe, repetir el movimiento es seguro. Cada
+        material conserva su versión incrementada, como en cualquier otra
+        modificación. Devuelve el número de materiales movidos.
+        """
+        destino = self.get_shard(fragmento)
+        movidos = 0
+        # Apuntar primero la nueva ruta para que las escrituras nuevas vayan al destino
+        self.assign_location(ubicacion, fragmento)
+        for nombre, shard in list(self.fragmentos.items()):
+            if shard is destino:
+                continue
+            with sqlite3.connect(shard.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute('ATTACH DATABASE ? AS destino', (destino.db_name,))
+                try:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    # OR REPLACE: un movimiento interrumpido se puede repetir
+                    cursor.execute(f'''
+                        INSERT OR REPLACE INTO destino.materiales ({COLUMNAS_MATERIALES}, version)
+                        SELECT {COLUMNAS_MATERIALES}, version + 1 FROM main.materiales WHERE ubicacion IS ?
+                    ''', (ubicacion,))
+                    self._trasladar_movimientos(cursor, 'ubicacion IS ?', (ubicacion,))
+                    cursor.execute('DELETE FROM main.materiales WHERE ubicacion IS ?', (ubicacion,))
+                    movidos += cursor.rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.execute('DETACH DATABASE destino')
+        return movidos
+
+    def split_database(self, db_origen, tamano_lote=10000):
+        """Repartir una base de datos sin fragmentar entre los fragmentos por ubicación
+
+        Los materiales conservan su versión (las bases de datos anteriores al
+        control de versiones empiezan en 1).
+        """
+        repartidos = 0
+        with sqlite3.connect(db_origen) as conn:
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA table_info(materiales)')
+            version = 'version' if 'version' in [columna[1] for columna in cursor.fetchall()] else '1'
+            cursor.execute(f'SELECT {COLUMNAS_MATERIALES}, {version} FROM materiales ORDER BY ubicacion')
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                por_fragmento = {}
+                for fila in filas:
+                    por_fragmento.setdefault(self.shard_name_for(fila[5]), []).append(fila)
+                for fragmento, lote in por_fragmento.items():
+                    with sqlite3.connect(self.get_shard(fragmento).db_name) as destino:
+                        cursor_destino = destino.cursor()
+                        cursor_destino.executemany(f'''
+                            INSERT OR IGNORE INTO materiales ({COLUMNAS_MATERIALES}, version)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', lote)
+                        repartidos += cursor_destino.rowcount
+                        destino.commit()
+                    self._registrar_ids(fila[0] for fila in lote)
+        return repartidos
+
+    def shard_sizes(self):
+        """Número de materiales por fragmento"""
+        def contar(shard):
+            with sqlite3.connect(shard.db_name) as conn:
+                return conn.execute('SELECT COUNT(*) FROM materiales').fetchone()[0]
+        return dict(zip(list(self.fragmentos.keys()), self._en_paralelo(contar)))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for shard in self.fragmentos.values():
+            shard.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Administrar la base de datos fragmentada por ubicación")
+    parser.add_argument('--dir', default='fragmentos', help="Directorio de los fragmentos")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    subparsers.add_parser('listar', help="Mostrar fragmentos, ubicaciones y tamaños")
+    repartir = subparsers.add_parser('repartir', help="Repartir una base de datos existente por ubicación")
+    repartir.add_argument('origen', help="Base de datos sin fragmentar (p. ej. materiales.db)")
+    mover = subparsers.add_parser('mover', help="Mover una ubicación a otro fragmento")
+    mover.add_argument('ubicacion')
+    mover.add_argument('fragmento')
+    args = parser.parse_args(argv)
+
+    manager = ShardedDatabaseManager(args.dir)
+    try:
+        if args.comando == 'repartir':
+            print(f"{manager.split_database(args.origen)} materiales repartidos")
+        elif args.comando == 'mover':
+            print(f"{manager.rebalance(args.ubicacion, args.fragmento)} materiales movidos a {args.fragmento}")
+        tamanos = manager.shard_sizes()
+        for fragmento in sorted(tamanos):
+            ubicaciones = sorted(u for u, f in manager.rutas.items() if f == fragmento)
+            print(f"{fragmento}: {tamanos[fragmento]} materiales ({', '.join(ubicaciones) or '-'})")
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        manager.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
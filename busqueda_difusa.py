@@ -0,0 +1,290 @@
+import heapq
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain, islice
+
+# Palabras del vocabulario que puede sustituir una palabra mal escrita de la consulta
+MAX_VARIANTES = 3
+SIMILITUD_MINIMA_PALABRA = 0.5
+
+# Si la palabra más rara de la consulta aparece en más nombres que estos,
+# se cruzan con las siguientes palabras antes de puntuarlos
+MAX_CANDIDATOS = 300
+
+# Con consultas muy genéricas (una palabra común) se puntúa como mucho esta muestra
+MAX_PUNTUADOS = 500
+
+# Claves que se revisan como máximo para ordenar sugerencias por uso
+MAX_ESCANEO_PREFIJO = 200
+
+
+def normalizar(texto):
+    """Minúsculas sin tildes y con un solo espacio entre palabras ('Batería  12V' -> 'bateria 12v')"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texto).split())
+
+
+def trigramas(normalizado):
+    """Trigramas de cada palabra con relleno ('sal' -> '  s', ' sa', 'sal', 'al ')"""
+    resultado = set()
+    for palabra in normalizado.split():
+        palabra = f'  {palabra} '
+        resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return resultado
+
+
+def instalar_tabla_nombres(cursor):
+    """Crear la tabla de nombres distintos y los triggers que la mantienen
+
+    Cada fila guarda cuántos materiales usan un nombre y una secuencia que
+    avanza con cada cambio, así que los índices en memoria se ponen al día
+    leyendo solo lo cambiado. Los nombres que dejan de usarse se quedan con
+    filas = 0 para que los índices se enteren de su desaparición.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='nombres_materiales'")
+    existia = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS nombres_materiales (
+            nombre TEXT PRIMARY KEY,
+            filas INTEGER NOT NULL,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_nombres_materiales_seq ON nombres_materiales (seq)')
+    if not existia:
+        cursor.execute('''
+            INSERT INTO nombres_materiales (nombre, filas, seq)
+            SELECT material, COUNT(*), ROW_NUMBER() OVER () FROM materiales GROUP BY material
+        ''')
+    siguiente = '(SELECT COALESCE(MAX(seq), 0) + 1 FROM nombres_materiales)'
+    sumar = f'''
+        INSERT INTO nombres_materiales (nombre, filas, seq) VALUES (NEW.material, 1, {siguiente})
+        ON CONFLICT(nombre) DO UPDATE SET filas = filas + 1, seq = excluded.seq;
+    '''
+    restar = f'''
+        UPDATE nombres_materiales SET filas = filas - 1, seq = {siguiente} WHERE nombre = OLD.material;
+    '''
+    cursor.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS nombres_materiales_insert
+        AFTER INSERT ON materiales BEGIN {sumar} END;
+
+        CREATE TRIGGER IF NOT EXISTS nombres_materiales_update
+        AFTER UPDATE OF material ON materiales WHEN OLD.material IS NOT NEW.material
+        BEGIN {restar} {sumar} END;
+
+        CREATE TRIGGER IF NOT EXISTS nombres_materiales_delete
+        AFTER DELETE ON materiales BEGIN {restar} END;
+    ''')
+
+
+class NameIndex:
+    """Índices en memoria de los nombres de material: palabras, trigramas y prefijos
+
+    - Búsqueda difusa: cada palabra de la consulta se busca en el
+      vocabulario (exacta o, si no existe, por trigramas, que solo indexan
+      palabras distintas); los nombres candidatos salen de las listas de
+      las palabras más raras y se puntúan por las palabras que comparten.
+    - Autocompletado: lista ordenada de nombres normalizados (un trie
+      aplanado) donde un prefijo es un rango que se encuentra con bisect.
+
+    Se construye la primera vez que se usa y después se pone al día en cada
+    consulta leyendo de 'nombres_materiales' solo los nombres cambiados,
+    incluidos los que escribieron otros procesos.
+    """
+
+    def __init__(self, db_name='materiales.db'):
+        self.db_name = db_name
+        self.seq = None
+        self.nombres = []            # nid -> nombre original
+        self.filas = array('l')      # nid -> materiales que lo usan (0 = sin uso)
+        self.nids = {}               # nombre original -> nid
+        self.por_clave = {}          # nombre normalizado -> [nid]
+        self.claves = []             # nombres normalizados, ordenados y sin repetir
+        self.palabras = {}           # palabra -> wid
+        self.vocabulario = []        # wid -> palabra
+        self.nids_palabra = []       # wid -> array de nids que la contienen
+        self.trigramas_palabra = {}  # trigrama -> array de wids
+        self.palabras_nid = array('l')   # wids de todos los nombres, seguidos
+        self.inicio_nid = array('l', [0])  # nid -> posición de sus wids en palabras_nid
+        self._bloqueo = threading.Lock()
+        self._conn = None
+        self._version_datos = None
+
+    @property
+    def ready(self):
+        """Si el índice ya se construyó (la primera construcción puede tardar con muchos nombres)"""
+        return self.seq is not None
+
+    def refresh(self):
+        """Construir o poner al día el índice (p. ej. en segundo plano al arrancar)"""
+        with self._bloqueo:
+            self._sincronizar()
+
+    def close(self):
+        with self._bloqueo:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _sincronizar(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        cursor = self._conn.cursor()
+        # data_version solo cambia cuando otra conexión confirma una escritura
+        cursor.execute('PRAGMA data_version')
+        version = cursor.fetchone()[0]
+        if version == self._version_datos and self.seq is not None:
+            return
+        self._version_datos = version
+        cursor.execute('SELECT nombre, filas, seq FROM nombres_materiales WHERE seq > ? ORDER BY seq',
+                       (self.seq or 0,))
+        nuevas = []
+        for nombre, filas, seq in cursor.fetchall():
+            self._aplicar(nombre, filas, nuevas)
+            self.seq = seq
+        if self.seq is None:
+            self.seq = 0
+        # Pocas claves nuevas se insertan en su sitio; muchas (la carga inicial), con una ordenación
+        if len(nuevas) > 100:
+            self.claves.extend(nuevas)
+            self.claves.sort()
+        else:
+            for clave in nuevas:
+                insort(self.claves, clave)
+
+    def _aplicar(self, nombre, filas, nuevas):
+        nid = self.nids.get(nombre)
+        if nid is not None:
+            # Las listas conservan los nombres sin uso; se filtran al consultar
+            self.filas[nid] = max(filas, 0)
+            return
+        if filas <= 0:
+            return
+        nid = len(self.nombres)
+        self.nids[nombre] = nid
+        self.nombres.append(nombre)
+        self.filas.append(filas)
+        clave = normalizar(nombre)
+        if clave not in self.por_clave:
+            self.por_clave[clave] = []
+            nuevas.append(clave)
+        self.por_clave[clave].append(nid)
+        for palabra in set(clave.split()):
+            wid = self.palabras.get(palabra)
+            if wid is None:
+                wid = self._nueva_palabra(palabra)
+            self.nids_palabra[wid].append(nid)
+            self.palabras_nid.append(wid)
+        self.inicio_nid.append(len(self.palabras_nid))
+
+    def _nueva_palabra(self, palabra):
+        wid = len(self.vocabulario)
+        self.palabras[palabra] = wid
+        self.vocabulario.append(palabra)
+        self.nids_palabra.append(array('l'))
+        for trigrama in trigramas(palabra):
+            lista = self.trigramas_palabra.get(trigrama)
+            if lista is None:
+                lista = self.trigramas_palabra[trigrama] = array('l')
+            lista.append(wid)
+        return wid
+
+    def _variantes(self, palabra):
+        """Palabras del vocabulario que pueden corresponder a 'palabra': [(wid, similitud)]"""
+        wid = self.palabras.get(palabra)
+        if wid is not None:
+            return [(wid, 1.0)]
+        propios = trigramas(palabra)
+        recuento = Counter()
+        for trigrama in propios:
+            recuento.update(self.trigramas_palabra.get(trigrama, ()))
+        variantes = []
+        for wid, comunes in recuento.most_common(MAX_VARIANTES * 10):
+            # Coeficiente de Dice entre los trigramas de ambas palabras
+            similitud = 2 * comunes / (len(propios) + len(trigramas(self.vocabulario[wid])))
+            if similitud >= SIMILITUD_MINIMA_PALABRA:
+                variantes.append((similitud, wid))
+        variantes.sort(reverse=True)
+        return [(wid, similitud) for similitud, wid in variantes[:MAX_VARIANTES]]
+
+    def _candidatos(self, grupos):
+        """Nombres a puntuar: los de la palabra más rara, cruzados con las siguientes mientras sean muchos
+
+        Las palabras exactas van antes que las corregidas, para que una
+        corrección equivocada no deje fuera el nombre buscado.
+        """
+        def orden(variantes):
+            return (variantes[0][1] < 1.0, sum(len(self.nids_palabra[wid]) for wid, _ in variantes))
+        grupos = sorted(grupos, key=orden)
+        listas = [self.nids_palabra[wid] for wid, _ in grupos[0]]
+        if len(grupos) == 1:
+            # Nada con qué cruzar: basta con la muestra que se va a puntuar
+            return set(islice(chain.from_iterable(listas), MAX_PUNTUADOS))
+        candidatos = set(chain.from_iterable(listas))
+        inicio, palabras = self.inicio_nid, self.palabras_nid
+        for variantes in grupos[1:]:
+            if len(candidatos) <= MAX_CANDIDATOS:
+                break
+            wids = {wid for wid, _ in variantes}
+            filtrados = {nid for nid in candidatos
+                         if not wids.isdisjoint(palabras[inicio[nid]:inicio[nid + 1]])}
+            candidatos = filtrados or candidatos
+        return candidatos
+
+    def search(self, texto, limit=10):
+        """Nombres parecidos a 'texto': lista de (nombre, similitud 0-1, materiales), mejores primero
+
+        La similitud es la media, sobre las palabras de la consulta, de lo
+        que se parece la palabra equivalente del nombre; a igualdad se
+        prefieren nombres con menos palabras sobrantes y más usados.
+        """
+        consulta = list(dict.fromkeys(normalizar(texto).split()))
+        if not consulta:
+            return []
+        with self._bloqueo:
+            self._sincronizar()
+            grupos = [variantes for variantes in map(self._variantes, consulta) if variantes]
+            if not grupos:
+                return []
+            # wid -> [(palabra de la consulta, similitud)] para puntuar cada nombre por sus propias palabras
+            equivalencias = {}
+            for g, variantes in enumerate(grupos):
+                for wid, similitud in variantes:
+                    equivalencias.setdefault(wid, []).append((g, similitud))
+            inicio, palabras, filas = self.inicio_nid, self.palabras_nid, self.filas
+            puntuados = []
+            for nid in islice(self._candidatos(grupos), MAX_PUNTUADOS):
+                if filas[nid] <= 0:
+                    continue
+                propias = palabras[inicio[nid]:inicio[nid + 1]]
+                mejor = {}
+                for wid in propias:
+                    for g, similitud in equivalencias.get(wid, ()):
+                        if similitud > mejor.get(g, 0):
+                            mejor[g] = similitud
+                puntuados.append((sum(mejor.values()) / len(consulta), -len(propias), filas[nid], self.nombres[nid]))
+        mejores = heapq.nlargest(limit, puntuados)
+        return [(nombre, round(similitud, 3), filas) for similitud, _, filas, nombre in mejores]
+
+    def suggest(self, prefijo, limit=8):
+        """Nombres existentes que empiezan por 'prefijo' (sin tildes ni mayúsculas), los más usados primero"""
+        clave = normalizar(prefijo)
+        if not clave:
+            return []
+        with self._bloqueo:
+            self._sincronizar()
+            encontrados = []
+            inicio = bisect_left(self.claves, clave)
+            for candidata in self.claves[inicio:inicio + MAX_ESCANEO_PREFIJO]:
+                if not candidata.startswith(clave):
+                    break
+                encontrados.extend((self.filas[nid], self.nombres[nid]) for nid in self.por_clave[candidata]
+                                   if self.filas[nid] > 0)
+        encontrados.sort(key=lambda par: (-par[0], par[1]))
+        return [nombre for _, nombre in encontrados[:limit]]
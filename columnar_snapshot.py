@@ -0,0 +1,487 @@
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Columnas de la tabla materiales en el orden en que se leen
+COLUMNAS_SQL = 'id, material, tipo, cantidad, valor, ubicacion, estado, fecha'
+
+# Columnas categóricas codificadas como diccionario
+COLUMNAS_CATEGORICAS = ('tipo', 'estado', 'ubicacion')
+
+# Columnas numéricas disponibles para agregados y top-k
+COLUMNAS_NUMERICAS = ('cantidad', 'valor', 'fecha')
+
+# Formato binario del snapshot: cabecera fija, metadatos JSON y secciones alineadas a 8 bytes
+MAGIA_SNAPSHOT = b'MATSNAP1'
+VERSION_SNAPSHOT = 1
+CABECERA_SNAPSHOT = struct.Struct('<8sIIQqQI4x')  # magia, versión, reservado, filas, origen, long. metadatos, crc32
+
+COLUMNAS_FIJAS = (
+    ('cantidad', '<f8'),
+    ('valor', '<f8'),
+    ('fecha', '<i8'),
+    ('tipo', '<i4'),
+    ('estado', '<i4'),
+    ('ubicacion', '<i4')
+)
+
+FORMATOS_FECHA = ('%d/%m/%Y', '%Y-%m-%d', '%d/%m/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S')
+
+
+@lru_cache(maxsize=65536)
+def fecha_a_ordinal(fecha):
+    """Convertir una fecha de texto a número de día (0 si no es válida)"""
+    if not fecha:
+        return 0
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(fecha, formato).toordinal()
+        except ValueError:
+            continue
+    return 0
+
+
+def ordinal_a_fecha(ordinal):
+    """Convertir un número de día al formato de fecha de la aplicación"""
+    if ordinal <= 0:
+        return ''
+    return datetime.fromordinal(int(ordinal)).strftime('%d/%m/%Y')
+
+
+class _Diccionario:
+    """Codificación de una columna de texto a enteros"""
+
+    def __init__(self):
+        self.valores = []
+        self.codigos = {}
+
+    def codificar(self, valor):
+        valor = valor if valor is not None else ''
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.codigos[valor] = codigo
+            self.valores.append(valor)
+        return codigo
+
+    def buscar(self, valor):
+        """Código de un valor, o -1 si nunca se ha visto"""
+        return self.codigos.get(valor, -1)
+
+
+class ColumnarSnapshot:
+    """Copia en memoria de la tabla materiales organizada por columnas"""
+
+    def __init__(self, capacidad=1024):
+        capacidad = max(int(capacidad), 16)
+        self.size = 0
+        self.ids = np.empty(capacidad, dtype=object)
+        self.material = np.empty(capacidad, dtype=object)
+        self.cantidad = np.zeros(capacidad, dtype=np.float64)
+        self.valor = np.zeros(capacidad, dtype=np.float64)
+        self.fecha = np.zeros(capacidad, dtype=np.int64)
+        self.tipo = np.zeros(capacidad, dtype=np.int32)
+        self.estado = np.zeros(capacidad, dtype=np.int32)
+        self.ubicacion = np.zeros(capacidad, dtype=np.int32)
+        self.diccionarios = {columna: _Diccionario() for columna in COLUMNAS_CATEGORICAS}
+        self.posiciones = {}
+        self.origen = 0
+        # Datos mapeados desde un archivo de snapshot (ver load)
+        self._mapa = None
+        self._cadenas = None
+
+    # ------------------------------------------------------------------
+    # Construcción y actualización
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_cursor(cls, cursor, batch_size=10000):
+        """Construir el snapshot a partir de un cursor ya ejecutado
+
+        El cursor debe devolver las columnas en el orden de COLUMNAS_SQL.
+        """
+        snapshot = cls()
+        while True:
+            filas = cursor.fetchmany(batch_size)
+            if not filas:
+                break
+            snapshot._agregar_filas(filas)
+        return snapshot
+
+    @classmethod
+    def from_database(cls, db_name, batch_size=10000):
+        """Construir el snapshot leyendo directamente la base de datos"""
+        with sqlite3.connect(db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT {COLUMNAS_SQL} FROM materiales')
+            return cls.from_cursor(cursor, batch_size)
+
+    def _asegurar_capacidad(self, necesaria):
+        capacidad = len(self.cantidad)
+        if necesaria <= capacidad:
+            return
+        while capacidad < necesaria:
+            capacidad *= 2
+        for nombre in ('ids', 'material', 'cantidad', 'valor', 'fecha', 'tipo', 'estado', 'ubicacion'):
+            actual = getattr(self, nombre)
+            nuevo = np.zeros(capacidad, dtype=actual.dtype) if actual.dtype != object else np.empty(capacidad, dtype=object)
+            nuevo[:self.size] = actual[:self.size]
+            setattr(self, nombre, nuevo)
+
+    def _escribir_fila(self, posicion, fila):
+        id_material, material, tipo, cantidad, valor, ubicacion, estado, fecha = fila
+        self.ids[posicion] = id_material
+        self.material[posicion] = material
+        self.cantidad[posicion] = float(cantidad or 0)
+        self.valor[posicion] = float(valor or 0)
+        self.fecha[posicion] = fecha_a_ordinal(fecha)
+        self.tipo[posicion] = self.diccionarios['tipo'].codificar(tipo)
+        self.estado[posicion] = self.diccionarios['estado'].codificar(estado)
+        self.ubicacion[posicion] = self.diccionarios['ubicacion'].codificar(ubicacion)
+        self.posiciones[id_material] = posicion
+
+    def _agregar_filas(self, filas):
+        posiciones = self.posiciones
+        ids = [fila[0] for fila in filas]
+        nuevas = len(set(ids)) == len(ids) and not any(i in posiciones for i in ids)
+        if not nuevas:
+            # Lote con filas ya existentes o repetidas: actualizar fila por fila
+            self._asegurar_capacidad(self.size + len(filas))
+            for fila in filas:
+                posicion = posiciones.get(fila[0])
+                if posicion is None:
+                    posicion = self.size
+                    self.size += 1
+                self._escribir_fila(posicion, fila)
+            return
+
+        # Lote de filas nuevas: escribir cada columna de una sola vez
+        inicio = self.size
+        fin = inicio + len(filas)
+        self._asegurar_capacidad(fin)
+        _, material, tipo, cantidad, valor, ubicacion, estado, fecha = zip(*filas)
+        self.ids[inicio:fin] = ids
+        self.material[inicio:fin] = material
+        self.cantidad[inicio:fin] = [c or 0 for c in cantidad]
+        self.valor[inicio:fin] = [v or 0 for v in valor]
+        self.fecha[inicio:fin] = [fecha_a_ordinal(f) for f in fecha]
+        for nombre, valores in (('tipo', tipo), ('estado', estado), ('ubicacion', ubicacion)):
+            codificar = self.diccionarios[nombre].codificar
+            getattr(self, nombre)[inicio:fin] = [codificar(v) for v in valores]
+        posiciones.update(zip(ids, range(inicio, fin)))
+        self.size = fin
+
+    def apply_changes(self, filas=(), deleted_ids=()):
+        """Aplicar filas insertadas/modificadas y eliminadas sin reconstruir
+
+        Las filas pueden ser tuplas en el orden de COLUMNAS_SQL o
+        diccionarios con el formato de DatabaseManager.
+        """
+        self._materializar()
+        filas = [self._normalizar_fila(fila) for fila in filas]
+        if filas:
+            self._agregar_filas(filas)
+        for id_material in deleted_ids:
+            self._eliminar(id_material)
+
+    def _normalizar_fila(self, fila):
+        if isinstance(fila, dict):
+            return (fila['ID'], fila['Material'], fila['Tipo'], fila['Cantidad'], fila['Valor'],
+                    fila.get('Ubicacion'), fila.get('Estado'), fila.get('Fecha'))
+        return tuple(fila)
+
+    def _eliminar(self, id_material):
+        posicion = self.posiciones.pop(id_material, None)
+        if posicion is None:
+            return
+        ultima = self.size - 1
+        if posicion != ultima:
+            # Mover la última fila al hueco para mantener las columnas compactas
+            for nombre in ('ids', 'material', 'cantidad', 'valor', 'fecha', 'tipo', 'estado', 'ubicacion'):
+                columna = getattr(self, nombre)
+                columna[posicion] = columna[ultima]
+            self.posiciones[self.ids[posicion]] = posicion
+        self.ids[ultima] = None
+        self.material[ultima] = None
+        self.size = ultima
+
+    # ------------------------------------------------------------------
+    # Acceso a columnas
+    # ------------------------------------------------------------------
+
+    def columna(self, nombre):
+        """Vista de una columna limitada a las filas válidas"""
+        if nombre in ('ids', 'material'):
+            self._materializar()
+        return getattr(self, nombre)[:self.size]
+
+    def etiquetas(self, nombre):
+        """Valores de texto de una columna categórica, indexados por código"""
+        return self.diccionarios[nombre].valores
+
+    def filas(self, indices):
+        """Reconstruir registros con el formato de DatabaseManager"""
+        tipos = self.etiquetas('tipo')
+        estados = self.etiquetas('estado')
+        ubicaciones = self.etiquetas('ubicacion')
+        registros = []
+        for i in indices:
+            registros.append({
+                'ID': self._texto('ids', i),
+                'Material': self._texto('material', i),
+                'Tipo': tipos[self.tipo[i]],
+                'Cantidad': float(self.cantidad[i]),
+                'Valor': float(self.valor[i]),
+                'Ubicacion': ubicaciones[self.ubicacion[i]],
+                'Estado': estados[self.estado[i]],
+                'Fecha': ordinal_a_fecha(self.fecha[i])
+            })
+        return registros
+
+    def _texto(self, nombre, i):
+        """Valor de texto de una fila, decodificado del archivo si está mapeado"""
+        if self._cadenas is None:
+            return getattr(self, nombre)[i]
+        desplazamientos, datos = self._cadenas[nombre]
+        return bytes(datos[desplazamientos[i]:desplazamientos[i + 1]]).decode('utf-8')
+
+    # ------------------------------------------------------------------
+    # Formato binario
+    # ------------------------------------------------------------------
+
+    def save(self, ruta, origen=None):
+        """Guardar el snapshot en formato binario columnar (reemplazo atómico)
+
+        'origen' es un número libre (por ejemplo la versión de los datos de la
+        base de datos) que permite saber si el snapshot sigue vigente.
+        """
+        self._materializar()
+        origen = self.origen if origen is None else origen
+
+        secciones = []
+        for nombre, dtype in COLUMNAS_FIJAS:
+            secciones.append((nombre, dtype, self.columna(nombre).astype(dtype).tobytes()))
+        for nombre in ('ids', 'material'):
+            codificados = [(valor or '').encode('utf-8') for valor in self.columna(nombre)]
+            desplazamientos = np.zeros(self.size + 1, dtype='<i8')
+            np.cumsum([len(c) for c in codificados], out=desplazamientos[1:])
+            secciones.append((nombre + '_desplazamientos', '<i8', desplazamientos.tobytes()))
+            secciones.append((nombre + '_datos', '|u1', b''.join(codificados)))
+
+        # Calcular posiciones de cada sección respecto al inicio de los datos
+        metadatos = {
+            'diccionarios': {nombre: d.valores for nombre, d in self.diccionarios.items()},
+            'secciones': {}
+        }
+        posicion = 0
+        for nombre, dtype, datos in secciones:
+            metadatos['secciones'][nombre] = [dtype, posicion, len(datos)]
+            posicion += len(datos) + (-len(datos)) % 8
+        meta = json.dumps(metadatos, ensure_ascii=False).encode('utf-8')
+        meta += b' ' * ((-(CABECERA_SNAPSHOT.size + len(meta))) % 8)
+
+        crc = zlib.crc32(meta)
+        for _, _, datos in secciones:
+            crc = zlib.crc32(datos + b'\0' * ((-len(datos)) % 8), crc)
+
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        descriptor, temporal = tempfile.mkstemp(prefix='.snapshot-', suffix='.tmp', dir=directorio)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(CABECERA_SNAPSHOT.pack(MAGIA_SNAPSHOT, VERSION_SNAPSHOT, 0, self.size,
+                                                  int(origen), len(meta), crc))
+                file.write(meta)
+                for _, _, datos in secciones:
+                    file.write(datos)
+                    file.write(b'\0' * ((-len(datos)) % 8))
+            os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    @classmethod
+    def load(cls, ruta, verificar=True):
+        """Abrir un snapshot binario con mmap; las columnas numéricas no se copian
+
+        Los textos (ID y material) se decodifican bajo demanda y el snapshot
+        solo pasa a memoria propia si se modifica con apply_changes.
+        """
+        with open(ruta, 'rb') as file:
+            mapa = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mapa) < CABECERA_SNAPSHOT.size:
+                raise ValueError(f"Snapshot truncado: {ruta}")
+            magia, version, _, filas, origen, longitud_meta, crc = CABECERA_SNAPSHOT.unpack_from(mapa, 0)
+            if magia != MAGIA_SNAPSHOT:
+                raise ValueError(f"No es un snapshot de materiales: {ruta}")
+            if version != VERSION_SNAPSHOT:
+                raise ValueError(f"Versión de snapshot no soportada: {version}")
+            if verificar and zlib.crc32(memoryview(mapa)[CABECERA_SNAPSHOT.size:]) != crc:
+                raise ValueError(f"Checksum inválido en el snapshot: {ruta}")
+
+            inicio_meta = CABECERA_SNAPSHOT.size
+            metadatos = json.loads(bytes(mapa[inicio_meta:inicio_meta + longitud_meta]).decode('utf-8'))
+            inicio_datos = inicio_meta + longitud_meta
+
+            def seccion(nombre):
+                dtype, desplazamiento, longitud = metadatos['secciones'][nombre]
+                dtype = np.dtype(dtype)
+                return np.frombuffer(mapa, dtype=dtype, count=longitud // dtype.itemsize,
+                                     offset=inicio_datos + desplazamiento)
+        except BaseException:
+            mapa.close()
+            raise
+
+        snapshot = cls(16)
+        snapshot.size = filas
+        snapshot.origen = origen
+        for nombre, _ in COLUMNAS_FIJAS:
+            setattr(snapshot, nombre, seccion(nombre))
+        for nombre, valores in metadatos['diccionarios'].items():
+            diccionario = snapshot.diccionarios[nombre]
+            for valor in valores:
+                diccionario.codificar(valor)
+        snapshot.ids = snapshot.material = None
+        snapshot._cadenas = {nombre: (seccion(nombre + '_desplazamientos'), seccion(nombre + '_datos'))
+                             for nombre in ('ids', 'material')}
+        snapshot._mapa = mapa
+        return snapshot
+
+    def _materializar(self):
+        """Copiar a memoria propia un snapshot mapeado desde archivo"""
+        if self._mapa is None:
+            return
+        capacidad = max(self.size, 16)
+        for nombre in ('ids', 'material'):
+            columna = np.empty(capacidad, dtype=object)
+            columna[:self.size] = [self._texto(nombre, i) for i in range(self.size)]
+            setattr(self, nombre, columna)
+        for nombre, dtype in COLUMNAS_FIJAS:
+            setattr(self, nombre, getattr(self, nombre)[:self.size].astype(np.dtype(dtype).newbyteorder('=')))
+        self.posiciones = {id_material: i for i, id_material in enumerate(self.ids[:self.size])}
+        self._cadenas = None
+        mapa, self._mapa = self._mapa, None
+        try:
+            mapa.close()
+        except BufferError:
+            # Quedan vistas externas sobre el archivo; se cerrará al liberarlas
+            pass
+
+    # ------------------------------------------------------------------
+    # Filtros, agrupaciones y top-k
+    # ------------------------------------------------------------------
+
+    def filter(self, tipo=None, estado=None, ubicacion=None, texto=None,
+               fecha_desde=None, fecha_hasta=None):
+        """Máscara booleana de las filas que cumplen los filtros
+
+        'Todos' o None desactivan el filtro categórico correspondiente.
+        """
+        mascara = np.ones(self.size, dtype=bool)
+        for nombre, valor in (('tipo', tipo), ('estado', estado), ('ubicacion', ubicacion)):
+            if valor is None or valor == 'Todos':
+                continue
+            mascara &= self.columna(nombre) == self.diccionarios[nombre].buscar(valor)
+        if fecha_desde is not None:
+            mascara &= self.columna('fecha') >= fecha_a_ordinal(fecha_desde)
+        if fecha_hasta is not None:
+            mascara &= self.columna('fecha') <= fecha_a_ordinal(fecha_hasta)
+        if texto:
+            texto = texto.lower()
+            coincide = np.fromiter((texto in (m or '').lower() for m in self.columna('material')),
+                                   dtype=bool, count=self.size)
+            mascara &= coincide
+        return mascara
+
+    def group_by(self, nombre, mascara=None):
+        """Totales de cantidad, valor y número de materiales por categoría"""
+        codigos = self.columna(nombre)
+        cantidad = self.columna('cantidad')
+        valor = self.columna('valor')
+        if mascara is not None:
+            codigos = codigos[mascara]
+            cantidad = cantidad[mascara]
+            valor = valor[mascara]
+
+        etiquetas = self.etiquetas(nombre)
+        n = len(etiquetas)
+        conteos = np.bincount(codigos, minlength=n)
+        sumas_cantidad = np.bincount(codigos, weights=cantidad, minlength=n)
+        sumas_valor = np.bincount(codigos, weights=valor, minlength=n)
+
+        resultado = {}
+        for codigo in np.flatnonzero(conteos):
+            resultado[etiquetas[codigo]] = {
+                'cantidad': float(sumas_cantidad[codigo]),
+                'valor': float(sumas_valor[codigo]),
+                'materiales': int(conteos[codigo])
+            }
+        return resultado
+
+    def top_k(self, nombre, k=10, mascara=None, descendente=True):
+        """Índices de las k filas con mayor (o menor) valor en una columna
+
+        'valor_total' ordena por cantidad × valor.
+        """
+        if nombre == 'valor_total':
+            datos = self.columna('cantidad') * self.columna('valor')
+        else:
+            datos = self.columna(nombre)
+        indices = np.arange(self.size)
+        if mascara is not None:
+            indices = indices[mascara]
+            datos = datos[mascara]
+        if len(datos) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        claves = -datos if descendente else datos
+        k = min(k, len(datos))
+        parcial = np.argpartition(claves, k - 1)[:k]
+        orden = parcial[np.argsort(claves[parcial], kind='stable')]
+        return indices[orden]
+
+    def histogram(self, nombre, bins=10, mascara=None):
+        """Histograma de una columna numérica: lista de (inicio, fin, conteo)"""
+        datos = self.columna(nombre)
+        if mascara is not None:
+            datos = datos[mascara]
+        if len(datos) == 0:
+            return []
+        conteos, bordes = np.histogram(datos, bins=bins)
+        return [(float(bordes[i]), float(bordes[i + 1]), int(conteos[i])) for i in range(len(conteos))]
+
+    def statistics(self, mascara=None):
+        """Estadísticas con el mismo formato que DatabaseManager.get_statistics"""
+        cantidad = self.columna('cantidad')
+        valor = self.columna('valor')
+        if mascara is not None:
+            cantidad = cantidad[mascara]
+            valor = valor[mascara]
+        total = len(valor)
+        if total == 0:
+            general = (0, None, None, None)
+        else:
+            general = (total, float(cantidad.sum()), float(valor.sum()), float(valor.mean()))
+
+        por_tipo = []
+        for tipo, stats in sorted(self.group_by('tipo', mascara).items()):
+            por_tipo.append((tipo, stats['materiales'], stats['cantidad'], stats['valor'],
+                             stats['valor'] / stats['materiales']))
+
+        por_ubicacion = [(ubicacion, stats['materiales'])
+                         for ubicacion, stats in sorted(self.group_by('ubicacion', mascara).items())]
+
+        return {
+            'general': general,
+            'por_tipo': por_tipo,
+            'por_ubicacion': por_ubicacion
+        }
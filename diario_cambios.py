@@ -0,0 +1,246 @@
+import csv
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+COLUMNAS_MATERIAL = ['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha']
+
+# Operaciones registradas en el diario
+UPSERT = 'upsert'
+TOMBSTONE = 'delete'
+
+
+class ChangeJournal:
+    """Diario de cambios de la tabla materiales mantenido por triggers
+
+    Cada inserción, modificación o borrado añade una entrada con un número
+    de secuencia creciente. Las exportaciones delta leen solo las entradas
+    posteriores a un punto de control, así que su coste depende de los
+    cambios y no del tamaño del inventario.
+    """
+
+    def __init__(self, db_name='materiales.db'):
+        self.db_name = db_name
+        self.init_schema()
+
+    def init_schema(self):
+        """Crear las tablas del diario y los triggers"""
+        try:
+            with closing(sqlite3.connect(self.db_name)) as conn:
+                cursor = conn.cursor()
+                # AUTOINCREMENT evita reutilizar secuencias tras purgar el diario
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS cambios (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT NOT NULL,
+                        operacion TEXT NOT NULL,
+                        momento TEXT NOT NULL DEFAULT (datetime('now'))
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_cambios_id ON cambios (id, seq)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_cambios_momento ON cambios (momento)')
+
+                # Puntos de control de cada destino y estado de la retención
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS exportaciones_delta (
+                        destino TEXT PRIMARY KEY,
+                        seq INTEGER NOT NULL,
+                        actualizada TEXT NOT NULL
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS diario_estado (
+                        clave TEXT PRIMARY KEY,
+                        valor INTEGER NOT NULL
+                    )
+                ''')
+
+                cursor.executescript(f'''
+                    CREATE TRIGGER IF NOT EXISTS diario_materiales_insert
+                    AFTER INSERT ON materiales BEGIN
+                        INSERT INTO cambios (id, operacion) VALUES (NEW.id, '{UPSERT}');
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS diario_materiales_update
+                    AFTER UPDATE ON materiales BEGIN
+                        INSERT INTO cambios (id, operacion)
+                        SELECT OLD.id, '{TOMBSTONE}' WHERE OLD.id IS NOT NEW.id;
+                        INSERT INTO cambios (id, operacion) VALUES (NEW.id, '{UPSERT}');
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS diario_materiales_delete
+                    AFTER DELETE ON materiales BEGIN
+                        INSERT INTO cambios (id, operacion) VALUES (OLD.id, '{TOMBSTONE}');
+                    END;
+                ''')
+                conn.commit()
+        except Exception as e:
+            print(f"Error al inicializar el diario de cambios: {e}")
+
+    def current_seq(self):
+        """Última secuencia asignada (0 si el diario nunca registró cambios)"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'")
+            fila = cursor.fetchone()
+            return fila[0] if fila else 0
+
+    def purged_until(self):
+        """Secuencia hasta la que se purgó el diario; no se puede exportar desde antes"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT valor FROM diario_estado WHERE clave = 'purgado_hasta'")
+            fila = cursor.fetchone()
+            return fila[0] if fila else 0
+
+    def export_changes_since(self, seq=0, batch_size=1000):
+        """Recorrer el efecto neto de los cambios posteriores a 'seq'
+
+        Produce tuplas (seq, operacion, material) en orden de secuencia, una
+        por ID modificado: 'upsert' con el diccionario del material actual o
+        'delete' con {'ID': id} si ya no existe. Lanza ValueError si el
+        diario se purgó después de 'seq' y hace falta una exportación completa.
+        """
+        purgado = self.purged_until()
+        if seq < purgado:
+            raise ValueError(f"El diario se purgó hasta la secuencia {purgado}; "
+                             f"se necesita una exportación completa")
+        return self._recorrer_cambios(seq, batch_size)
+
+    def _recorrer_cambios(self, seq, batch_size):
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            # Una sola consulta: la última entrada de cada ID unida al estado actual
+            cursor.execute('''
+                SELECT c.seq, c.id, m.id, m.material, m.tipo, m.cantidad, m.valor, m.ubicacion, m.estado, m.fecha
+                FROM (SELECT id, MAX(seq) AS seq FROM cambios WHERE seq > ? GROUP BY id) AS c
+                LEFT JOIN materiales AS m ON m.id = c.id
+                ORDER BY c.seq
+            ''', (seq,))
+            while True:
+                filas = cursor.fetchmany(batch_size)
+                if not filas:
+                    break
+                for fila in filas:
+                    if fila[2] is None:
+                        yield fila[0], TOMBSTONE, {'ID': fila[1]}
+                    else:
+                        yield fila[0], UPSERT, dict(zip(COLUMNAS_MATERIAL, fila[2:]))
+
+    def _recorrer_todo(self, batch_size):
+        """Todos los materiales como 'upsert', con la secuencia vigente al leerlos"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            # Secuencia y filas se leen dentro de la misma transacción
+            cursor.execute('BEGIN')
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cambios'")
+            fila = cursor.fetchone()
+            seq = fila[0] if fila else 0
+            cursor.execute('SELECT id, material, tipo, cantidad, valor, ubicacion, estado, fecha FROM materiales')
+            while True:
+                filas = cursor.fetchmany(batch_size)
+                if not filas:
+                    break
+                for fila in filas:
+                    yield seq, UPSERT, dict(zip(COLUMNAS_MATERIAL, fila))
+            conn.rollback()
+
+    def pending_changes(self, seq=None, destino=None, batch_size=1000):
+        """Cambios por exportar después de 'seq' o del punto de control de 'destino'
+
+        Devuelve (cambios, secuencia de partida, si es completa); si el
+        destino nunca se sincronizó o quedó por detrás de una purga, los
+        cambios son el inventario completo como 'upsert'.
+        """
+        if seq is None and destino:
+            seq = self.checkpoint(destino)
+        completa = seq is None or (destino is not None and seq < self.purged_until())
+        if completa:
+            return self._recorrer_todo(batch_size), self.current_seq(), True
+        return self.export_changes_since(seq, batch_size), seq, False
+
+    def export_to_csv(self, filename, seq=None, destino=None, batch_size=1000):
+        """Escribir en CSV los cambios posteriores a 'seq' o al punto de control de 'destino'
+
+        Si el destino nunca se sincronizó o quedó por detrás de una purga,
+        se exporta el inventario completo como 'upsert'. Con 'destino', su
+        punto de control avanza al terminar. Devuelve (filas escritas,
+        última secuencia exportada, si fue completa).
+        """
+        cambios, seq, completa = self.pending_changes(seq, destino, batch_size)
+        ultima = seq
+        filas = 0
+        with open(filename, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Secuencia', 'Operacion'] + COLUMNAS_MATERIAL)
+            for seq_cambio, operacion, material in cambios:
+                writer.writerow([seq_cambio, operacion] + [material.get(c, '') for c in COLUMNAS_MATERIAL])
+                ultima = max(ultima, seq_cambio)
+                filas += 1
+        if destino:
+            self.set_checkpoint(destino, ultima)
+        return filas, ultima, completa
+
+    def checkpoint(self, destino):
+        """Última secuencia exportada a un destino (None si nunca se exportó)"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT seq FROM exportaciones_delta WHERE destino = ?', (destino,))
+            fila = cursor.fetchone()
+            return fila[0] if fila else None
+
+    def set_checkpoint(self, destino, seq):
+        """Guardar el punto de control de un destino"""
+        with sqlite3.connect(self.db_name) as conn:
+            conn.execute('''
+                INSERT INTO exportaciones_delta (destino, seq, actualizada) VALUES (?, ?, ?)
+                ON CONFLICT(destino) DO UPDATE SET seq = excluded.seq, actualizada = excluded.actualizada
+            ''', (destino, seq, datetime.now().strftime('%d/%m/%Y %H:%M:%S')))
+            conn.commit()
+
+    def compact(self):
+        """Eliminar entradas superadas por otra posterior del mismo ID
+
+        No cambia el resultado de ninguna exportación delta. Devuelve el
+        número de entradas eliminadas.
+        """
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM cambios
+                WHERE EXISTS (SELECT 1 FROM cambios AS posterior
+                              WHERE posterior.id = cambios.id AND posterior.seq > cambios.seq)
+            ''')
+            eliminadas = cursor.rowcount
+            conn.commit()
+            return eliminadas
+
+    def purge(self, retention_days=30):
+        """Eliminar entradas más antiguas que la retención ya exportadas a todos los destinos
+
+        Los destinos que queden por detrás de la purga tendrán que hacer una
+        exportación completa. Devuelve el número de entradas eliminadas.
+        """
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MIN(seq) FROM exportaciones_delta')
+            minimo_exportado = cursor.fetchone()[0]
+            condicion = "momento < datetime('now', ?)"
+            params = [f'-{int(retention_days)} days']
+            if minimo_exportado is not None:
+                condicion += ' AND seq <= ?'
+                params.append(minimo_exportado)
+
+            cursor.execute(f'SELECT MAX(seq) FROM cambios WHERE {condicion}', params)
+            hasta = cursor.fetchone()[0]
+            if hasta is None:
+                return 0
+            # Purgar un prefijo contiguo para que 'purgado_hasta' sea exacto
+            cursor.execute('DELETE FROM cambios WHERE seq <= ?', (hasta,))
+            eliminadas = cursor.rowcount
+            cursor.execute('''
+                INSERT INTO diario_estado (clave, valor) VALUES ('purgado_hasta', ?)
+                ON CONFLICT(clave) DO UPDATE SET valor = MAX(valor, excluded.valor)
+            ''', (hasta,))
+            conn.commit()
+            return eliminadas
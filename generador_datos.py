@@ -0,0 +1,357 @@
+import argparse
+import csv
+import math
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from base_datos import ESQUEMA_MATERIALES
+from columnar_snapshot import COLUMNAS_SQL
+
+# Catálogo por tipo: (nombres base, ubicación habitual, precio base por unidad)
+CATALOGO = (
+    ('Solido', ('Botella Plástica PET', 'Envase Tetrapak', 'Bolsa Plástica HDPE', 'Tapas Metálicas',
+                'Cartón Corrugado', 'Poliestireno Expandido'), 'Almacén A', 15),
+    ('Papel', ('Periódicos', 'Revistas', 'Cajas de Cartón', 'Papel de Oficina', 'Libros Usados'),
+     'Almacén Papel', 10),
+    ('Metalico', ('Latas de Aluminio', 'Chatarra de Hierro', 'Cables de Cobre', 'Radiadores de Aluminio',
+                  'Tornillos y Tuercas'), 'Patio Metales', 40),
+    ('Organico', ('Restos de Comida', 'Cáscaras de Fruta', 'Hojas Secas', 'Residuos de Jardín',
+                  'Café Molido', 'Cáscaras de Huevo'), 'Compostera', 1),
+    ('Vidrio', ('Botellas de Vidrio Verde', 'Frascos de Vidrio', 'Espejos Rotos', 'Vidrio Plano',
+                'Cristales de Ventana'), 'Almacén Vidrio', 12),
+    ('Liquido', ('Aceite de Cocina', 'Detergente Usado', 'Pintura Sobrante', 'Agua Contaminada',
+                 'Aceite Hidráulico'), 'Tanque A', 20),
+    ('Textil', ('Ropa Usada', 'Telas', 'Alfombras', 'Zapatos'), 'Almacén Textiles', 15),
+    ('Electronico', ('Computadoras', 'Teléfonos Móviles', 'Televisores', 'Impresoras',
+                     'Cables y Adaptadores'), 'Almacén Electrónicos', 100),
+    ('Quimico', ('Productos de Limpieza', 'Pesticidas', 'Fertilizantes', 'Disolventes'),
+     'Almacén Químicos', 35),
+    ('Peligroso', ('Batería de Auto 12V', 'Pilas AA Alcalinas', 'Termómetro de Mercurio',
+                   'Medicamentos Vencidos', 'Aceite de Motor Usado', 'Pintura con Plomo'),
+     'Almacén Seguro', 40),
+)
+
+# Ubicaciones secundarias, de la más a la menos usada
+UBICACIONES_EXTRA = ('Almacén B', 'Almacén C', 'Tanque B', 'Patio Exterior', 'Tanque C',
+                     'Almacén Central', 'Tanque D', 'Muelle de Carga', 'Bodega Norte', 'Bodega Sur')
+
+ESTADOS = (('Disponible', 0.70), ('En Uso', 0.15), ('Agotado', 0.05),
+           ('Dañado', 0.06), ('En Reparación', 0.04))
+
+# Rango de fechas por defecto (fijo, para que la misma semilla dé siempre los mismos datos)
+DESDE_DEFECTO = date(2023, 1, 1)
+HASTA_DEFECTO = date(2025, 12, 31)
+
+# Máximo de modelos por nombre base (los nombres completos se precalculan)
+MAX_MODELOS = 10000
+
+# Fracción de materiales que están en la ubicación habitual de su tipo
+PROB_UBICACION_HABITUAL = 0.7
+
+# Filas por lote; cada lote tiene su propio generador, así que las filas
+# dependen solo de la semilla y no del total pedido
+TAMANO_LOTE = 100000
+
+
+def numero_lotes(filas):
+    """Lotes necesarios para generar 'filas' materiales"""
+    return (filas + TAMANO_LOTE - 1) // TAMANO_LOTE
+
+
+def pesos_zipf(n, exponente=1.0):
+    """Pesos normalizados 1/k^s: pocos valores muy frecuentes y una cola larga"""
+    pesos = 1.0 / np.arange(1, n + 1) ** exponente
+    return pesos / pesos.sum()
+
+
+class GeneradorInventario:
+    """Generador determinista de materiales sintéticos para pruebas de carga
+
+    Los tipos y ubicaciones siguen distribuciones sesgadas (Zipf), cada tipo
+    está sobre todo en su ubicación habitual, los nombres combinan un nombre
+    base con un número de modelo (los modelos bajos son los más comunes), la
+    cantidad y el valor siguen distribuciones lognormales y las fechas se
+    concentran en el periodo más reciente.
+    """
+
+    def __init__(self, semilla=42, desde=DESDE_DEFECTO, hasta=HASTA_DEFECTO, modelos=1000, prefijo='GEN-'):
+        if desde > hasta:
+            raise ValueError("La fecha inicial es posterior a la final")
+        if not 1 <= modelos <= MAX_MODELOS:
+            raise ValueError(f"El número de modelos debe estar entre 1 y {MAX_MODELOS}")
+        self.semilla = semilla
+        self.modelos = modelos
+        self.prefijo = prefijo
+
+        self.tipos = np.array([tipo for tipo, _, _, _ in CATALOGO], dtype=object)
+        self.pesos_tipo = pesos_zipf(len(CATALOGO), 0.8)
+        self.precio_base = np.array([precio for _, _, _, precio in CATALOGO], dtype=float)
+        self.num_nombres = np.array([len(nombres) for _, nombres, _, _ in CATALOGO])
+        self.inicio_nombres = np.concatenate(([0], np.cumsum(self.num_nombres)[:-1]))
+        self.nombres = np.array([f'{nombre} {modelo}' for _, nombres, _, _ in CATALOGO for nombre in nombres
+                                 for modelo in range(1, modelos + 1)], dtype=object)
+
+        habituales = [ubicacion for _, _, ubicacion, _ in CATALOGO]
+        self.ubicaciones = np.array(habituales + list(UBICACIONES_EXTRA), dtype=object)
+        self.ubicacion_habitual = np.arange(len(CATALOGO))
+        self.pesos_ubicacion = pesos_zipf(len(self.ubicaciones))
+
+        self.estados = np.array([estado for estado, _ in ESTADOS], dtype=object)
+        self.pesos_estado = np.array([peso for _, peso in ESTADOS])
+        self.agotado = [estado for estado, _ in ESTADOS].index('Agotado')
+
+        dias = (hasta - desde).days + 1
+        self.fechas = np.array([(desde + timedelta(days=d)).strftime('%d/%m/%Y') for d in range(dias)],
+                               dtype=object)
+
+    def lote(self, numero, filas):
+        """Generar las primeras 'filas' del lote 'numero' como tuplas en el orden de COLUMNAS_SQL
+
+        Siempre se sortea el lote completo para que un lote incompleto sea
+        el principio del mismo lote completo.
+        """
+        rng = np.random.default_rng([self.semilla, numero])
+        n = TAMANO_LOTE
+        tipo = rng.choice(len(CATALOGO), n, p=self.pesos_tipo)
+
+        # Nombre base al azar dentro del tipo y modelo log-uniforme (los bajos son los más comunes)
+        nombre = self.inicio_nombres[tipo] + (rng.random(n) * self.num_nombres[tipo]).astype(np.int64)
+        modelo = (self.modelos ** rng.random(n)).astype(np.int64) - 1
+
+        ubicacion = np.where(rng.random(n) < PROB_UBICACION_HABITUAL, self.ubicacion_habitual[tipo],
+                             rng.choice(len(self.ubicaciones), n, p=self.pesos_ubicacion))
+        estado = rng.choice(len(self.estados), n, p=self.pesos_estado)
+
+        cantidad = np.maximum(1, np.round(rng.lognormal(math.log(20), 1.0, n)))
+        cantidad[estado == self.agotado] = 0
+        valor = np.round(self.precio_base[tipo] * rng.lognormal(0, 0.5, n), 2)
+
+        # Más altas recientes: el cuadrado de un uniforme se concentra cerca de 0
+        dias = len(self.fechas)
+        fecha = dias - 1 - (rng.random(n) ** 2 * dias).astype(np.int64)
+
+        inicio = numero * TAMANO_LOTE
+        return list(zip(
+            [f'{self.prefijo}{i:08d}' for i in range(inicio, inicio + filas)],
+            self.nombres[(nombre * self.modelos + modelo)[:filas]].tolist(),
+            self.tipos[tipo[:filas]].tolist(),
+            cantidad[:filas].tolist(),
+            valor[:filas].tolist(),
+            self.ubicaciones[ubicacion[:filas]].tolist(),
+            self.estados[estado[:filas]].tolist(),
+            self.fechas[fecha[:filas]].tolist()
+        ))
+
+    def lotes(self, filas, numeros=None):
+        """Iterar sobre los lotes necesarios para generar 'filas' materiales (o solo los de 'numeros')"""
+        if numeros is None:
+            numeros = range(numero_lotes(filas))
+        for numero in numeros:
+            yield self.lote(numero, min(TAMANO_LOTE, filas - numero * TAMANO_LOTE))
+
+
+def escribir_sqlite(generador, filas, ruta, solo_tabla=False, procesos=1):
+    """Insertar los materiales en una base de datos SQLite
+
+    Una base de datos nueva se llena sin índices, triggers ni diario. Con
+    varios procesos, cada uno genera un tramo contiguo de lotes en una tabla
+    sin clave de un archivo propio y las partes se copian en orden a
+    materiales con un INSERT ... SELECT, así que solo la copia es
+    secuencial. Después se abre con DatabaseManager y TrendEngine, que crean
+    los índices y rellenan las tablas derivadas de una vez (mucho más rápido
+    que mantenerlas fila a fila). Todo ello se hace en un archivo temporal
+    junto al destino que solo se renombra al terminar: sin diario, una
+    ejecución interrumpida dejaría una base de datos a medias que la
+    siguiente tomaría por existente. En una base de datos existente las
+    filas se insertan por el camino normal, con todos sus triggers. Devuelve
+    los segundos de la preparación final (0 si no hubo).
+    """
+    if os.path.exists(ruta):
+        _insertar(sqlite3.connect(ruta), generador, filas)
+        return 0
+
+    temporal = ruta + '.generando'
+    numeros = range(numero_lotes(filas))
+    procesos = max(1, min(procesos, len(numeros)))
+    tramos = [numeros[k * len(numeros) // procesos:(k + 1) * len(numeros) // procesos] for k in range(procesos)]
+    partes = [f'{temporal}.{k}' for k in range(procesos)]
+    for archivo in [temporal] + partes:
+        _borrar_base(archivo)
+    try:
+        conn = sqlite3.connect(temporal)
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(ESQUEMA_MATERIALES)
+        if procesos == 1:
+            _insertar(conn, generador, filas)
+        else:
+            _insertar_por_partes(conn, generador, filas, tramos, partes)
+
+        preparacion = 0
+        if not solo_tabla:
+            # Importaciones diferidas: solo hacen falta para preparar la base de datos
+            from base_datos import DatabaseManager
+            from tendencias import TrendEngine
+            inicio = time.perf_counter()
+            db = DatabaseManager(temporal)
+            tendencias = TrendEngine(temporal)
+            # Al cerrarse la última conexión, SQLite vuelca el WAL al archivo principal
+            # y lo borra, así que se mueve un único archivo completo
+            tendencias.close()
+            db.close()
+            preparacion = time.perf_counter() - inicio
+        os.replace(temporal, ruta)
+    except BaseException:
+        for archivo in [temporal] + partes:
+            _borrar_base(archivo)
+        raise
+    _borrar_base(temporal)
+    return preparacion
+
+
+def _insertar_por_partes(conn, generador, filas, tramos, partes):
+    """Generar cada tramo de lotes en un proceso y copiar las partes en orden; cierra la conexión"""
+    try:
+        with ProcessPoolExecutor(max_workers=len(partes)) as executor:
+            # map devuelve las partes en orden: se copia cada una mientras se generan las siguientes
+            for parte in executor.map(_escribir_parte, [generador] * len(partes), [filas] * len(partes),
+                                      tramos, partes):
+                _copiar_parte(conn, parte)
+    finally:
+        conn.close()
+
+
+def _escribir_parte(generador, filas, numeros, ruta):
+    """Escribir los lotes 'numeros' en la tabla 'generados' (sin clave) de una base de datos auxiliar"""
+    conn = sqlite3.connect(ruta)
+    try:
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(f'CREATE TABLE generados ({COLUMNAS_SQL})')
+        for lote in generador.lotes(filas, numeros):
+            conn.executemany('INSERT INTO generados VALUES (?, ?, ?, ?, ?, ?, ?, ?)', lote)
+        conn.commit()
+    finally:
+        conn.close()
+    return ruta
+
+
+def _copiar_parte(conn, parte):
+    """Añadir a materiales las filas de una parte y borrar su archivo"""
+    conn.execute('ATTACH DATABASE ? AS parte', (parte,))
+    try:
+        conn.execute(f'INSERT INTO materiales ({COLUMNAS_SQL}) '
+                     f'SELECT {COLUMNAS_SQL} FROM parte.generados ORDER BY rowid')
+        conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('DETACH DATABASE parte')
+    _borrar_base(parte)
+
+
+def _insertar(conn, generador, filas):
+    """Insertar los lotes del generador y cerrar la conexión"""
+    try:
+        for lote in generador.lotes(filas):
+            conn.executemany('INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', lote)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def _borrar_base(ruta):
+    """Eliminar una base de datos y sus archivos auxiliares si existen"""
+    for archivo in (ruta, ruta + '-journal', ruta + '-wal', ruta + '-shm'):
+        if os.path.exists(archivo):
+            os.remove(archivo)
+
+
+def escribir_csv(generador, filas, ruta):
+    """Escribir los materiales en un CSV con las columnas de la aplicación"""
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha'])
+        for lote in generador.lotes(filas):
+            writer.writerows(lote)
+
+
+def escribir_snapshot(generador, filas, ruta):
+    """Guardar los materiales como snapshot columnar"""
+    from columnar_snapshot import ColumnarSnapshot
+    snapshot = ColumnarSnapshot()
+    for lote in generador.lotes(filas):
+        snapshot.apply_changes(lote)
+    snapshot.save(ruta, 0)
+
+
+def fecha_argumento(texto):
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha no válida (use AAAA-MM-DD): {texto}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generar un inventario sintético reproducible para pruebas de carga")
+    parser.add_argument('filas', type=int, help="Número de materiales a generar")
+    parser.add_argument('salida', help="Base de datos (.db/.sqlite), CSV (.csv) o snapshot (.snap)")
+    parser.add_argument('--semilla', type=int, default=42, help="Semilla (la misma semilla da los mismos datos)")
+    parser.add_argument('--desde', type=fecha_argumento, default=DESDE_DEFECTO, help="Primera fecha (AAAA-MM-DD)")
+    parser.add_argument('--hasta', type=fecha_argumento, default=HASTA_DEFECTO, help="Última fecha (AAAA-MM-DD)")
+    parser.add_argument('--modelos', type=int, default=1000,
+                        help=f"Modelos distintos por nombre base (máximo {MAX_MODELOS})")
+    parser.add_argument('--prefijo', default='GEN-', help="Prefijo de los IDs generados")
+    parser.add_argument('--solo-tabla', action='store_true',
+                        help="En una base de datos nueva, no crear índices ni tablas derivadas "
+                             "(la aplicación los crea al abrirla)")
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                        help="Procesos que generan una base de datos nueva (por defecto, uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    if args.filas <= 0:
+        parser.error("El número de filas debe ser positivo")
+    if args.procesos <= 0:
+        parser.error("El número de procesos debe ser positivo")
+    try:
+        generador = GeneradorInventario(args.semilla, args.desde, args.hasta, args.modelos, args.prefijo)
+    except ValueError as e:
+        parser.error(str(e))
+
+    inicio = time.perf_counter()
+    preparacion = 0
+    extension = os.path.splitext(args.salida)[1].lower()
+    try:
+        if extension == '.csv':
+            escribir_csv(generador, args.filas, args.salida)
+        elif extension == '.snap':
+            escribir_snapshot(generador, args.filas, args.salida)
+        else:
+            preparacion = escribir_sqlite(generador, args.filas, args.salida, args.solo_tabla, args.procesos)
+    except sqlite3.IntegrityError as e:
+        print(f"Error al generar {args.salida}: {e} (use otro --prefijo para añadir a una base de datos existente)",
+              file=sys.stderr)
+        return 1
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error al generar {args.salida}: {e}", file=sys.stderr)
+        return 1
+
+    total = time.perf_counter() - inicio
+    generacion = total - preparacion
+    print(f"{args.filas} materiales generados en {args.salida} en {generacion:.1f} s "
+          f"({args.filas / generacion:,.0f} filas/s)")
+    if preparacion:
+        print(f"Índices y tablas derivadas creados en {preparacion:.1f} s (total {total:.1f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import csv
+import io
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Tamaño aproximado de cada fragmento del archivo que procesa un proceso
+TAMANO_FRAGMENTO = 8 * 1024 * 1024
+
+COLUMNAS_OBLIGATORIAS = ('Material', 'Tipo', 'Cantidad', 'Valor')
+
+
+def dividir_archivo(ruta, tamano_fragmento=TAMANO_FRAGMENTO):
+    """Dividir el archivo en rangos de bytes que empiezan y terminan en un salto de línea
+
+    Devuelve (encabezado, rangos); los rangos excluyen la línea de encabezado.
+    """
+    tamano = os.path.getsize(ruta)
+    rangos = []
+    with open(ruta, 'rb') as file:
+        encabezado = file.readline()
+        inicio = file.tell()
+        while inicio < tamano:
+            file.seek(min(inicio + tamano_fragmento, tamano))
+            if file.tell() < tamano:
+                file.readline()
+            fin = file.tell()
+            rangos.append((inicio, fin))
+            inicio = fin
+    columnas = next(csv.reader([encabezado.decode('utf-8-sig')]), [])
+    return columnas, rangos
+
+
+def parsear_fragmento(ruta, inicio, fin, columnas, fecha_defecto):
+    """Leer y validar un rango del archivo (se ejecuta en un proceso del pool)
+
+    Devuelve (filas, rechazos, lineas): filas válidas como tuplas listas para
+    insertar, rechazos como (línea relativa al fragmento, motivo) y el
+    número de líneas leídas.
+    """
+    with open(ruta, 'rb') as file:
+        file.seek(inicio)
+        datos = file.read(fin - inicio)
+
+    posiciones = {columna: i for i, columna in enumerate(columnas)}
+    faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in posiciones]
+    filas = []
+    rechazos = []
+    lineas = 0
+    reader = csv.reader(io.StringIO(datos.decode('utf-8'), newline=''))
+    while True:
+        try:
+            valores = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            # Campo demasiado grande, byte NUL...: se rechaza la fila como las demás mal formadas
+            lineas = reader.line_num
+            rechazos.append((reader.line_num, str(e)))
+            continue
+        lineas = reader.line_num
+        if not valores:
+            continue
+        if faltantes:
+            rechazos.append((reader.line_num, f"faltan columnas: {', '.join(faltantes)}"))
+            continue
+
+        def campo(nombre, defecto):
+            i = posiciones.get(nombre)
+            return valores[i] if i is not None and i < len(valores) else defecto
+
+        try:
+            filas.append((
+                campo('ID', ''),
+                valores[posiciones['Material']],
+                valores[posiciones['Tipo']],
+                float(valores[posiciones['Cantidad']]),
+                float(valores[posiciones['Valor']]),
+                campo('Ubicacion', 'No especificada'),
+                campo('Estado', 'Disponible'),
+                campo('Fecha', fecha_defecto)
+            ) + (reader.line_num,))
+        except (IndexError, ValueError) as e:
+            rechazos.append((reader.line_num, str(e)))
+    return filas, rechazos, lineas
+
+
+def _escribir_lote(cursor, filas, linea_base, rechazos):
+    """Insertar un lote; si hay IDs repetidos, identificar las filas rechazadas"""
+    datos = [fila[:8] for fila in filas]
+    cursor.execute('SAVEPOINT lote')
+    try:
+        cursor.executemany('''
+            INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', datos)
+        cursor.execute('RELEASE lote')
+        return len(datos)
+    except sqlite3.IntegrityError:
+        cursor.execute('ROLLBACK TO lote')
+        cursor.execute('RELEASE lote')
+
+    # Repetir fila a fila solo para este lote
+    insertadas = 0
+    for fila in filas:
+        try:
+            cursor.execute('''
+                INSERT INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', fila[:8])
+            insertadas += 1
+        except sqlite3.IntegrityError as e:
+            rechazos.append((linea_base + fila[8], str(e)))
+    return insertadas
+
+
+def importar_csv_paralelo(db_name, ruta, max_workers=None, tamano_fragmento=TAMANO_FRAGMENTO):
+    """Importar un CSV grande analizándolo en paralelo y escribiendo con una sola conexión
+
+    Los fragmentos se procesan en un pool de procesos y se escriben en el
+    orden del archivo, así que el orden de las filas y la lista de rechazos
+    son siempre los mismos. Devuelve {'importados': n, 'rechazados': [(línea, motivo)]}
+    con números de línea del archivo (el encabezado es la línea 1).
+    """
+    columnas, rangos = dividir_archivo(ruta, tamano_fragmento)
+    fecha_defecto = datetime.now().strftime('%d/%m/%Y')
+    importados = 0
+    rechazados = []
+    linea_base = 1
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, sqlite3.connect(db_name) as conn:
+        cursor = conn.cursor()
+        ventana = max_workers * 2
+        pendientes = deque()
+        siguiente = 0
+        while siguiente < len(rangos) or pendientes:
+            # Mantener un número limitado de fragmentos en vuelo para acotar la memoria
+            while siguiente < len(rangos) and len(pendientes) < ventana:
+                inicio, fin = rangos[siguiente]
+                pendientes.append(executor.submit(parsear_fragmento, ruta, inicio, fin, columnas, fecha_defecto))
+                siguiente += 1
+            filas, rechazos, lineas = pendientes.popleft().result()
+            rechazos_fragmento = [(linea_base + linea, motivo) for linea, motivo in rechazos]
+            importados += _escribir_lote(cursor, filas, linea_base, rechazos_fragmento)
+            conn.commit()
+            rechazados.extend(sorted(rechazos_fragmento))
+            linea_base += lineas
+
+    return {'importados': importados, 'rechazados': rechazados}
@@ -0,0 +1,189 @@
+import time
+
+INICIO = time.perf_counter()
+
+import argparse
+import importlib.util
+import os
+import sys
+
+from base_datos import DatabaseManager, COLUMNAS_ORDEN, UMBRAL_IMPORTACION_PARALELA
+
+# Interfaces gráficas que se pueden abrir desde la línea de comandos
+INTERFACES = {
+    'completa': 'AMPLIAADO 2,1.py',
+    'simple': 'proyecto ppt.py'
+}
+
+COLUMNAS_SALIDA = ('ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha')
+
+
+def abrir_interfaz(nombre):
+    """Abrir una de las interfaces gráficas; tkinter solo se importa aquí"""
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), INTERFACES[nombre])
+    spec = importlib.util.spec_from_file_location('interfaz_' + nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    modulo.main()
+    return 0
+
+
+def filtros(args):
+    return {campo: getattr(args, campo) for campo in ('texto', 'tipo', 'estado', 'ubicacion') if getattr(args, campo, None)}
+
+
+def importar(manager, args):
+    if args.paralelo or os.path.getsize(args.archivo) >= UMBRAL_IMPORTACION_PARALELA:
+        resultado = manager.import_from_csv_parallel(args.archivo, args.procesos)
+        for linea, motivo in resultado['rechazados'][:10]:
+            print(f"Línea {linea} rechazada: {motivo}", file=sys.stderr)
+        if len(resultado['rechazados']) > 10:
+            print(f"... y {len(resultado['rechazados']) - 10} rechazos más", file=sys.stderr)
+        importados = resultado['importados']
+    else:
+        importados = manager.import_from_csv(args.archivo)
+    print(f"{importados} materiales importados de {args.archivo}")
+    return 0 if importados else 1
+
+
+def exportar(manager, args):
+    if args.cambios:
+        resultado = manager.export_changes_to_csv(args.archivo, args.destino)
+        if resultado is None:
+            return 1
+        filas, seq, completa = resultado
+        tipo = "completa (primera sincronización)" if completa else "de cambios"
+        if isinstance(seq, dict):
+            # Modo fragmentado: una secuencia por fragmento
+            seq = ', '.join(f"{fragmento} {ultima}" for fragmento, ultima in sorted(seq.items()))
+        print(f"Exportación {tipo}: {filas} filas hasta la secuencia {seq} en {args.archivo}")
+        return 0
+    if args.archivo.lower().endswith('.snap'):
+        exportado = manager.export_snapshot(args.archivo)
+    else:
+        exportado = manager.export_to_csv(args.archivo)
+    if exportado:
+        print(f"Datos exportados a {args.archivo}")
+    return 0 if exportado else 1
+
+
+def estadisticas(manager, args):
+    stats = manager.get_statistics(filtros(args))
+    if not stats or not stats['general'][0]:
+        print("No hay materiales que cumplan los filtros")
+        return 0
+    total_items, total_qty, total_value, avg_value = stats['general']
+    print(f"Total de Registros: {total_items}")
+    print(f"Cantidad Total: {total_qty:.2f}")
+    print(f"Valor Total de Inventario: ${total_value:,.2f}")
+    print(f"Valor Promedio por Material: ${avg_value:,.2f}")
+    print("\nPor tipo:")
+    for tipo, count, qty, value, avg in stats['por_tipo']:
+        print(f"  {tipo}: {count} ítems | {qty:.2f} unidades | Valor: ${value:,.2f}")
+    print("\nPor ubicación:")
+    for ubicacion, count in stats['por_ubicacion']:
+        print(f"  {ubicacion or 'Sin especificar'}: {count} ítems")
+    print("\nPor estado:")
+    for estado, count, qty, value in stats['por_estado']:
+        print(f"  {estado or 'Sin especificar'}: {count} ítems | {qty:.2f} unidades | Valor: ${value:,.2f}")
+    return 0
+
+
+def buscar(manager, args):
+    materiales, siguiente = manager.get_materials_sorted(filtros(args), args.orden, args.desc, args.limite)
+    parecidos = False
+    if not materiales and args.texto:
+        # Igual que en la interfaz: sin coincidencias exactas, nombres parecidos
+        materiales = manager.search_materials_fuzzy(args.texto, args.tipo or 'Todos', args.estado or 'Todos', args.limite)
+        parecidos = bool(materiales)
+    print('\t'.join(COLUMNAS_SALIDA))
+    for material in materiales:
+        print('\t'.join('' if material[c] is None else str(material[c]) for c in COLUMNAS_SALIDA))
+    if parecidos:
+        print("(sin coincidencias exactas: nombres parecidos)", file=sys.stderr)
+    elif siguiente is not None:
+        print(f"(mostrando los primeros {args.limite}; use --limite para ver más)", file=sys.stderr)
+    return 0
+
+
+def compactar(manager, args):
+    resultado = manager.vacuum()
+    if resultado is None:
+        return 1
+    antes, despues = resultado
+    print(f"Base de datos compactada: {antes / 1e6:.1f} MB -> {despues / 1e6:.1f} MB")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Inventario de materiales sin interfaz gráfica (sin comando se abre la interfaz)")
+    parser.add_argument('--db', default='materiales.db', help="Base de datos (la interfaz gráfica usa siempre materiales.db)")
+    parser.add_argument('--fragmentos', metavar='DIR', help="Usar la base de datos fragmentada de este directorio")
+    parser.add_argument('--tiempo', action='store_true', help="Mostrar en stderr el tiempo de arranque y del comando")
+    subparsers = parser.add_subparsers(dest='comando')
+
+    gui = subparsers.add_parser('gui', help="Abrir la interfaz gráfica")
+    gui.add_argument('--interfaz', choices=sorted(INTERFACES), default='completa')
+
+    importar_p = subparsers.add_parser('importar', help="Importar materiales desde un CSV")
+    importar_p.add_argument('archivo')
+    importar_p.add_argument('--paralelo', action='store_true',
+                            help="Analizar el CSV en varios procesos (automático en archivos grandes)")
+    importar_p.add_argument('--procesos', type=int, help="Procesos para la importación en paralelo")
+    importar_p.set_defaults(funcion=importar)
+
+    exportar_p = subparsers.add_parser('exportar', help="Exportar a CSV (o a snapshot si el archivo termina en .snap)")
+    exportar_p.add_argument('archivo')
+    exportar_p.add_argument('--cambios', action='store_true', help="Solo los cambios desde la última exportación")
+    exportar_p.add_argument('--destino', default='erp', help="Destino de la exportación de cambios")
+    exportar_p.set_defaults(funcion=exportar)
+
+    estadisticas_p = subparsers.add_parser('estadisticas', help="Estadísticas del inventario, opcionalmente filtradas")
+    estadisticas_p.add_argument('--texto', help="Texto contenido en el nombre")
+    estadisticas_p.set_defaults(funcion=estadisticas)
+
+    buscar_p = subparsers.add_parser('buscar', help="Buscar materiales")
+    buscar_p.add_argument('texto', nargs='?', default='', help="Texto contenido en el nombre")
+    buscar_p.add_argument('--orden', choices=list(COLUMNAS_ORDEN), default='Fecha')
+    buscar_p.add_argument('--desc', action='store_true', help="Orden descendente")
+    buscar_p.add_argument('--limite', type=int, default=50)
+    buscar_p.set_defaults(funcion=buscar)
+
+    for sub in (estadisticas_p, buscar_p):
+        sub.add_argument('--tipo')
+        sub.add_argument('--estado')
+        sub.add_argument('--ubicacion')
+
+    vacuum = subparsers.add_parser('vacuum', help="Compactar la base de datos y actualizar sus estadísticas")
+    vacuum.set_defaults(funcion=compactar)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.comando in (None, 'gui'):
+        return abrir_interfaz(getattr(args, 'interfaz', 'completa'))
+
+    if args.fragmentos:
+        from base_datos_fragmentada import ShardedDatabaseManager
+        manager = ShardedDatabaseManager(args.fragmentos)
+    else:
+        manager = DatabaseManager(args.db)
+    arranque = time.perf_counter()
+    try:
+        resultado = args.funcion(manager, args)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        resultado = 1
+    finally:
+        if args.fragmentos:
+            manager.close()
+    if args.tiempo:
+        print(f"Arranque: {(arranque - INICIO) * 1000:.0f} ms, {args.comando}: "
+              f"{(time.perf_counter() - arranque) * 1000:.0f} ms", file=sys.stderr)
+    return resultado
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+# Tipos de movimiento de stock
+ENTRADA = 'entrada'
+SALIDA = 'salida'
+AJUSTE = 'ajuste'
+TIPOS_MOVIMIENTO = (ENTRADA, SALIDA, AJUSTE)
+
+# Cada cuántos movimientos de un material se guarda un saldo de control
+INTERVALO_CONTROL = 64
+
+FORMATO_MOMENTO = '%Y-%m-%d %H:%M:%S'
+
+# Referencia de los ajustes que registra el trigger cuando la cantidad cambia fuera del libro
+REFERENCIA_AJUSTE_DIRECTO = 'ajuste directo'
+
+# Fecha de alta de OLD como momento del libro ('YYYY-mm-dd 00:00:00'), o ahora si no se reconoce
+_ALTA_SQL = """
+    MIN(datetime('now', 'localtime'),
+        COALESCE(datetime(CASE WHEN OLD.fecha LIKE '__/__/____'
+                               THEN substr(OLD.fecha, 7, 4) || '-' || substr(OLD.fecha, 4, 2) || '-' || substr(OLD.fecha, 1, 2)
+                               ELSE OLD.fecha END),
+                 datetime('now', 'localtime')))
+"""
+
+
+def normalizar_momento(momento=None, fin_del_dia=False):
+    """Convertir un datetime, 'YYYY-mm-dd[ HH:MM:SS]' o 'dd/mm/YYYY' al formato ordenable del libro
+
+    Una fecha sin hora se interpreta como el inicio del día, o como su
+    final con 'fin_del_dia' (para consultar el saldo al cierre).
+    """
+    if momento is None:
+        return datetime.now().strftime(FORMATO_MOMENTO)
+    if isinstance(momento, datetime):
+        return momento.strftime(FORMATO_MOMENTO)
+    texto = str(momento).strip()
+    for formato in (FORMATO_MOMENTO, '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M:%S'):
+        try:
+            return datetime.strptime(texto, formato).strftime(FORMATO_MOMENTO)
+        except ValueError:
+            pass
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            dia = datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+            return dia + (' 23:59:59' if fin_del_dia else ' 00:00:00')
+        except ValueError:
+            pass
+    raise ValueError(f"Momento no válido: {momento}")
+
+
+class StockLedger:
+    """Libro de movimientos de stock (entradas, salidas y ajustes)
+
+    Cada movimiento guarda la variación de cantidad y actualiza en la misma
+    transacción la cantidad de 'materiales', que hace de saldo actual; si la
+    cantidad cambia por otro camino (edición, adjust_quantity, update_where)
+    un trigger registra la diferencia como ajuste. Cada
+    INTERVALO_CONTROL movimientos de un material se guarda un saldo de
+    control, así que el stock en una fecha se calcula con una búsqueda en
+    índice más, como mucho, un intervalo de movimientos, sin repetir toda
+    la historia.
+    """
+
+    def __init__(self, db_name='materiales.db', intervalo_control=INTERVALO_CONTROL):
+        self.db_name = db_name
+        self.intervalo_control = intervalo_control
+        self.init_schema()
+
+    def init_schema(self):
+        """Crear las tablas del libro y sus índices"""
+        try:
+            with closing(sqlite3.connect(self.db_name)) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS movimientos (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT NOT NULL,
+                        tipo TEXT NOT NULL CHECK (tipo IN {TIPOS_MOVIMIENTO}),
+                        cantidad REAL NOT NULL,
+                        momento TEXT NOT NULL,
+                        referencia TEXT
+                    )
+                ''')
+                # (id, momento) lleva implícito el seq: sirve para sumar tramos en orden
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_movimientos_id_momento ON movimientos (id, momento)')
+
+                # Saldo de un material incluyendo todos sus movimientos hasta (momento, seq)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS saldos_control (
+                        id TEXT NOT NULL,
+                        momento TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        saldo REAL NOT NULL,
+                        PRIMARY KEY (id, momento, seq)
+                    ) WITHOUT ROWID
+                ''')
+
+                # Materiales cuyo movimiento está registrando el libro en la transacción actual
+                cursor.execute('CREATE TABLE IF NOT EXISTS movimientos_en_curso (id TEXT PRIMARY KEY)')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS libro_materiales_cantidad
+                    AFTER UPDATE OF cantidad ON materiales
+                    WHEN OLD.cantidad IS NOT NEW.cantidad
+                         AND NOT EXISTS (SELECT 1 FROM movimientos_en_curso WHERE id = NEW.id)
+                    BEGIN
+                        INSERT INTO movimientos (id, tipo, cantidad, momento, referencia)
+                        SELECT NEW.id, '{AJUSTE}', OLD.cantidad, {_ALTA_SQL}, 'saldo inicial'
+                        WHERE OLD.cantidad <> 0 AND NOT EXISTS (SELECT 1 FROM movimientos WHERE id = NEW.id);
+                        INSERT INTO movimientos (id, tipo, cantidad, momento, referencia)
+                        VALUES (NEW.id, '{AJUSTE}', NEW.cantidad - OLD.cantidad, datetime('now', 'localtime'),
+                                '{REFERENCIA_AJUSTE_DIRECTO}');
+                        UPDATE saldos_control SET saldo = saldo + NEW.cantidad - OLD.cantidad
+                        WHERE id = NEW.id AND momento > datetime('now', 'localtime');
+                    END
+                ''')
+                conn.commit()
+        except Exception as e:
+            print(f"Error al inicializar el libro de movimientos: {e}")
+
+    def record(self, material_id, tipo, cantidad, referencia='', momento=None):
+        """Registrar un movimiento y actualizar la cantidad del material
+
+        'cantidad' es positiva para entradas y salidas; en los ajustes es la
+        variación con signo. Devuelve (cantidad actual, versión), o None si
+        el material no existe o la salida dejaría el stock en negativo.
+        """
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            resultado = self._registrar(cursor, material_id, tipo, cantidad, referencia,
+                                        normalizar_momento(momento))
+            if resultado is not None:
+                self._controlar(cursor, [material_id])
+            conn.commit()
+            return resultado
+
+    def record_many(self, movimientos, batch_size=1000):
+        """Registrar muchos movimientos con una transacción por lote
+
+        'movimientos' es un iterable de diccionarios con 'ID', 'Tipo',
+        'Cantidad' y opcionalmente 'Referencia' y 'Momento'. Devuelve
+        {'registrados': n, 'rechazados': [(posición, motivo)]}.
+        """
+        registrados = 0
+        rechazados = []
+        lote = []
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            for posicion, movimiento in enumerate(movimientos):
+                lote.append((posicion, movimiento))
+                if len(lote) >= batch_size:
+                    registrados += self._registrar_lote(cursor, lote, rechazados)
+                    conn.commit()
+                    lote = []
+            if lote:
+                registrados += self._registrar_lote(cursor, lote, rechazados)
+                conn.commit()
+        return {'registrados': registrados, 'rechazados': rechazados}
+
+    def _registrar_lote(self, cursor, lote, rechazados):
+        registrados = 0
+        pendientes = {}
+        for posicion, movimiento in lote:
+            try:
+                resultado = self._registrar(
+                    cursor, movimiento['ID'], movimiento['Tipo'], float(movimiento['Cantidad']),
+                    movimiento.get('Referencia', ''), normalizar_momento(movimiento.get('Momento')))
+            except (KeyError, ValueError) as e:
+                rechazados.append((posicion, str(e)))
+                continue
+            if resultado is None:
+                rechazados.append((posicion, "material inexistente o stock insuficiente"))
+                continue
+            registrados += 1
+            # Revisar los saldos de control solo cuando un material acumula un intervalo
+            material_id = movimiento['ID']
+            pendientes[material_id] = pendientes.get(material_id, 0) + 1
+            if pendientes[material_id] >= self.intervalo_control:
+                self._controlar(cursor, [material_id])
+                pendientes[material_id] = 0
+        self._controlar(cursor, [m for m, n in pendientes.items() if n])
+        return registrados
+
+    def _registrar(self, cursor, material_id, tipo, cantidad, referencia, momento):
+        if tipo not in TIPOS_MOVIMIENTO:
+            raise ValueError(f"Tipo de movimiento no válido: {tipo}")
+        if tipo != AJUSTE and cantidad <= 0:
+            raise ValueError("La cantidad de una entrada o salida debe ser positiva")
+        delta = -cantidad if tipo == SALIDA else cantidad
+
+        # El primer movimiento de un material abre su historia con la cantidad que ya tenía.
+        # La comprobación se hace con el bloqueo de escritura tomado: dos primeros
+        # movimientos simultáneos abrirían cada uno su propio saldo inicial.
+        if not cursor.connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT 1 FROM movimientos WHERE id = ? LIMIT 1', (material_id,))
+        if cursor.fetchone() is None:
+            cursor.execute('SELECT cantidad, fecha FROM materiales WHERE id = ?', (material_id,))
+            fila = cursor.fetchone()
+            if fila is None:
+                return None
+            if fila[0]:
+                try:
+                    apertura = min(normalizar_momento(fila[1]), momento)
+                except ValueError:
+                    apertura = momento
+                cursor.execute('''
+                    INSERT INTO movimientos (id, tipo, cantidad, momento, referencia)
+                    VALUES (?, ?, ?, ?, 'saldo inicial')
+                ''', (material_id, AJUSTE, fila[0], apertura))
+
+        # El movimiento se registra aquí: el trigger de ajustes no debe duplicarlo
+        cursor.execute('INSERT OR IGNORE INTO movimientos_en_curso (id) VALUES (?)', (material_id,))
+        cursor.execute('''
+            UPDATE materiales
+            SET cantidad = cantidad + ?, version = version + 1
+            WHERE id = ? AND (? >= 0 OR cantidad + ? >= 0)
+            RETURNING CAST(cantidad AS REAL), version
+        ''', (delta, material_id, delta, delta))
+        resultado = cursor.fetchone()
+        cursor.execute('DELETE FROM movimientos_en_curso WHERE id = ?', (material_id,))
+        if resultado is None:
+            return None
+        cursor.execute('''
+            INSERT INTO movimientos (id, tipo, cantidad, momento, referencia)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (material_id, tipo, delta, momento, referencia))
+        # Un movimiento con fecha atrasada corrige los saldos de control posteriores
+        cursor.execute('''
+            UPDATE saldos_control SET saldo = saldo + ?
+            WHERE id = ? AND momento > ?
+        ''', (delta, material_id, momento))
+        return resultado
+
+    def _controlar(self, cursor, ids):
+        """Guardar un saldo de control de los materiales con muchos movimientos desde el último"""
+        for material_id in ids:
+            cursor.execute('''
+                SELECT momento, seq, saldo FROM saldos_control WHERE id = ?
+                ORDER BY momento DESC, seq DESC LIMIT 1
+            ''', (material_id,))
+            ultimo = cursor.fetchone() or ('', 0, 0.0)
+            cursor.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM movimientos WHERE id = ? AND (momento, seq) > (?, ?) LIMIT ?
+                )
+            ''', (material_id, ultimo[0], ultimo[1], self.intervalo_control))
+            if cursor.fetchone()[0] < self.intervalo_control:
+                continue
+            # Saldo tras el último movimiento: el control anterior más los movimientos posteriores
+            cursor.execute('''
+                INSERT OR REPLACE INTO saldos_control (id, momento, seq, saldo)
+                SELECT mov.id, mov.momento, mov.seq,
+                       ? + (SELECT TOTAL(cantidad) FROM movimientos WHERE id = mov.id AND (momento, seq) > (?, ?))
+                FROM (SELECT id, momento, seq FROM movimientos WHERE id = ?
+                      ORDER BY momento DESC, seq DESC LIMIT 1) AS mov
+            ''', (ultimo[2], ultimo[0], ultimo[1], material_id))
+
+    def stock_at(self, material_id, momento=None):
+        """Stock de un material en un momento (por defecto, ahora)
+
+        Con una fecha sin hora se devuelve el saldo al final de ese día.
+        Los materiales sin movimientos registrados devuelven su cantidad
+        actual si 'momento' es posterior a su fecha de alta.
+        """
+        momento = normalizar_momento(momento, fin_del_dia=True)
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT momento, seq, saldo FROM saldos_control
+                WHERE id = ? AND momento <= ?
+                ORDER BY momento DESC, seq DESC LIMIT 1
+            ''', (material_id, momento))
+            control = cursor.fetchone() or ('', 0, 0.0)
+            cursor.execute('''
+                SELECT TOTAL(cantidad), COUNT(*) FROM movimientos
+                WHERE id = ? AND momento <= ? AND (momento, seq) > (?, ?)
+            ''', (material_id, momento, control[0], control[1]))
+            suma, contados = cursor.fetchone()
+            if contados or control[0]:
+                return control[2] + suma
+
+            # Sin historia: el material conserva la cantidad con la que se dio de alta
+            cursor.execute('SELECT 1 FROM movimientos WHERE id = ? LIMIT 1', (material_id,))
+            if cursor.fetchone() is not None:
+                return 0.0
+            cursor.execute('SELECT cantidad, fecha FROM materiales WHERE id = ?', (material_id,))
+            fila = cursor.fetchone()
+            if fila is None:
+                return None
+            try:
+                alta = normalizar_momento(fila[1])
+            except ValueError:
+                alta = ''
+            return float(fila[0]) if alta <= momento else 0.0
+
+    def movements(self, material_id, desde=None, hasta=None, limit=None):
+        """Movimientos de un material en orden cronológico, opcionalmente entre dos momentos
+
+        'Cantidad' es la variación con signo (negativa en las salidas).
+        """
+        condiciones = ['id = ?']
+        params = [material_id]
+        if desde is not None:
+            condiciones.append('momento >= ?')
+            params.append(normalizar_momento(desde))
+        if hasta is not None:
+            condiciones.append('momento <= ?')
+            params.append(normalizar_momento(hasta, fin_del_dia=True))
+        consulta = f'''
+            SELECT seq, tipo, cantidad, momento, referencia FROM movimientos
+            WHERE {' AND '.join(condiciones)} ORDER BY momento, seq
+        '''
+        if limit is not None:
+            consulta += ' LIMIT ?'
+            params.append(int(limit))
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute(consulta, params)
+            return [{'Secuencia': fila[0], 'Tipo': fila[1], 'Cantidad': fila[2],
+                     'Momento': fila[3], 'Referencia': fila[4]} for fila in cursor.fetchall()]
@@ -0,0 +1,242 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from base_datos import DatabaseManager
+
+# Columnas de los dos formatos CSV heredados
+COLUMNAS_COMPLETAS = ['ID', 'Material', 'Tipo', 'Cantidad', 'Valor', 'Ubicacion', 'Estado', 'Fecha']
+COLUMNAS_BASICAS = ['Material', 'Tipo', 'Cantidad', 'Valor']
+
+TAMANO_LOTE = 5000
+
+# Bytes previos al punto de control que se guardan para detectar si el archivo se reescribió
+TAMANO_HUELLA = 256
+
+
+class MigradorCSV:
+    """Migración reanudable de los CSV heredados a la tabla materiales
+
+    Acepta el formato de 8 columnas (registros_materiales.csv) y el de 4
+    columnas de proyecto ppt.py (registros.csv). Cada lote se inserta en
+    una transacción junto con el punto de control, de modo que una
+    ejecución interrumpida continúa donde quedó sin duplicar filas.
+
+    El punto de control es el desplazamiento del final del último registro
+    leído (un registro puede ocupar varias líneas si tiene saltos de línea
+    entre comillas) junto con los bytes que lo preceden. Si el archivo se
+    reescribió desde entonces (por ejemplo al compactar registros.csv),
+    esos bytes ya no coinciden y la migración vuelve a empezar; los IDs
+    generados se numeran por fila aceptada y los existentes se conservan,
+    así que repetir el recorrido no duplica materiales.
+    """
+
+    def __init__(self, db_manager, tamano_lote=TAMANO_LOTE):
+        self.db_manager = db_manager
+        self.tamano_lote = tamano_lote
+        self.init_schema()
+
+    def init_schema(self):
+        """Crear la tabla de puntos de control de migración"""
+        with sqlite3.connect(self.db_manager.db_name) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS migraciones (
+                    archivo TEXT PRIMARY KEY,
+                    encabezado TEXT NOT NULL,
+                    desplazamiento INTEGER NOT NULL,
+                    filas INTEGER NOT NULL,
+                    rechazadas INTEGER NOT NULL,
+                    completada INTEGER NOT NULL DEFAULT 0,
+                    actualizada TEXT NOT NULL,
+                    huella BLOB
+                )
+            ''')
+            # Bases de datos anteriores: añadir la huella del punto de control
+            cursor = conn.execute('PRAGMA table_info(migraciones)')
+            if 'huella' not in [columna[1] for columna in cursor.fetchall()]:
+                conn.execute('ALTER TABLE migraciones ADD COLUMN huella BLOB')
+            conn.commit()
+
+    def punto_control(self, archivo):
+        """Obtener el punto de control de un archivo, o None si nunca se migró"""
+        with sqlite3.connect(self.db_manager.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT encabezado, desplazamiento, filas, rechazadas, completada, huella FROM migraciones WHERE archivo = ?',
+                (os.path.abspath(archivo),)
+            )
+            return cursor.fetchone()
+
+    def pendiente(self, archivo):
+        """Indicar si el archivo tiene datos sin migrar respecto a su punto de control"""
+        punto = self.punto_control(archivo)
+        if punto is None or not os.path.exists(archivo):
+            return False
+        with open(archivo, 'rb') as file:
+            if not self._mismo_archivo(file, punto):
+                return True
+        return os.path.getsize(archivo) > punto[1]
+
+    def _huella(self, file, desplazamiento):
+        """Leer los bytes que preceden a un desplazamiento del archivo"""
+        inicio = max(desplazamiento - TAMANO_HUELLA, 0)
+        file.seek(inicio)
+        return file.read(desplazamiento - inicio)
+
+    def _mismo_archivo(self, file, punto):
+        """Comprobar que el contenido previo al punto de control no ha cambiado"""
+        if punto[1] > os.fstat(file.fileno()).st_size:
+            return False
+        # Puntos de control anteriores a la huella: no se pueden verificar
+        if punto[5] is None:
+            return True
+        return self._huella(file, punto[1]) == punto[5]
+
+    def convertir_fila(self, valores, columnas, prefijo_id, numero_fila, fecha_defecto):
+        """Convertir una fila de cualquiera de los dos formatos al registro completo"""
+        row = dict(zip(columnas, valores))
+        return (
+            row.get('ID') or f"{prefijo_id}-{numero_fila:08d}",
+            row['Material'],
+            row['Tipo'],
+            float(row['Cantidad']),
+            float(row['Valor']),
+            row.get('Ubicacion') or 'No especificada',
+            row.get('Estado') or 'Disponible',
+            row.get('Fecha') or fecha_defecto
+        )
+
+    def migrar(self, archivo, progreso=None):
+        """Migrar un archivo CSV heredado, reanudando desde su punto de control
+
+        Devuelve un diccionario con las filas insertadas, las rechazadas y
+        si la migración terminó.
+        """
+        ruta = os.path.abspath(archivo)
+        fecha_defecto = datetime.fromtimestamp(os.path.getmtime(ruta)).strftime('%d/%m/%Y')
+        prefijo_id = 'MIG-' + hashlib.sha1(os.path.basename(ruta).encode('utf-8')).hexdigest()[:8]
+
+        with open(ruta, 'rb') as file:
+            linea_encabezado = file.readline()
+            columnas = next(csv.reader([linea_encabezado.decode('utf-8-sig')]), [])
+            if set(COLUMNAS_BASICAS) - set(columnas):
+                raise ValueError(f"Formato CSV no reconocido en {archivo}: {columnas}")
+            encabezado = ','.join(columnas)
+
+            # Reanudar desde el punto de control si el archivo sigue siendo el mismo
+            inicio_datos = file.tell()
+            punto = self.punto_control(ruta)
+            desplazamiento = inicio_datos
+            filas = rechazadas = 0
+            if punto is not None and punto[0] == encabezado and self._mismo_archivo(file, punto):
+                desplazamiento, filas, rechazadas = punto[1], punto[2], punto[3]
+            file.seek(desplazamiento)
+
+            insertadas = 0
+            lote = []
+            with sqlite3.connect(self.db_manager.db_name) as conn:
+                cursor = conn.cursor()
+                for registro in self._registros(file):
+                    desplazamiento += len(registro)
+                    if not registro.strip(b'\r\n'):
+                        continue
+                    filas += 1
+                    try:
+                        texto = registro.decode('utf-8').rstrip('\r\n')
+                        valores = next(csv.reader(io.StringIO(texto, newline='')))
+                        # Numerar por fila aceptada: las filas corruptas que elimina una
+                        # compactación no desplazan los IDs generados de las siguientes
+                        lote.append(self.convertir_fila(valores, columnas, prefijo_id, filas - rechazadas, fecha_defecto))
+                    except (KeyError, ValueError, StopIteration, csv.Error):
+                        rechazadas += 1
+                    if len(lote) >= self.tamano_lote:
+                        huella = self._huella_actual(file, desplazamiento)
+                        insertadas += self._guardar_lote(cursor, ruta, encabezado, lote, desplazamiento, filas, rechazadas, huella, False)
+                        conn.commit()
+                        lote = []
+                        if progreso:
+                            progreso(filas, desplazamiento)
+                huella = self._huella_actual(file, desplazamiento)
+                insertadas += self._guardar_lote(cursor, ruta, encabezado, lote, desplazamiento, filas, rechazadas, huella, True)
+                conn.commit()
+                if progreso:
+                    progreso(filas, desplazamiento)
+
+        return {'insertadas': insertadas, 'filas': filas, 'rechazadas': rechazadas, 'completada': True}
+
+    def _registros(self, file):
+        """Registros en bruto desde la posición actual del archivo
+
+        Un registro ocupa varias líneas si un campo entre comillas contiene
+        saltos de línea. El último se devuelve aunque no termine en salto de
+        línea o le falten comillas de cierre, para que se inserte o se cuente
+        como rechazado en lugar de quedar pendiente para siempre.
+        """
+        registro = b''
+        for linea in file:
+            registro += linea
+            if linea.endswith(b'\n') and registro.count(b'"') % 2 == 0:
+                yield registro
+                registro = b''
+        if registro:
+            yield registro
+
+    def _huella_actual(self, file, desplazamiento):
+        """Huella del punto de control sin perder la posición de lectura"""
+        posicion = file.tell()
+        huella = self._huella(file, desplazamiento)
+        file.seek(posicion)
+        return huella
+
+    def _guardar_lote(self, cursor, ruta, encabezado, lote, desplazamiento, filas, rechazadas, huella, completada):
+        """Insertar un lote y su punto de control dentro de la misma transacción"""
+        insertadas = 0
+        if lote:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO materiales (id, material, tipo, cantidad, valor, ubicacion, estado, fecha)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', lote)
+            insertadas = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO migraciones (archivo, encabezado, desplazamiento, filas, rechazadas, completada, actualizada, huella)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(archivo) DO UPDATE SET
+                encabezado = excluded.encabezado,
+                desplazamiento = excluded.desplazamiento,
+                filas = excluded.filas,
+                rechazadas = excluded.rechazadas,
+                completada = excluded.completada,
+                actualizada = excluded.actualizada,
+                huella = excluded.huella
+        ''', (ruta, encabezado, desplazamiento, filas, rechazadas, int(completada),
+              datetime.now().strftime('%d/%m/%Y %H:%M:%S'), huella))
+        return insertadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrar CSV heredados a la base de datos de materiales")
+    parser.add_argument('archivos', nargs='+', help="registros_materiales.csv y/o registros.csv")
+    parser.add_argument('--db', default='materiales.db', help="Base de datos de destino")
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas por transacción")
+    args = parser.parse_args(argv)
+
+    migrador = MigradorCSV(DatabaseManager(args.db), args.lote)
+    for archivo in args.archivos:
+        def progreso(filas, desplazamiento, tamano=os.path.getsize(archivo)):
+            print(f"\r{archivo}: {filas} filas ({desplazamiento * 100 // max(tamano, 1)}%)", end='', file=sys.stderr)
+        try:
+            resultado = migrador.migrar(archivo, progreso)
+        except Exception as e:
+            print(f"\nError al migrar {archivo}: {e}", file=sys.stderr)
+            return 1
+        print(f"\n{archivo}: {resultado['insertadas']} insertadas, {resultado['rechazadas']} rechazadas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
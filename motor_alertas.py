@@ -0,0 +1,269 @@
+import sqlite3
+from contextlib import closing
+
+# Reglas de alerta
+REGLA_STOCK = 'stock'
+REGLA_ESTADO = 'estado'
+
+# Ámbitos de los puntos de reorden, del más específico al más general
+AMBITOS_REORDEN = ('material', 'tipo', 'general')
+
+# Reglas iniciales: avisar de lo agotado y de lo que lleva días dañado o en reparación
+REGLAS_ESTADO_INICIALES = {'Dañado': 3, 'En Reparación': 14}
+PUNTO_REORDEN_GENERAL = 0
+
+
+def _punto_reorden_sql(fila):
+    """SQL con el punto de reorden vigente para una fila (regla del material, de su tipo o general)"""
+    return f"""
+        COALESCE((SELECT punto FROM reglas_reorden WHERE ambito = 'material' AND clave = {fila}.id),
+                 (SELECT punto FROM reglas_reorden WHERE ambito = 'tipo' AND clave = {fila}.tipo),
+                 (SELECT punto FROM reglas_reorden WHERE ambito = 'general' AND clave = ''))
+    """
+
+
+def _evaluar_stock_sql(fila, cerrar=True):
+    """SQL que abre, actualiza o, con 'cerrar', cierra la alerta de stock de una fila (NEW en los triggers)"""
+    punto = _punto_reorden_sql(fila)
+    cierre = f"""
+        DELETE FROM alertas WHERE id = {fila}.id AND regla = '{REGLA_STOCK}'
+            AND NOT COALESCE({fila}.cantidad <= {punto}, 0);
+    """ if cerrar else ''
+    return cierre + f"""
+        INSERT INTO alertas (id, regla, detalle, valor, limite, desde)
+        SELECT {fila}.id, '{REGLA_STOCK}', NULL, {fila}.cantidad, p.punto, datetime('now')
+        FROM (SELECT {punto} AS punto) AS p
+        WHERE {fila}.cantidad <= p.punto
+        ON CONFLICT(id, regla) DO UPDATE SET valor = excluded.valor, limite = excluded.limite;
+    """
+
+
+def _estado_inmediato_sql(fila):
+    """SQL que abre en el acto las alertas de estado cuya regla no exige antigüedad"""
+    return f"""
+        INSERT OR IGNORE INTO alertas (id, regla, detalle, valor, limite, desde)
+        SELECT {fila}.id, '{REGLA_ESTADO}', estado, NULL, dias, datetime('now')
+        FROM reglas_estado WHERE estado = {fila}.estado AND dias <= 0;
+    """
+
+
+class AlertEngine:
+    """Alertas de stock bajo y de estados prolongados, mantenidas de forma incremental
+
+    Los triggers sobre 'materiales' evalúan las reglas de la fila que cambia
+    en cada inserción, modificación o borrado, así que nunca hace falta
+    recorrer el inventario. Las alertas de estado dependen del paso del
+    tiempo: se abren al consultarlas con una búsqueda por índice en
+    (estado, desde) de cada regla.
+    """
+
+    def __init__(self, db_name='materiales.db'):
+        self.db_name = db_name
+        self.init_schema()
+
+    def init_schema(self):
+        """Crear las tablas de reglas y alertas y los triggers, rellenándolas si son nuevas"""
+        try:
+            with closing(sqlite3.connect(self.db_name)) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='alertas'")
+                existia = cursor.fetchone() is not None
+
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS reglas_reorden (
+                        ambito TEXT NOT NULL CHECK (ambito IN {AMBITOS_REORDEN}),
+                        clave TEXT NOT NULL,
+                        punto REAL NOT NULL,
+                        PRIMARY KEY (ambito, clave)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS reglas_estado (
+                        estado TEXT PRIMARY KEY,
+                        dias REAL NOT NULL
+                    )
+                ''')
+                # Desde cuándo está cada material en su estado actual
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS estado_materiales (
+                        id TEXT PRIMARY KEY,
+                        estado TEXT,
+                        desde TEXT NOT NULL
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS alertas (
+                        id TEXT NOT NULL,
+                        regla TEXT NOT NULL,
+                        detalle TEXT,
+                        valor REAL,
+                        limite REAL,
+                        desde TEXT NOT NULL,
+                        PRIMARY KEY (id, regla)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_alertas_desde ON alertas (desde)')
+
+                cursor.executescript(f'''
+                    CREATE TRIGGER IF NOT EXISTS alertas_materiales_insert
+                    AFTER INSERT ON materiales BEGIN
+                        INSERT OR REPLACE INTO estado_materiales (id, estado, desde)
+                        VALUES (NEW.id, NEW.estado, datetime('now'));
+                        {_evaluar_stock_sql('NEW', cerrar=False)}
+                        {_estado_inmediato_sql('NEW')}
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS alertas_materiales_cambio_id
+                    AFTER UPDATE OF id ON materiales WHEN OLD.id IS NOT NEW.id BEGIN
+                        DELETE FROM alertas WHERE id = OLD.id;
+                        DELETE FROM estado_materiales WHERE id = OLD.id;
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS alertas_materiales_estado
+                    AFTER UPDATE OF id, estado ON materiales
+                    WHEN OLD.estado IS NOT NEW.estado OR OLD.id IS NOT NEW.id BEGIN
+                        INSERT OR REPLACE INTO estado_materiales (id, estado, desde)
+                        VALUES (NEW.id, NEW.estado, datetime('now'));
+                        DELETE FROM alertas WHERE id = NEW.id AND regla = '{REGLA_ESTADO}';
+                        {_estado_inmediato_sql('NEW')}
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS alertas_materiales_stock
+                    AFTER UPDATE OF id, tipo, cantidad ON materiales BEGIN
+                        {_evaluar_stock_sql('NEW')}
+                    END;
+
+                    CREATE TRIGGER IF NOT EXISTS alertas_materiales_delete
+                    AFTER DELETE ON materiales BEGIN
+                        DELETE FROM alertas WHERE id = OLD.id;
+                        DELETE FROM estado_materiales WHERE id = OLD.id;
+                    END;
+                ''')
+
+                if not existia:
+                    cursor.executemany('INSERT OR IGNORE INTO reglas_estado (estado, dias) VALUES (?, ?)',
+                                       REGLAS_ESTADO_INICIALES.items())
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO reglas_reorden (ambito, clave, punto) VALUES ('general', '', ?)
+                    ''', (PUNTO_REORDEN_GENERAL,))
+                    # Sin historia de estados: se toma la fecha de alta como inicio del estado actual
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO estado_materiales (id, estado, desde)
+                        SELECT id, estado,
+                               CASE WHEN fecha LIKE '__/__/____'
+                                    THEN substr(fecha, 7, 4) || '-' || substr(fecha, 4, 2) || '-' || substr(fecha, 1, 2) || ' 00:00:00'
+                                    ELSE datetime('now') END
+                        FROM materiales
+                    ''')
+                    self._reevaluar_stock(cursor)
+                # Después del relleno inicial: crear el índice de una vez es más rápido que mantenerlo
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_estado_materiales_desde ON estado_materiales (estado, desde)')
+                conn.commit()
+        except Exception as e:
+            print(f"Error al inicializar las alertas: {e}")
+
+    def _reevaluar_stock(self, cursor, condicion='1', params=()):
+        """Recalcular las alertas de stock de los materiales que cumplen la condición (tras cambiar reglas)"""
+        cursor.execute(f'''
+            DELETE FROM alertas WHERE regla = '{REGLA_STOCK}'
+              AND id IN (SELECT id FROM materiales AS m WHERE {condicion})
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO alertas (id, regla, detalle, valor, limite, desde)
+            SELECT id, '{REGLA_STOCK}', NULL, cantidad, punto, datetime('now')
+            FROM (SELECT m.id, m.cantidad, {_punto_reorden_sql('m')} AS punto
+                  FROM materiales AS m WHERE {condicion})
+            WHERE cantidad <= punto
+        ''', params)
+
+    def set_reorder_point(self, punto, tipo=None, material_id=None):
+        """Fijar (o quitar con punto=None) el punto de reorden de un material, un tipo o general
+
+        Solo se recalculan las alertas de los materiales afectados por la regla.
+        """
+        if material_id is not None:
+            ambito, clave, condicion, params = 'material', material_id, 'm.id = ?', (material_id,)
+        elif tipo is not None:
+            ambito, clave, condicion, params = 'tipo', tipo, 'm.tipo = ?', (tipo,)
+        else:
+            ambito, clave, condicion, params = 'general', '', '1', ()
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            if punto is None:
+                cursor.execute('DELETE FROM reglas_reorden WHERE ambito = ? AND clave = ?', (ambito, clave))
+            else:
+                cursor.execute('INSERT OR REPLACE INTO reglas_reorden (ambito, clave, punto) VALUES (?, ?, ?)',
+                               (ambito, clave, float(punto)))
+            self._reevaluar_stock(cursor, condicion, params)
+            conn.commit()
+
+    def set_state_rule(self, estado, dias):
+        """Avisar de los materiales que llevan 'dias' o más en un estado (None quita la regla)"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            if dias is None:
+                cursor.execute('DELETE FROM reglas_estado WHERE estado = ?', (estado,))
+            else:
+                cursor.execute('INSERT OR REPLACE INTO reglas_estado (estado, dias) VALUES (?, ?)',
+                               (estado, float(dias)))
+            cursor.execute(f'''
+                DELETE FROM alertas WHERE regla = '{REGLA_ESTADO}' AND detalle = ?
+            ''', (estado,))
+            conn.commit()
+        self.evaluate_state_rules()
+
+    def rules(self):
+        """Reglas vigentes: {'reorden': [(ámbito, clave, punto)], 'estado': {estado: días}}"""
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT ambito, clave, punto FROM reglas_reorden ORDER BY ambito, clave')
+            reorden = cursor.fetchall()
+            cursor.execute('SELECT estado, dias FROM reglas_estado ORDER BY estado')
+            return {'reorden': reorden, 'estado': dict(cursor.fetchall())}
+
+    def evaluate_state_rules(self):
+        """Abrir las alertas de los materiales que ya superaron la antigüedad de su estado
+
+        Cada regla es una búsqueda por rango en el índice (estado, desde).
+        Devuelve el número de alertas nuevas.
+        """
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT estado, dias FROM reglas_estado')
+            nuevas = 0
+            for estado, dias in cursor.fetchall():
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO alertas (id, regla, detalle, valor, limite, desde)
+                    SELECT id, '{REGLA_ESTADO}', estado, NULL, ?, desde
+                    FROM estado_materiales
+                    WHERE estado = ? AND desde <= datetime('now', ?)
+                ''', (dias, estado, f'-{dias} days'))
+                nuevas += cursor.rowcount
+            conn.commit()
+            return nuevas
+
+    def active_alerts(self, limit=None):
+        """Alertas abiertas con los datos del material, las más antiguas primero"""
+        self.evaluate_state_rules()
+        consulta = '''
+            SELECT a.id, a.regla, a.detalle, a.valor, a.limite, a.desde, m.material, m.tipo, m.ubicacion, m.estado
+            FROM alertas AS a LEFT JOIN materiales AS m ON m.id = a.id
+            ORDER BY a.desde
+        '''
+        params = ()
+        if limit is not None:
+            consulta += ' LIMIT ?'
+            params = (int(limit),)
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute(consulta, params)
+            columnas = ['ID', 'Regla', 'Detalle', 'Valor', 'Limite', 'Desde', 'Material', 'Tipo', 'Ubicacion', 'Estado']
+            return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+    def counts(self):
+        """Número de alertas abiertas por regla (lee solo reglas y alertas, no el inventario)"""
+        self.evaluate_state_rules()
+        with sqlite3.connect(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT regla, COUNT(*) FROM alertas GROUP BY regla')
+            return dict(cursor.fetchall())
@@ -0,0 +1,169 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+# Valor z para bandas de confianza del 95%
+Z_95 = 1.96
+
+_ALPHAS = (0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+_BETAS = (0.1, 0.3, 0.5)
+
+
+def _suavizado_simple(valores, alpha):
+    """Suavizado exponencial simple: (nivel final, errores de un paso)"""
+    nivel = valores[0]
+    errores = []
+    for valor in valores[1:]:
+        errores.append(valor - nivel)
+        nivel = alpha * valor + (1 - alpha) * nivel
+    return nivel, errores
+
+
+def _holt(valores, alpha, beta):
+    """Suavizado de Holt con tendencia: (nivel, pendiente, errores de un paso)"""
+    nivel = valores[0]
+    pendiente = valores[1] - valores[0]
+    errores = []
+    for valor in valores[1:]:
+        prevision = nivel + pendiente
+        errores.append(valor - prevision)
+        nivel_anterior = nivel
+        nivel = alpha * valor + (1 - alpha) * prevision
+        pendiente = beta * (nivel - nivel_anterior) + (1 - beta) * pendiente
+    return nivel, pendiente, errores
+
+
+def _regresion_lineal(valores):
+    """Recta por mínimos cuadrados: (ordenada, pendiente, residuos)"""
+    n = len(valores)
+    media_x = (n - 1) / 2
+    media_y = sum(valores) / n
+    covarianza = sum((x - media_x) * (y - media_y) for x, y in enumerate(valores))
+    varianza = sum((x - media_x) ** 2 for x in range(n))
+    pendiente = covarianza / varianza if varianza else 0.0
+    ordenada = media_y - pendiente * media_x
+    residuos = [y - (ordenada + pendiente * x) for x, y in enumerate(valores)]
+    return ordenada, pendiente, residuos
+
+
+def _sse(errores):
+    return sum(e * e for e in errores)
+
+
+def _desviacion(errores):
+    if len(errores) < 2:
+        return 0.0
+    return math.sqrt(_sse(errores) / (len(errores) - 1))
+
+
+def ajustar_serie(valores, horizonte=3):
+    """Ajustar el mejor modelo a una serie y pronosticar 'horizonte' periodos
+
+    Compara suavizado simple, Holt y tendencia lineal por error cuadrático
+    y devuelve el modelo elegido con sus bandas de confianza al 95%.
+    """
+    valores = [float(v) for v in valores]
+    n = len(valores)
+    if n == 0:
+        return {'modelo': 'sin datos', 'pronostico': [], 'inferior': [], 'superior': []}
+    if n < 3:
+        media = sum(valores) / n
+        return {
+            'modelo': 'media',
+            'pronostico': [media] * horizonte,
+            'inferior': [media] * horizonte,
+            'superior': [media] * horizonte
+        }
+
+    candidatos = []
+
+    for alpha in _ALPHAS:
+        nivel, errores = _suavizado_simple(valores, alpha)
+        candidatos.append((_sse(errores), f'suavizado simple (α={alpha})',
+                           [nivel] * horizonte, errores))
+
+    for alpha in _ALPHAS:
+        for beta in _BETAS:
+            nivel, pendiente, errores = _holt(valores, alpha, beta)
+            pronostico = [nivel + pendiente * h for h in range(1, horizonte + 1)]
+            candidatos.append((_sse(errores[1:]), f'Holt (α={alpha}, β={beta})',
+                               pronostico, errores[1:]))
+
+    ordenada, pendiente, residuos = _regresion_lineal(valores)
+    pronostico = [ordenada + pendiente * (n - 1 + h) for h in range(1, horizonte + 1)]
+    candidatos.append((_sse(residuos), 'tendencia lineal', pronostico, residuos))
+
+    # Comparar por error medio para no penalizar modelos con menos errores evaluados
+    _, modelo, pronostico, errores = min(candidatos, key=lambda c: c[0] / max(len(c[3]), 1))
+    sigma = _desviacion(errores)
+    bandas = [Z_95 * sigma * math.sqrt(h) for h in range(1, horizonte + 1)]
+    return {
+        'modelo': modelo,
+        'pronostico': pronostico,
+        'inferior': [max(p - b, 0.0) for p, b in zip(pronostico, bandas)],
+        'superior': [p + b for p, b in zip(pronostico, bandas)]
+    }
+
+
+class PronosticoPendiente:
+    """Conjunto de ajustes en curso; se consulta sin bloquear con done()"""
+
+    def __init__(self, motor, resultados, futuros, firmas):
+        self.motor = motor
+        self.resultados = resultados
+        self.futuros = futuros
+        self.firmas = firmas
+
+    def done(self):
+        return all(futuro.done() for futuro in self.futuros.values())
+
+    def result(self):
+        """Resultados {(dimension, nombre): {...}}; bloquea si aún no terminan"""
+        for clave, futuro in self.futuros.items():
+            resultado = futuro.result()
+            self.motor.cache[clave] = (self.firmas[clave], resultado)
+            self.resultados[clave] = resultado
+        self.futuros = {}
+        return self.resultados
+
+
+class ForecastEngine:
+    """Pronósticos por tipo y ubicación ajustados en un pool de procesos"""
+
+    def __init__(self, trend_engine, max_workers=None):
+        self.trend_engine = trend_engine
+        self.max_workers = max_workers
+        self.executor = None
+        self.cache = {}
+
+    def _obtener_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    def submit(self, periodo='mes', metrica='cantidad', horizonte=3, dimensiones=('tipo', 'ubicacion')):
+        """Lanzar en segundo plano el ajuste de las series que cambiaron
+
+        Las series cuyo contenido no cambió desde el último ajuste se
+        devuelven desde la caché sin volver a entrenar.
+        """
+        resultados = {}
+        futuros = {}
+        firmas = {}
+        for dimension in dimensiones:
+            for nombre, puntos in self.trend_engine.series(periodo, dimension, metrica).items():
+                clave = (periodo, metrica, horizonte, dimension, nombre)
+                valores = tuple(valor for _, valor in puntos)
+                firma = (puntos[-1][0] if puntos else None, valores)
+                en_cache = self.cache.get(clave)
+                if en_cache is not None and en_cache[0] == firma:
+                    resultados[clave] = en_cache[1]
+                    continue
+                firmas[clave] = firma
+                futuros[clave] = self._obtener_executor().submit(ajustar_serie, valores, horizonte)
+        return PronosticoPendiente(self, resultados, futuros, firmas)
+
+    def close(self):
+        """Detener el pool de procesos"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
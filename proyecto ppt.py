@@ -1,8 +1,7 @@
-import csv
-import os
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from collections import defaultdict
+
+from almacen_registros import AlmacenRegistros
 
 class GestorMateriales:
     def __init__(self, root):
@@ -13,6 +12,7 @@ class GestorMateriales:
         
         # Archivo CSV para guardar datos
         self.archivo = 'registros.csv'
+        self.almacen = AlmacenRegistros(self.archivo)
         
         # Inicializar archivo
         self.inicializar_archivo()
@@ -26,41 +26,31 @@ class GestorMateriales:
     def inicializar_archivo(self):
         """Crear archivo si no existe"""
         try:
-            if not os.path.exists(self.archivo):
-                with open(self.archivo, 'w', newline='', encoding='utf-8') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['Material', 'Tipo', 'Cantidad', 'Valor'])
+            self.almacen.inicializar()
         except Exception as e:
             messagebox.showerror("Error", f"Error al inicializar el archivo: {e}")
     
     def leer_registros(self):
         """Leer todos los registros del archivo CSV"""
         try:
-            registros = []
-            if os.path.exists(self.archivo):
-                with open(self.archivo, 'r', newline='', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    for row in reader:
-                        registros.append({
-                            'Material': row['Material'],
-                            'Tipo': row['Tipo'],
-                            'Cantidad': float(row['Cantidad']),
-                            'Valor': float(row['Valor'])
-                        })
-            return registros
+            return self.almacen.leer()
         except Exception as e:
             messagebox.showerror("Error", f"Error al leer el archivo: {e}")
             return []
     
     def escribir_registros(self, registros):
-        """Escribir todos los registros al archivo CSV"""
+        """Escribir todos los registros al archivo CSV (reemplazo atómico)"""
+        try:
+            self.almacen.reescribir(registros)
+            return True
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al escribir el archivo: {e}")
+            return False
+    
+    def agregar_registro(self, registro):
+        """Añadir un registro al final del archivo CSV sin reescribirlo"""
         try:
-            with open(self.archivo, 'w', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow(['Material', 'Tipo', 'Cantidad', 'Valor'])
-                for registro in registros:
-                    writer.writerow([registro['Material'], registro['Tipo'], 
-                                   registro['Cantidad'], registro['Valor']])
+            self.almacen.agregar(registro)
             return True
         except Exception as e:
             messagebox.showerror("Error", f"Error al escribir el archivo: {e}")
@@ -177,21 +167,16 @@ class GestorMateriales:
                 ('Restos de Comida', 'Organico', 3, 0)
             ]
             
-            for nombre, tipo, cantidad, valor in datos_ejemplo:
-                self.registrar_material_silencioso(nombre, tipo, cantidad, valor)
+            self.registrar_materiales_lote(datos_ejemplo)
         
         # Actualizar la lista
         self.actualizar_lista()
     
     def registrar_material_silencioso(self, nombre, tipo, cantidad, valor):
         """Registrar material sin mostrar mensajes"""
-        registros = self.leer_registros()
-        
         # Evitar duplicados
-        for registro in registros:
-            if (registro['Material'].lower() == nombre.lower() and 
-                registro['Tipo'].lower() == tipo.lower()):
-                return False
+        if self.almacen.existe(nombre, tipo):
+            return False
         
         nuevo_registro = {
             'Material': nombre,
@@ -199,9 +184,26 @@ class GestorMateriales:
             'Cantidad': cantidad,
             'Valor': valor
         }
-        registros.append(nuevo_registro)
         
-        return self.escribir_registros(registros)
+        return self.agregar_registro(nuevo_registro)
+    
+    def registrar_materiales_lote(self, materiales):
+        """Registrar varios materiales (nombre, tipo, cantidad, valor) sin mostrar mensajes
+        
+        Devuelve el número de materiales registrados; los duplicados se omiten.
+        """
+        nuevos = [{
+            'Material': nombre,
+            'Tipo': tipo,
+            'Cantidad': cantidad,
+            'Valor': valor
+        } for nombre, tipo, cantidad, valor in materiales]
+        try:
+            agregados, _ = self.almacen.agregar_nuevos(nuevos)
+            return len(agregados)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al escribir el archivo: {e}")
+            return 0
     
     def registrar_material(self):
         """Registrar un nuevo material"""
@@ -225,15 +227,10 @@ class GestorMateriales:
             messagebox.showerror("Error", "Cantidad y Valor deben ser números válidos")
             return
         
-        # Leer registros existentes
-        registros = self.leer_registros()
-        
         # Evitar duplicados
-        for registro in registros:
-            if (registro['Material'].lower() == nombre.lower() and 
-                registro['Tipo'].lower() == tipo.lower()):
-                messagebox.showwarning("Advertencia", f'El material "{nombre}" de tipo "{tipo}" ya está registrado')
-                return
+        if self.almacen.existe(nombre, tipo):
+            messagebox.showwarning("Advertencia", f'El material "{nombre}" de tipo "{tipo}" ya está registrado')
+            return
         
         # Agregar nuevo registro
         nuevo_registro = {
@@ -242,9 +239,8 @@ class GestorMateriales:
             'Cantidad': cantidad,
             'Valor': valor
         }
-        registros.append(nuevo_registro)
         
-        if self.escribir_registros(registros):
+        if self.agregar_registro(nuevo_registro):
             messagebox.showinfo("Éxito", f'Material "{nombre}" registrado correctamente')
             self.limpiar_campos()
             self.actualizar_lista()
@@ -282,21 +278,18 @@ class GestorMateriales:
     
     def mostrar_estadisticas(self):
         """Mostrar estadísticas en el área de texto"""
-        registros = self.leer_registros()
+        # Totales por tipo mantenidos por el almacén (sin recorrer los registros)
+        try:
+            estadisticas = self.almacen.totales_por_tipo()
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al leer el archivo: {e}")
+            return
         
-        if not registros:
+        if not estadisticas:
             self.text_stats.delete(1.0, tk.END)
             self.text_stats.insert(tk.END, "No hay datos para mostrar estadísticas.")
             return
         
-        # Agrupar por tipo
-        estadisticas = defaultdict(lambda: {'Cantidad': 0, 'Valor': 0})
-        
-        for registro in registros:
-            tipo = registro['Tipo']
-            estadisticas[tipo]['Cantidad'] += registro['Cantidad']
-            estadisticas[tipo]['Valor'] += registro['Valor']
-        
         # Mostrar estadísticas
         self.text_stats.delete(1.0, tk.END)
         self.text_stats.insert(tk.END, "--- Resumen Estadístico ---\n")
@@ -0,0 +1,80 @@
+import time
+
+INICIO = time.perf_counter()
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+INTERFAZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AMPLIAADO 2,1.py')
+
+
+def medir_arranque():
+    """Abrir la interfaz una vez y devolver los tiempos de arranque en ms desde el inicio del proceso
+
+    'ventana' es el fin del constructor, 'pintado' el primer dibujado
+    completo (el primer callback ocioso tras mostrar la ventana) y 'datos'
+    el momento en que las tablas y estadísticas quedan cargadas.
+    """
+    spec = importlib.util.spec_from_file_location('interfaz', INTERFAZ)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    importado = time.perf_counter()
+
+    root = modulo.tk.Tk()
+    app = modulo.GestorMaterialesConGraficos(root)
+    marcas = {'importacion': importado, 'ventana': time.perf_counter()}
+
+    def pintado():
+        root.update_idletasks()
+        marcas['pintado'] = time.perf_counter()
+
+    def datos():
+        if not app.datos_cargados:
+            root.after(5, datos)
+            return
+        root.update_idletasks()
+        marcas['datos'] = time.perf_counter()
+        root.destroy()
+
+    root.after_idle(pintado)
+    root.after(5, datos)
+    root.mainloop()
+    app.pronosticos.close()
+    return {clave: (valor - INICIO) * 1000 for clave, valor in marcas.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer pintado de la interfaz y hasta tener los datos")
+    parser.add_argument('--dir', default='.', help="Directorio de trabajo (con materiales.db y los CSV)")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Arranques medidos, cada uno en un proceso nuevo")
+    parser.add_argument('--una', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.chdir(args.dir)
+    if args.una:
+        print(json.dumps(medir_arranque()))
+        return 0
+
+    resultados = []
+    for _ in range(args.repeticiones):
+        proceso = subprocess.run([sys.executable, os.path.abspath(__file__), '--una'],
+                                 capture_output=True, text=True)
+        if proceso.returncode != 0:
+            print(proceso.stderr, file=sys.stderr)
+            return 1
+        resultados.append(json.loads(proceso.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.repeticiones} arranques en {os.path.abspath(args.dir)} (mediana, ms desde el inicio del proceso)")
+    for clave, descripcion in (('importacion', "módulos importados"), ('ventana', "interfaz construida"),
+                               ('pintado', "primer pintado"), ('datos', "datos cargados")):
+        print(f"  {descripcion}: {statistics.median(r[clave] for r in resultados):.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
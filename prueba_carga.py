@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+# Mezcla de peticiones: (peso, método, ruta)
+MEZCLA = (
+    (40, 'GET', '/materiales?limite=50'),
+    (20, 'GET', '/buscar?texto=a&tipo=Todos'),
+    (15, 'GET', '/estadisticas'),
+    (15, 'GET', '/materiales/{id}'),
+    (10, 'POST', '/materiales')
+)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def leer_respuesta(reader):
+    """Leer una respuesta HTTP/1.1 con Content-Length o por fragmentos"""
+    estado = int((await reader.readline()).split()[1])
+    cabeceras = {}
+    while True:
+        linea = await reader.readline()
+        if linea in (b'\r\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip()
+    if cabeceras.get('transfer-encoding') == 'chunked':
+        cuerpo = b''
+        while True:
+            tamano = int((await reader.readline()).strip(), 16)
+            cuerpo += await reader.readexactly(tamano + 2)
+            if tamano == 0:
+                break
+    else:
+        cuerpo = await reader.readexactly(int(cabeceras.get('content-length', 0)))
+    return estado, cuerpo
+
+
+async def cliente(host, port, peticiones, ids, latencias, errores):
+    """Un cliente con una conexión keep-alive que envía peticiones seguidas"""
+    reader, writer = await asyncio.open_connection(host, port)
+    pesos = [m[0] for m in MEZCLA]
+    try:
+        for _ in range(peticiones):
+            _, metodo, ruta = random.choices(MEZCLA, weights=pesos)[0]
+            cuerpo = b''
+            if '{id}' in ruta:
+                ruta = ruta.format(id=random.choice(ids) if ids else 'ninguno')
+            if metodo == 'POST':
+                cuerpo = json.dumps({'Material': f'Carga {random.randint(0, 10**9)}', 'Tipo': 'Solido',
+                                     'Cantidad': random.randint(1, 100), 'Valor': random.randint(1, 100),
+                                     'Ubicacion': 'Almacén Carga'}).encode('utf-8')
+            peticion = (f"{metodo} {ruta} HTTP/1.1\r\nHost: {host}\r\n"
+                        f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n").encode('latin-1')
+            inicio = time.perf_counter()
+            writer.write(peticion + cuerpo)
+            await writer.drain()
+            estado, _ = await leer_respuesta(reader)
+            latencias.append(time.perf_counter() - inicio)
+            if estado >= 500:
+                errores.append(estado)
+    finally:
+        writer.close()
+
+
+async def ejecutar(host, port, clientes, peticiones):
+    # IDs existentes para las consultas por clave
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /materiales?limite=200 HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    _, cuerpo = await leer_respuesta(reader)
+    writer.close()
+    ids = [m['ID'] for m in json.loads(cuerpo)['materiales']]
+
+    latencias = []
+    errores = []
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(host, port, peticiones, ids, latencias, errores) for _ in range(clientes)))
+    total = time.perf_counter() - inicio
+
+    print(f"{len(latencias)} peticiones de {clientes} clientes en {total:.2f} s "
+          f"({len(latencias) / total:.0f} peticiones/s), {len(errores)} errores")
+    for p in (50, 95, 99):
+        print(f"  p{p}: {percentil(latencias, p) * 1000:.1f} ms")
+    print(f"  máx: {max(latencias, default=0) * 1000:.1f} ms")
+    return 1 if errores else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio HTTP en localhost")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--clientes', type=int, default=200, help="Clientes concurrentes")
+    parser.add_argument('--peticiones', type=int, default=50, help="Peticiones por cliente")
+    args = parser.parse_args(argv)
+    return asyncio.run(ejecutar(args.host, args.port, args.clientes, args.peticiones))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
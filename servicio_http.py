@@ -0,0 +1,465 @@
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from base_datos import DatabaseManager
+from libro_movimientos import TIPOS_MOVIMIENTO, normalizar_momento
+
+TAMANO_PAGINA = 50
+LIMITE_PAGINA = 1000
+LIMITE_CUERPO = 1024 * 1024
+LOTE_EXPORTACION = 1000
+# Combinaciones de filtros cuyas estadísticas se guardan (las menos usadas se descartan)
+LIMITE_CACHE_ESTADISTICAS = 256
+
+MENSAJES_ESTADO = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'
+}
+
+CAMPOS_FILTRO = ('texto', 'tipo', 'estado', 'ubicacion')
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def generar_id():
+    """ID con el mismo formato que los generados en la interfaz"""
+    return f"MAT-{datetime.now().strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(3)}"
+
+
+def material_desde_json(datos, material_id=None):
+    """Validar el cuerpo JSON de un material y completar los valores por defecto"""
+    if not isinstance(datos, dict):
+        raise ErrorHTTP(400, "Se esperaba un objeto JSON")
+    faltantes = [c for c in ('Material', 'Tipo', 'Cantidad', 'Valor') if c not in datos]
+    if faltantes:
+        raise ErrorHTTP(400, f"Faltan campos: {', '.join(faltantes)}")
+    try:
+        return {
+            'ID': material_id or datos.get('ID') or generar_id(),
+            'Material': str(datos['Material']),
+            'Tipo': str(datos['Tipo']),
+            'Cantidad': float(datos['Cantidad']),
+            'Valor': float(datos['Valor']),
+            'Ubicacion': datos.get('Ubicacion') or 'No especificada',
+            'Estado': datos.get('Estado') or 'Disponible',
+            'Fecha': datos.get('Fecha') or datetime.now().strftime('%d/%m/%Y')
+        }
+    except (TypeError, ValueError) as e:
+        raise ErrorHTTP(400, f"Valor no válido: {e}")
+
+
+class ServicioInventario:
+    """Servicio HTTP/JSON sin interfaz gráfica sobre DatabaseManager
+
+    El servidor es asyncio puro (biblioteca estándar) con conexiones
+    keep-alive; las consultas a SQLite se ejecutan en un pool de hilos que
+    usa el pool de conexiones de lectura de DatabaseManager.
+
+    Rutas:
+        GET    /materiales?texto=&tipo=&estado=&ubicacion=&limite=&despues=
+        GET    /materiales/<id>
+        POST   /materiales
+        PUT    /materiales/<id>            ("Version" en el cuerpo: compare-and-set, 409 si cambió)
+        DELETE /materiales/<id>?version=
+        POST   /materiales/<id>/ajuste     ({"delta": n, "minimo": m}, atómico)
+        POST   /materiales/<id>/movimientos ({"tipo": "entrada|salida|ajuste", "cantidad": n, "referencia": "", "momento": ""})
+        GET    /materiales/<id>/movimientos?desde=&hasta=&limite=
+        GET    /materiales/<id>/stock?fecha=   (stock en una fecha o momento)
+        GET    /buscar?texto=&tipo=&estado=&limite=
+        GET    /estadisticas?texto=&tipo=&estado=&ubicacion=
+        GET    /exportar          (array JSON enviado por fragmentos)
+    """
+
+    def __init__(self, db_name='materiales.db', workers=16):
+        self.db_manager = DatabaseManager(db_name, pool_size=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Estadísticas por filtro, válidas mientras no cambie la versión de los datos (LRU)
+        self.cache_estadisticas = OrderedDict()
+        self.bloqueo_cache = threading.Lock()
+        self.rutas = {
+            ('GET', 'materiales'): self.listar,
+            ('POST', 'materiales'): self.crear,
+            ('GET', 'material'): self.obtener,
+            ('PUT', 'material'): self.actualizar,
+            ('DELETE', 'material'): self.eliminar,
+            ('POST', 'ajuste'): self.ajustar,
+            ('POST', 'movimientos'): self.registrar_movimiento,
+            ('GET', 'movimientos'): self.movimientos,
+            ('GET', 'stock'): self.stock,
+            ('GET', 'buscar'): self.buscar,
+            ('GET', 'estadisticas'): self.estadisticas,
+            ('GET', 'exportar'): self.exportar
+        }
+
+    async def en_hilo(self, funcion, *args):
+        """Ejecutar una llamada bloqueante a la base de datos en el pool de hilos"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, funcion, *args)
+
+    # ------------------------------------------------------------------
+    # Protocolo HTTP/1.1 mínimo
+    # ------------------------------------------------------------------
+
+    async def atender(self, reader, writer):
+        """Atender las peticiones de una conexión hasta que el cliente la cierre"""
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, destino, version = linea.decode('latin-1').split()
+                except ValueError:
+                    await self.responder(writer, 400, {'error': "Línea de petición no válida"}, False)
+                    break
+
+                cabeceras = {}
+                while True:
+                    cabecera = await reader.readline()
+                    if cabecera in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = cabecera.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+
+                mantener = (cabeceras.get('connection', '').lower() != 'close'
+                            and version == 'HTTP/1.1')
+                try:
+                    longitud = int(cabeceras.get('content-length') or 0)
+                except ValueError:
+                    longitud = -1
+                if longitud < 0:
+                    await self.responder(writer, 400, {'error': "Content-Length no válido"}, False)
+                    break
+                if longitud > LIMITE_CUERPO:
+                    await self.responder(writer, 413, {'error': "Cuerpo demasiado grande"}, False)
+                    break
+                cuerpo = await reader.readexactly(longitud) if longitud else b''
+
+                await self.despachar(writer, metodo, destino, cuerpo, mantener)
+                if not mantener:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def despachar(self, writer, metodo, destino, cuerpo, mantener):
+        partes = urlsplit(destino)
+        segmentos = [unquote(s) for s in partes.path.strip('/').split('/') if s]
+        parametros = {clave: valores[-1] for clave, valores in parse_qs(partes.query).items()}
+
+        if len(segmentos) == 2 and segmentos[0] == 'materiales':
+            clave, argumentos = 'material', (segmentos[1],)
+        elif len(segmentos) == 3 and segmentos[0] == 'materiales' and segmentos[2] in ('ajuste', 'movimientos', 'stock'):
+            clave, argumentos = segmentos[2], (segmentos[1],)
+        elif len(segmentos) == 1:
+            clave, argumentos = segmentos[0], ()
+        else:
+            clave, argumentos = None, ()
+
+        manejador = self.rutas.get((metodo, clave))
+        try:
+            if manejador is None:
+                existe = any(ruta == clave for _, ruta in self.rutas)
+                raise ErrorHTTP(405 if existe else 404, f"{metodo} {partes.path} no disponible")
+            datos = None
+            if cuerpo:
+                try:
+                    datos = json.loads(cuerpo)
+                except ValueError:
+                    raise ErrorHTTP(400, "JSON no válido")
+            resultado = await manejador(parametros, datos, *argumentos)
+        except ErrorHTTP as e:
+            await self.responder(writer, e.estado, {'error': str(e)}, mantener)
+            return
+        except sqlite3.Error as e:
+            await self.responder(writer, 500, {'error': f"Error de base de datos: {e}"}, mantener)
+            return
+        except Exception as e:
+            print(f"Error al atender {metodo} {partes.path}: {e}")
+            await self.responder(writer, 500, {'error': "Error interno del servidor"}, mantener)
+            return
+
+        if not callable(resultado):
+            estado, contenido = resultado
+            await self.responder(writer, estado, contenido, mantener)
+            return
+        # Respuesta por fragmentos: con la cabecera ya enviada, un error solo puede cortar la conexión
+        try:
+            await resultado(writer, mantener)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            print(f"Error al enviar {partes.path}: {e}")
+            raise ConnectionAbortedError(str(e)) from e
+
+    def cabecera(self, estado, extra, mantener):
+        lineas = [f"HTTP/1.1 {estado} {MENSAJES_ESTADO.get(estado, '')}",
+                  'Content-Type: application/json; charset=utf-8',
+                  f"Connection: {'keep-alive' if mantener else 'close'}"] + extra
+        return ('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1')
+
+    async def responder(self, writer, estado, contenido, mantener):
+        cuerpo = b'' if contenido is None else json.dumps(contenido, ensure_ascii=False).encode('utf-8')
+        writer.write(self.cabecera(estado, [f'Content-Length: {len(cuerpo)}'], mantener) + cuerpo)
+        await writer.drain()
+
+    # ------------------------------------------------------------------
+    # Manejadores
+    # ------------------------------------------------------------------
+
+    def filtros(self, parametros):
+        return {campo: parametros[campo] for campo in CAMPOS_FILTRO if parametros.get(campo)}
+
+    def limite(self, parametros):
+        try:
+            limite = min(int(parametros.get('limite', TAMANO_PAGINA)), LIMITE_PAGINA)
+        except ValueError:
+            raise ErrorHTTP(400, "'limite' debe ser un número")
+        if limite <= 0:
+            raise ErrorHTTP(400, "'limite' debe ser positivo")
+        return limite
+
+    async def listar(self, parametros, datos):
+        limite = self.limite(parametros)
+        materiales, siguiente = await self.en_hilo(
+            self.db_manager.get_materials_page, self.filtros(parametros), limite, parametros.get('despues'))
+        return 200, {'materiales': materiales, 'siguiente': siguiente}
+
+    async def obtener(self, parametros, datos, material_id):
+        material = await self.en_hilo(self.db_manager.get_material, material_id)
+        if material is None:
+            raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+        return 200, material
+
+    async def crear(self, parametros, datos):
+        material = material_desde_json(datos)
+        if not await self.en_hilo(self.db_manager.insert_material, material):
+            raise ErrorHTTP(409, f"No se pudo registrar el material {material['ID']}")
+        return 201, material
+
+    def version_esperada(self, valor):
+        if valor is None:
+            return None
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            raise ErrorHTTP(400, "'Version' debe ser un número entero")
+
+    def conflicto(self, material_id, version_actual):
+        if version_actual is None:
+            return ErrorHTTP(404, f"Material {material_id} no encontrado")
+        return ErrorHTTP(409, f"El material {material_id} cambió (versión actual {version_actual})")
+
+    async def actualizar(self, parametros, datos, material_id):
+        material = material_desde_json(datos, material_id)
+        version = self.version_esperada(datos.get('Version'))
+        if version is None:
+            if not await self.en_hilo(self.db_manager.update_material, material_id, material):
+                raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+            return 200, material
+        # Con 'Version' en el cuerpo, la actualización es compare-and-set
+        ok, version_actual = await self.en_hilo(
+            self.db_manager.update_material_if_version, material_id, material, version)
+        if not ok:
+            raise self.conflicto(material_id, version_actual)
+        return 200, dict(material, Version=version_actual)
+
+    async def eliminar(self, parametros, datos, material_id):
+        version = self.version_esperada(parametros.get('version'))
+        if version is None:
+            if not await self.en_hilo(self.db_manager.delete_material, material_id):
+                raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+            return 204, None
+        ok, version_actual = await self.en_hilo(self.db_manager.delete_material_if_version, material_id, version)
+        if not ok:
+            raise self.conflicto(material_id, version_actual)
+        return 204, None
+
+    async def ajustar(self, parametros, datos, material_id):
+        """Movimiento de stock atómico: {"delta": n, "minimo": opcional}"""
+        if not isinstance(datos, dict) or 'delta' not in datos:
+            raise ErrorHTTP(400, "Se esperaba {\"delta\": número}")
+        try:
+            delta = float(datos['delta'])
+            minimo = None if datos.get('minimo') is None else float(datos['minimo'])
+        except (TypeError, ValueError):
+            raise ErrorHTTP(400, "'delta' y 'minimo' deben ser números")
+        resultado = await self.en_hilo(self.db_manager.adjust_quantity, material_id, delta, minimo)
+        if resultado is None:
+            if await self.en_hilo(self.db_manager.get_material, material_id) is None:
+                raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+            raise ErrorHTTP(409, f"La cantidad de {material_id} quedaría por debajo de {minimo}")
+        return 200, {'ID': material_id, 'Cantidad': resultado[0], 'Version': resultado[1]}
+
+    async def registrar_movimiento(self, parametros, datos, material_id):
+        """Entrada, salida o ajuste registrado en el libro de movimientos"""
+        if not isinstance(datos, dict) or datos.get('tipo') not in TIPOS_MOVIMIENTO:
+            raise ErrorHTTP(400, f"'tipo' debe ser uno de {', '.join(TIPOS_MOVIMIENTO)}")
+        try:
+            cantidad = float(datos['cantidad'])
+            momento = None if datos.get('momento') is None else normalizar_momento(datos['momento'])
+        except (KeyError, TypeError, ValueError):
+            raise ErrorHTTP(400, "'cantidad' debe ser un número y 'momento' una fecha válida")
+        if datos['tipo'] != 'ajuste' and cantidad <= 0:
+            raise ErrorHTTP(400, "La cantidad de una entrada o salida debe ser positiva")
+        resultado = await self.en_hilo(self.db_manager.record_movement, material_id, datos['tipo'],
+                                       cantidad, datos.get('referencia', ''), momento)
+        if resultado is None:
+            if await self.en_hilo(self.db_manager.get_material, material_id) is None:
+                raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+            raise ErrorHTTP(409, f"Stock insuficiente de {material_id}")
+        return 201, {'ID': material_id, 'Cantidad': resultado[0], 'Version': resultado[1]}
+
+    async def movimientos(self, parametros, datos, material_id):
+        try:
+            desde = parametros.get('desde') and normalizar_momento(parametros['desde'])
+            hasta = parametros.get('hasta') and normalizar_momento(parametros['hasta'], fin_del_dia=True)
+        except ValueError as e:
+            raise ErrorHTTP(400, str(e))
+        return 200, await self.en_hilo(self.db_manager.get_movements, material_id,
+                                       desde or None, hasta or None, self.limite(parametros))
+
+    async def stock(self, parametros, datos, material_id):
+        try:
+            momento = normalizar_momento(parametros.get('fecha'), fin_del_dia=True)
+        except ValueError as e:
+            raise ErrorHTTP(400, str(e))
+        cantidad = await self.en_hilo(self.db_manager.stock_at, material_id, momento)
+        if cantidad is None:
+            raise ErrorHTTP(404, f"Material {material_id} no encontrado")
+        return 200, {'ID': material_id, 'Momento': momento, 'Cantidad': cantidad}
+
+    async def buscar(self, parametros, datos):
+        materiales = await self.en_hilo(
+            self.db_manager.search_materials, parametros.get('texto', ''),
+            parametros.get('tipo', 'Todos'), parametros.get('estado', 'Todos'), self.limite(parametros))
+        return 200, materiales
+
+    def calcular_estadisticas(self, filtros):
+        clave = tuple(sorted(filtros.items()))
+        version = self.db_manager.get_data_version()
+        with self.bloqueo_cache:
+            en_cache = self.cache_estadisticas.get(clave)
+            if en_cache is not None and en_cache[0] == version:
+                self.cache_estadisticas.move_to_end(clave)
+                return en_cache[1]
+        estadisticas = self.db_manager.get_statistics(filtros)
+        if estadisticas is not None:
+            with self.bloqueo_cache:
+                self.cache_estadisticas[clave] = (version, estadisticas)
+                self.cache_estadisticas.move_to_end(clave)
+                while len(self.cache_estadisticas) > LIMITE_CACHE_ESTADISTICAS:
+                    self.cache_estadisticas.popitem(last=False)
+        return estadisticas
+
+    async def estadisticas(self, parametros, datos):
+        estadisticas = await self.en_hilo(self.calcular_estadisticas, self.filtros(parametros))
+        if estadisticas is None:
+            raise ErrorHTTP(500, "Error al calcular estadísticas")
+        return 200, estadisticas
+
+    async def exportar(self, parametros, datos):
+        """Exportar todos los materiales como un array JSON enviado por fragmentos"""
+        async def enviar(writer, mantener):
+            cola = asyncio.Queue(maxsize=4)
+            loop = asyncio.get_running_loop()
+            cancelada = threading.Event()
+
+            def poner(lote):
+                asyncio.run_coroutine_threadsafe(cola.put(lote), loop).result()
+
+            def producir():
+                try:
+                    # Una sola vista consistente aunque lleguen escrituras durante la exportación
+                    with self.db_manager.read_snapshot() as conn:
+                        cursor = conn.cursor()
+                        cursor.execute('SELECT * FROM materiales')
+                        while not cancelada.is_set():
+                            filas = cursor.fetchmany(LOTE_EXPORTACION)
+                            if not filas:
+                                break
+                            poner(self.db_manager.rows_to_materials(filas))
+                finally:
+                    # Fin de los datos o error: el consumidor deja de esperar y
+                    # el error, si lo hubo, sale al esperar la tarea
+                    poner([])
+
+            tarea = loop.run_in_executor(self.executor, producir)
+            writer.write(self.cabecera(200, ['Transfer-Encoding: chunked'], mantener))
+            primero = True
+            try:
+                while True:
+                    lote = await cola.get()
+                    if not lote:
+                        break
+                    texto = ',\n'.join(json.dumps(m, ensure_ascii=False) for m in lote)
+                    fragmento = (('[\n' if primero else ',\n') + texto).encode('utf-8')
+                    primero = False
+                    writer.write(b'%x\r\n%s\r\n' % (len(fragmento), fragmento))
+                    await writer.drain()
+            except BaseException:
+                # El cliente se desconectó: liberar al productor y esperar a que termine
+                cancelada.set()
+                while not tarea.done():
+                    try:
+                        cola.get_nowait()
+                    except asyncio.QueueEmpty:
+                        await asyncio.sleep(0.01)
+                raise
+            # Si la lectura falló, no cerrar el array: el cliente debe ver la respuesta truncada
+            await tarea
+            cierre = b'[]\n' if primero else b'\n]\n'
+            writer.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(cierre), cierre))
+            await writer.drain()
+        return enviar
+
+    # ------------------------------------------------------------------
+
+    async def servir(self, host='127.0.0.1', port=8080):
+        servidor = await asyncio.start_server(self.atender, host, port, backlog=1024)
+        direcciones = ', '.join(str(s.getsockname()) for s in servidor.sockets)
+        print(f"Servicio de inventario en {direcciones} (base de datos: {self.db_manager.db_name})")
+        async with servidor:
+            await servidor.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.db_manager.pool is not None:
+            self.db_manager.pool.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON del inventario de materiales")
+    parser.add_argument('--db', default='materiales.db', help="Base de datos")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help="Hilos y conexiones de lectura para las consultas")
+    args = parser.parse_args(argv)
+
+    servicio = ServicioInventario(args.db, args.workers)
+    try:
+        asyncio.run(servicio.servir(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servicio.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
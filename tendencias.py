@@ -0,0 +1,231 @@
+import sqlite3
+from contextlib import closing
+from datetime import date, timedelta
+
+# Fecha de la tabla materiales convertida a 'YYYY-MM-DD' (acepta dd/mm/YYYY e ISO)
+_DIA_SQL = """
+    date(CASE WHEN {col} LIKE '__/__/____'
+              THEN substr({col}, 7, 4) || '-' || substr({col}, 4, 2) || '-' || substr({col}, 1, 2)
+              ELSE {col} END)
+"""
+
+# Expresiones para agrupar los rollups diarios por periodo
+PERIODOS = {
+    'dia': 'dia',
+    'semana': "date(dia, 'weekday 0', '-6 days')",
+    'mes': 'substr(dia, 1, 7)'
+}
+
+DIMENSIONES = ('tipo', 'ubicacion')
+
+METRICAS = ('materiales', 'cantidad', 'valor')
+
+
+def _sumar_rollup(fila):
+    """SQL que suma una fila (NEW u OLD) al rollup diario"""
+    return f"""
+        INSERT INTO rollup_diario (dia, tipo, ubicacion, materiales, cantidad, valor)
+        SELECT d.dia, {fila}.tipo, COALESCE({fila}.ubicacion, ''), 1, {fila}.cantidad, {fila}.valor
+        FROM (SELECT {_DIA_SQL.format(col=fila + '.fecha')} AS dia) AS d
+        WHERE d.dia IS NOT NULL
+        ON CONFLICT(dia, tipo, ubicacion) DO UPDATE SET
+            materiales = materiales + 1,
+            cantidad = cantidad + excluded.cantidad,
+            valor = valor + excluded.valor;
+    """
+
+
+def _restar_rollup(fila):
+    """SQL que descuenta una fila (OLD) del rollup diario"""
+    clave = f"""
+        dia = {_DIA_SQL.format(col=fila + '.fecha')}
+        AND tipo = {fila}.tipo
+        AND ubicacion = COALESCE({fila}.ubicacion, '')
+    """
+    # Solo puede quedar vacía la celda recién descontada: borrar por clave primaria
+    return f"""
+        UPDATE rollup_diario
+        SET materiales = materiales - 1,
+            cantidad = cantidad - {fila}.cantidad,
+            valor = valor - {fila}.valor
+        WHERE {clave};
+        DELETE FROM rollup_diario WHERE {clave} AND materiales <= 0;
+    """
+
+# Texto de los triggers antiguos, que borraban las celdas vacías recorriendo toda la tabla
+_BORRADO_ANTIGUO = 'DELETE FROM rollup_diario WHERE materiales <= 0;'
+
+
+def _siguiente_periodo(actual, periodo):
+    """Periodo siguiente en formato de texto ('YYYY-MM-DD' o 'YYYY-MM')"""
+    if periodo == 'mes':
+        anio, mes = int(actual[:4]), int(actual[5:7])
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+        return f"{anio:04d}-{mes:02d}"
+    dias = 7 if periodo == 'semana' else 1
+    return (date.fromisoformat(actual) + timedelta(days=dias)).isoformat()
+
+
+def rellenar_huecos(puntos, periodo):
+    """Completar con ceros los periodos sin datos entre el primero y el último"""
+    if not puntos:
+        return []
+    valores = dict(puntos)
+    resultado = []
+    actual, ultimo = puntos[0][0], puntos[-1][0]
+    while actual <= ultimo:
+        resultado.append((actual, valores.get(actual, 0)))
+        actual = _siguiente_periodo(actual, periodo)
+    return resultado
+
+
+def suma_movil(valores, ventana):
+    """Suma de los últimos 'ventana' valores para cada posición"""
+    resultado = []
+    acumulado = 0.0
+    for i, valor in enumerate(valores):
+        acumulado += valor
+        if i >= ventana:
+            acumulado -= valores[i - ventana]
+        resultado.append(acumulado)
+    return resultado
+
+
+def media_movil(valores, ventana):
+    """Media de los últimos 'ventana' valores para cada posición"""
+    sumas = suma_movil(valores, ventana)
+    return [suma / min(i + 1, ventana) for i, suma in enumerate(sumas)]
+
+
+def tasa_crecimiento(valores):
+    """Crecimiento porcentual de cada periodo respecto al anterior (None si no aplica)"""
+    resultado = [None]
+    for anterior, actual in zip(valores, valores[1:]):
+        resultado.append(((actual - anterior) / anterior * 100) if anterior else None)
+    return resultado
+
+
+class TrendEngine:
+    """Motor de tendencias basado en rollups diarios mantenidos por triggers"""
+
+    def __init__(self, db_name='materiales.db'):
+        self.db_name = db_name
+        self.init_schema()
+
+    def close(self):
+        """No mantiene conexiones abiertas: cada operación abre y cierra la suya"""
+
+    def init_schema(self):
+        """Crear la tabla de rollups y los triggers, rellenándola si es nueva"""
+        try:
+            with closing(sqlite3.connect(self.db_name)) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='rollup_diario'")
+                existia = cursor.fetchone() is not None
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS rollup_diario (
+                        dia TEXT NOT NULL,
+                        tipo TEXT NOT NULL,
+                        ubicacion TEXT NOT NULL,
+                        materiales INTEGER NOT NULL,
+                        cantidad REAL NOT NULL,
+                        valor REAL NOT NULL,
+                        PRIMARY KEY (dia, tipo, ubicacion)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.execute('''
+                    SELECT 1 FROM sqlite_master
+                    WHERE type = 'trigger' AND name LIKE 'rollup_materiales_%' AND instr(sql, ?) > 0
+                ''', (_BORRADO_ANTIGUO,))
+                if cursor.fetchone() is not None:
+                    cursor.execute('DROP TRIGGER IF EXISTS rollup_materiales_delete')
+                    cursor.execute('DROP TRIGGER IF EXISTS rollup_materiales_update')
+                cursor.executescript(f'''
+                    CREATE TRIGGER IF NOT EXISTS rollup_materiales_insert
+                    AFTER INSERT ON materiales BEGIN {_sumar_rollup('NEW')} END;
+
+                    CREATE TRIGGER IF NOT EXISTS rollup_materiales_delete
+                    AFTER DELETE ON materiales BEGIN {_restar_rollup('OLD')} END;
+
+                    CREATE TRIGGER IF NOT EXISTS rollup_materiales_update
+                    AFTER UPDATE OF tipo, cantidad, valor, ubicacion, fecha ON materiales
+                    BEGIN {_restar_rollup('OLD')} {_sumar_rollup('NEW')} END;
+                ''')
+                if not existia:
+                    self._reconstruir(cursor)
+                conn.commit()
+        except Exception as e:
+            print(f"Error al inicializar los rollups de tendencias: {e}")
+
+    def _reconstruir(self, cursor):
+        cursor.execute('DELETE FROM rollup_diario')
+        cursor.execute(f'''
+            INSERT INTO rollup_diario (dia, tipo, ubicacion, materiales, cantidad, valor)
+            SELECT dia, tipo, ubicacion, COUNT(*), SUM(cantidad), SUM(valor)
+            FROM (
+                SELECT {_DIA_SQL.format(col='fecha')} AS dia, tipo,
+                       COALESCE(ubicacion, '') AS ubicacion, cantidad, valor
+                FROM materiales
+            )
+            WHERE dia IS NOT NULL
+            GROUP BY dia, tipo, ubicacion
+        ''')
+
+    def rebuild(self):
+        """Recalcular todos los rollups desde la tabla materiales"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                self._reconstruir(conn.cursor())
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Error al reconstruir los rollups: {e}")
+            return False
+
+    def series(self, periodo='mes', dimension=None, metrica='cantidad'):
+        """Series temporales agregadas desde los rollups
+
+        Devuelve {clave: [(periodo, valor), ...]} ordenado por periodo y sin
+        huecos; la clave es 'Total' cuando no se indica dimensión.
+        """
+        if periodo not in PERIODOS or metrica not in METRICAS:
+            raise ValueError(f"Periodo o métrica no válidos: {periodo}, {metrica}")
+        if dimension is not None and dimension not in DIMENSIONES:
+            raise ValueError(f"Dimensión no válida: {dimension}")
+
+        clave = dimension or "'Total'"
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {clave}, {PERIODOS[periodo]} AS periodo, SUM({metrica})
+                    FROM rollup_diario
+                    GROUP BY 1, 2
+                    ORDER BY 1, 2
+                ''')
+                series = {}
+                for nombre, periodo_actual, valor in cursor.fetchall():
+                    series.setdefault(nombre, []).append((periodo_actual, valor or 0))
+                return {nombre: rellenar_huecos(puntos, periodo) for nombre, puntos in series.items()}
+        except Exception as e:
+            print(f"Error al obtener series de tendencias: {e}")
+            return {}
+
+    def resumen(self, periodo='mes', dimension='tipo', metrica='cantidad', ventana=3):
+        """Resumen de tendencia por serie: último periodo, crecimiento y medias"""
+        resultado = {}
+        for nombre, puntos in self.series(periodo, dimension, metrica).items():
+            periodos = [p for p, _ in puntos]
+            valores = [v for _, v in puntos]
+            crecimiento = tasa_crecimiento(valores)
+            resultado[nombre] = {
+                'periodo': periodos[-1],
+                'ultimo': valores[-1],
+                'anterior': valores[-2] if len(valores) > 1 else None,
+                'crecimiento': crecimiento[-1],
+                'media_movil': media_movil(valores, ventana)[-1],
+                'suma_movil': suma_movil(valores, ventana)[-1],
+                'periodos': len(valores)
+            }
+        return resultado